@@ -0,0 +1,41 @@
+"""user_sketches: HyperLogLog registers per project and hour/day
+
+Revision ID: 0b6e3f9c2a58
+Revises: f2c8e4a6b1d7
+Create Date: 2025-12-18 10:02:41.917305
+
+nimbus_worker fills the sketches in the same pass that folds event_rollups. The
+rollup watermark is dropped here, so the worker's next run rebuilds both from all
+events (the API counts raw events until it finishes).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b6e3f9c2a58'
+down_revision: Union[str, Sequence[str], None] = 'f2c8e4a6b1d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'user_sketches',
+        sa.Column('project_id', sa.UUID(), nullable=False),
+        sa.Column('granularity', sa.String(length=8), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(timezone=False), nullable=False),
+        sa.Column('registers', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('project_id', 'granularity', 'bucket_start'),
+        sa.CheckConstraint("granularity IN ('hour', 'day')", name='ck_user_sketches_granularity'),
+    )
+    op.execute("DELETE FROM rollup_watermarks WHERE name = 'events'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_sketches')
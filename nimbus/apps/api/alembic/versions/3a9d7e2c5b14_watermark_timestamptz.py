@@ -0,0 +1,44 @@
+"""rollup_watermarks.processed_until as timestamptz
+
+Revision ID: 3a9d7e2c5b14
+Revises: 9e2f6b1c8d47
+Create Date: 2026-01-08 09:41:27.305118
+
+The watermark used to be LOCALTIMESTAMP, wall-clock time in whatever time zone the
+worker's session had. Stored values were written in the server's zone, which is
+also what the cast below reads them in (the migration session uses the server
+default). nimbus_worker now writes now() and compares created_at as timestamptz.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a9d7e2c5b14'
+down_revision: Union[str, Sequence[str], None] = '9e2f6b1c8d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column(
+        'rollup_watermarks', 'processed_until',
+        type_=sa.DateTime(timezone=True),
+        existing_type=sa.DateTime(timezone=False),
+        existing_nullable=False,
+        postgresql_using='processed_until::timestamptz',
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column(
+        'rollup_watermarks', 'processed_until',
+        type_=sa.DateTime(timezone=False),
+        existing_type=sa.DateTime(timezone=True),
+        existing_nullable=False,
+        postgresql_using='processed_until::timestamp',
+    )
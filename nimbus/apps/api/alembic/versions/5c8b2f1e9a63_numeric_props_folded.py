@@ -0,0 +1,32 @@
+"""projects.numeric_props_folded: numeric props whose prop_sketch_bins cover all events
+
+Revision ID: 5c8b2f1e9a63
+Revises: 3a9d7e2c5b14
+Create Date: 2026-01-12 14:03:51.672940
+
+Bins only used to cover events folded after a key was declared. nimbus_worker now
+rebuilds the bins of a newly declared key from all earlier events before adding
+it here, and the API reads raw events for keys that are not in it yet. Every
+project starts with nothing folded, so the next pass rebuilds the existing bins.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c8b2f1e9a63'
+down_revision: Union[str, Sequence[str], None] = '3a9d7e2c5b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('projects', sa.Column('numeric_props_folded', sa.JSON(), server_default=sa.text("'[]'"), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('projects', 'numeric_props_folded')
@@ -0,0 +1,46 @@
+"""add events.idempotency_key with a per-project unique index
+
+Revision ID: 7c1e9a4b2d10
+Revises: 45a54af5e3fd
+Create Date: 2025-11-20 10:12:03.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e9a4b2d10'
+down_revision: Union[str, Sequence[str], None] = '45a54af5e3fd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable column without default: metadata-only change, no table rewrite
+    op.add_column('events', sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+
+    # Build the index without blocking ingest on large tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ux_events_project_idempotency_key',
+            'events',
+            ['project_id', 'idempotency_key'],
+            unique=True,
+            postgresql_where=sa.text('idempotency_key IS NOT NULL'),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ux_events_project_idempotency_key',
+            table_name='events',
+            postgresql_concurrently=True,
+        )
+    op.drop_column('events', 'idempotency_key')
@@ -0,0 +1,50 @@
+"""user_first_seen and user_activity for /v1/retention
+
+Revision ID: 7d1a4c9e3f20
+Revises: 0b6e3f9c2a58
+Create Date: 2025-12-19 09:14:06.203518
+
+nimbus_worker maintains both in the pass that folds event_rollups. The rollup
+watermark is dropped here, so the worker's next run rebuilds them from all events.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d1a4c9e3f20'
+down_revision: Union[str, Sequence[str], None] = '0b6e3f9c2a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'user_first_seen',
+        sa.Column('project_id', sa.UUID(), nullable=False),
+        sa.Column('user_id', sa.String(length=200), nullable=False),
+        sa.Column('first_ts', sa.DateTime(timezone=False), nullable=False),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('project_id', 'user_id'),
+    )
+    op.create_index('ix_user_first_seen_project_first_ts', 'user_first_seen', ['project_id', 'first_ts'])
+    op.create_table(
+        'user_activity',
+        sa.Column('project_id', sa.UUID(), nullable=False),
+        sa.Column('user_id', sa.String(length=200), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('days', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('project_id', 'user_id', 'month'),
+    )
+    op.execute("DELETE FROM rollup_watermarks WHERE name = 'events'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_activity')
+    op.drop_index('ix_user_first_seen_project_first_ts', table_name='user_first_seen')
+    op.drop_table('user_first_seen')
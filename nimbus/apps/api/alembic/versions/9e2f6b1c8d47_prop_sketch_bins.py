@@ -0,0 +1,44 @@
+"""projects.numeric_props and prop_sketch_bins for props quantile metrics
+
+Revision ID: 9e2f6b1c8d47
+Revises: 7d1a4c9e3f20
+Create Date: 2025-12-20 11:26:52.480913
+
+No project declares numeric props yet, so there is nothing to backfill.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e2f6b1c8d47'
+down_revision: Union[str, Sequence[str], None] = '7d1a4c9e3f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('projects', sa.Column('numeric_props', sa.JSON(), server_default=sa.text("'[]'"), nullable=False))
+    op.create_table(
+        'prop_sketch_bins',
+        sa.Column('project_id', sa.UUID(), nullable=False),
+        sa.Column('prop', sa.String(length=64), nullable=False),
+        sa.Column('granularity', sa.String(length=8), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(timezone=False), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('sign', sa.SmallInteger(), nullable=False),
+        sa.Column('bin', sa.Integer(), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('project_id', 'prop', 'granularity', 'bucket_start', 'name', 'sign', 'bin'),
+        sa.CheckConstraint("granularity IN ('hour', 'day')", name='ck_prop_sketch_bins_granularity'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('prop_sketch_bins')
+    op.drop_column('projects', 'numeric_props')
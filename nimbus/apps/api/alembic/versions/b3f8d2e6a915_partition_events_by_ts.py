@@ -0,0 +1,190 @@
+"""range-partition events on ts (online, chunked copy)
+
+Revision ID: b3f8d2e6a915
+Revises: 7c1e9a4b2d10
+Create Date: 2025-11-27 09:41:55.602871
+
+The partitioned table is built next to the live one. A trigger mirrors every
+insert into it while existing rows are copied over in committed chunks, then both
+tables swap names in one short transaction. Ingest keeps running throughout; it
+only waits for the final lock.
+
+A partition key must be part of every unique index, so the primary key becomes
+(id, ts) and the idempotency index (project_id, idempotency_key, ts). SDK retries
+resend the same event, timestamp included, so they still collide.
+"""
+import datetime as dt
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from nimbus.settings import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f8d2e6a915'
+down_revision: Union[str, Sequence[str], None] = '7c1e9a4b2d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_CHUNK_ROWS = 50_000
+
+_COLUMNS = "id, project_id, name, ts, props, user_id, seq, created_at, updated_at, idempotency_key"
+
+_INDEXES = {
+    'ix_events_project_id': 'project_id',
+    'ix_events_name': 'name',
+    'ix_events_ts': 'ts',
+    'ix_events_user_id': 'user_id',
+}
+
+
+def _columns():
+    return [
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('project_id', sa.UUID(), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('ts', sa.DateTime(timezone=False), nullable=False),
+        sa.Column('props', sa.JSON(), nullable=False),
+        sa.Column('user_id', sa.String(length=200), nullable=True),
+        sa.Column('seq', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('idempotency_key', sa.String(length=64), nullable=True),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+    ]
+
+
+def _period_start(ts: dt.datetime, interval: str) -> dt.datetime:
+    if interval == 'day':
+        return dt.datetime(ts.year, ts.month, ts.day)
+    return dt.datetime(ts.year, ts.month, 1)
+
+
+def _next_period(start: dt.datetime, interval: str) -> dt.datetime:
+    if interval == 'day':
+        return start + dt.timedelta(days=1)
+    return dt.datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def _partition_name(start: dt.datetime, interval: str) -> str:
+    return f"events_p{start:%Y%m%d}" if interval == 'day' else f"events_p{start:%Y%m}"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    interval = settings.events_partition_interval
+    conn = op.get_bind()
+
+    # 1. Empty partitioned twin; index names get their final values at the swap
+    op.create_table(
+        'events_partitioned',
+        *_columns(),
+        sa.PrimaryKeyConstraint('id', 'ts', name='events_partitioned_pkey'),
+        postgresql_partition_by='RANGE (ts)',
+    )
+    for name, column in _INDEXES.items():
+        op.create_index(f'{name}_partitioned', 'events_partitioned', [column])
+    op.create_index(
+        'ux_events_project_idempotency_key_partitioned',
+        'events_partitioned',
+        ['project_id', 'idempotency_key', 'ts'],
+        unique=True,
+        postgresql_where=sa.text('idempotency_key IS NOT NULL'),
+    )
+
+    # 2. Partitions for the existing data through the next few periods, plus a
+    #    default partition so a row outside every range is never refused
+    lo, hi = conn.execute(sa.text("SELECT min(ts), max(ts) FROM events")).one()
+    now = dt.datetime.utcnow()
+    start = _period_start(min(lo or now, now), interval)
+    end = _period_start(max(hi or now, now), interval)
+    for _ in range(settings.events_partition_premake):
+        end = _next_period(end, interval)
+    while start <= end:
+        upper = _next_period(start, interval)
+        op.execute(
+            f"CREATE TABLE {_partition_name(start, interval)} PARTITION OF events_partitioned "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        start = upper
+    op.execute("CREATE TABLE events_default PARTITION OF events_partitioned DEFAULT")
+
+    # 3. Mirror new writes (the copy below may meet them again: DO NOTHING)
+    op.execute(f"""
+        CREATE FUNCTION events_mirror_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO events_partitioned ({_COLUMNS})
+            VALUES (NEW.id, NEW.project_id, NEW.name, NEW.ts, NEW.props, NEW.user_id,
+                    NEW.seq, NEW.created_at, NEW.updated_at, NEW.idempotency_key)
+            ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END $$
+    """)
+    op.execute(
+        "CREATE TRIGGER events_mirror_insert AFTER INSERT ON events "
+        "FOR EACH ROW EXECUTE FUNCTION events_mirror_insert()"
+    )
+
+    # 4. Copy existing rows in (ts, id) order, one committed chunk at a time
+    with op.get_context().autocommit_block():
+        after = (dt.datetime.min, '00000000-0000-0000-0000-000000000000')
+        while True:
+            last = conn.execute(
+                sa.text(f"""
+                    WITH chunk AS (
+                        SELECT {_COLUMNS} FROM events
+                        WHERE (ts, id) > (:ts, CAST(:id AS uuid))
+                        ORDER BY ts, id
+                        LIMIT :n
+                    ), copied AS (
+                        INSERT INTO events_partitioned ({_COLUMNS})
+                        SELECT {_COLUMNS} FROM chunk
+                        ON CONFLICT DO NOTHING
+                    )
+                    SELECT ts, id FROM chunk ORDER BY ts DESC, id DESC LIMIT 1
+                """),
+                {"ts": after[0], "id": str(after[1]), "n": _CHUNK_ROWS},
+            ).first()
+            if last is None:
+                break
+            after = (last.ts, last.id)
+
+    # 5. Swap under a short exclusive lock; the trigger has copied everything since
+    op.execute("LOCK TABLE events IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER events_mirror_insert ON events")
+    op.execute("DROP FUNCTION events_mirror_insert()")
+    op.drop_table('events')
+    op.rename_table('events_partitioned', 'events')
+    op.execute("ALTER TABLE events RENAME CONSTRAINT events_partitioned_pkey TO events_pkey")
+    op.execute("ALTER TABLE events RENAME CONSTRAINT events_partitioned_project_id_fkey TO events_project_id_fkey")
+    for name in [*_INDEXES, 'ux_events_project_idempotency_key']:
+        op.execute(f"ALTER INDEX {name}_partitioned RENAME TO {name}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Offline: copies everything in one statement while holding the table
+    op.execute("LOCK TABLE events IN ACCESS EXCLUSIVE MODE")
+    op.create_table(
+        'events_unpartitioned',
+        *_columns(),
+        sa.PrimaryKeyConstraint('id', name='events_unpartitioned_pkey'),
+    )
+    op.execute(
+        f"INSERT INTO events_unpartitioned ({_COLUMNS}) SELECT {_COLUMNS} FROM events"
+    )
+    op.drop_table('events')  # cascades to its partitions
+    op.rename_table('events_unpartitioned', 'events')
+    op.execute("ALTER TABLE events RENAME CONSTRAINT events_unpartitioned_pkey TO events_pkey")
+    op.execute("ALTER TABLE events RENAME CONSTRAINT events_unpartitioned_project_id_fkey TO events_project_id_fkey")
+    for name, column in _INDEXES.items():
+        op.create_index(name, 'events', [column])
+    op.create_index(
+        'ux_events_project_idempotency_key',
+        'events',
+        ['project_id', 'idempotency_key'],
+        unique=True,
+        postgresql_where=sa.text('idempotency_key IS NOT NULL'),
+    )
@@ -0,0 +1,66 @@
+"""composite (project_id, ..., ts DESC, id DESC) indexes for event listing
+
+Revision ID: d41a7c9e3f02
+Revises: b3f8d2e6a915
+Create Date: 2025-12-02 14:18:37.290417
+
+CREATE INDEX CONCURRENTLY does not work on a partitioned table, so each index is
+created ON ONLY the parent (invalid, nothing built), then concurrently on every
+partition and attached; the parent index becomes valid once all partitions have
+theirs. Partitions created meanwhile inherit it automatically.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41a7c9e3f02'
+down_revision: Union[str, Sequence[str], None] = 'b3f8d2e6a915'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# name -> (per-partition suffix, column list)
+_INDEXES = {
+    'ix_events_project_ts_id': ('project_ts_id_idx', 'project_id, ts DESC, id DESC'),
+    'ix_events_project_user_ts': ('project_user_ts_idx', 'project_id, user_id, ts DESC, id DESC'),
+    'ix_events_project_name_ts': ('project_name_ts_idx', 'project_id, name, ts DESC, id DESC'),
+}
+
+
+def _partitions(conn) -> list:
+    return list(conn.execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'events'::regclass ORDER BY 1"
+    )).scalars())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    for name, (_, columns) in _INDEXES.items():
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY events ({columns})")
+    partitions = _partitions(conn)
+
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            for name, (suffix, columns) in _INDEXES.items():
+                child = f"{partition}_{suffix}"
+                op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} ({columns})")
+                attached = conn.execute(sa.text(
+                    "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:child) "
+                    "AND inhparent = to_regclass(:parent)"
+                ), {"child": child, "parent": name}).first()
+                if attached is None:
+                    op.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+        # (project_id) alone is a prefix of ix_events_project_ts_id; one less index to maintain on ingest
+        op.execute("DROP INDEX IF EXISTS ix_events_project_id")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_events_project_id', 'events', ['project_id'])
+    for name in _INDEXES:
+        op.drop_index(name, table_name='events')
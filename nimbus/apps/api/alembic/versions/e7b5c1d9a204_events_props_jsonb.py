@@ -0,0 +1,130 @@
+"""events.props as JSONB with a jsonb_path_ops GIN index; projects.hot_props
+
+Revision ID: e7b5c1d9a204
+Revises: d41a7c9e3f02
+Create Date: 2025-12-09 11:05:48.771930
+
+ALTER COLUMN ... TYPE jsonb would rewrite every partition under an exclusive lock.
+Instead a jsonb shadow column is filled by a trigger for new rows and by committed
+chunks for old ones, NOT NULL is proven through a validated CHECK (no scan under
+lock), and the columns swap names in one short transaction.
+
+The GIN index leads with project_id when btree_gin is available, so a props filter
+only touches that project's entries; otherwise it covers props alone.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b5c1d9a204'
+down_revision: Union[str, Sequence[str], None] = 'd41a7c9e3f02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_CHUNK_ROWS = 50_000
+
+
+def _partitions(conn) -> list:
+    return list(conn.execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'events'::regclass ORDER BY 1"
+    )).scalars())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    op.add_column('projects', sa.Column('hot_props', sa.JSON(), server_default=sa.text("'[]'"), nullable=False))
+
+    # 1. Shadow column, kept current for new rows
+    op.add_column('events', sa.Column('props_jsonb', postgresql.JSONB(), nullable=True))
+    op.execute("""
+        CREATE FUNCTION events_props_jsonb() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.props_jsonb := NEW.props::jsonb;
+            RETURN NEW;
+        END $$
+    """)
+    op.execute(
+        "CREATE TRIGGER events_props_jsonb BEFORE INSERT ON events "
+        "FOR EACH ROW EXECUTE FUNCTION events_props_jsonb()"
+    )
+
+    with op.get_context().autocommit_block():
+        # 2. Backfill old rows in id order (leading column of the primary key)
+        after = '00000000-0000-0000-0000-000000000000'
+        while True:
+            last = conn.execute(
+                sa.text("""
+                    WITH chunk AS (
+                        SELECT id, ts FROM events WHERE id > CAST(:id AS uuid) ORDER BY id LIMIT :n
+                    ), filled AS (
+                        UPDATE events e SET props_jsonb = e.props::jsonb
+                        FROM chunk c
+                        WHERE e.id = c.id AND e.ts = c.ts AND e.props_jsonb IS NULL
+                    )
+                    SELECT id FROM chunk ORDER BY id DESC LIMIT 1
+                """),
+                {"id": after, "n": _CHUNK_ROWS},
+            ).scalar()
+            if last is None:
+                break
+            after = str(last)
+
+        # 3. VALIDATE scans without blocking writes; SET NOT NULL then trusts it
+        op.execute("ALTER TABLE events ADD CONSTRAINT ck_events_props_jsonb CHECK (props_jsonb IS NOT NULL) NOT VALID")
+        op.execute("ALTER TABLE events VALIDATE CONSTRAINT ck_events_props_jsonb")
+
+    # 4. Swap
+    op.execute("LOCK TABLE events IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER events_props_jsonb ON events")
+    op.execute("DROP FUNCTION events_props_jsonb()")
+    op.drop_column('events', 'props')
+    op.alter_column('events', 'props_jsonb', new_column_name='props', nullable=False)
+    op.drop_constraint('ck_events_props_jsonb', 'events', type_='check')
+
+    # 5. GIN index: ON ONLY the parent, then concurrently per partition
+    with op.get_context().autocommit_block():
+        scoped = conn.execute(sa.text(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gin'"
+        )).first() is not None
+        if scoped:
+            try:
+                op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+            except sa.exc.DBAPIError:  # available but not ours to install
+                scoped = False
+        columns = "project_id, props jsonb_path_ops" if scoped else "props jsonb_path_ops"
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_events_props ON ONLY events USING gin ({columns})")
+        for partition in _partitions(conn):
+            child = f"{partition}_props_idx"
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} USING gin ({columns})")
+            attached = conn.execute(sa.text(
+                "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:child) "
+                "AND inhparent = to_regclass('ix_events_props')"
+            ), {"child": child}).first()
+            if attached is None:
+                op.execute(f"ALTER INDEX ix_events_props ATTACH PARTITION {child}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # hot-prop indexes (created by nimbus_worker) use jsonb operators
+    conn = op.get_bind()
+    hot = conn.execute(sa.text(
+        "SELECT indexrelid::regclass::text FROM pg_index "
+        "WHERE indrelid = 'events'::regclass AND indexrelid::regclass::text LIKE 'ix\\_events\\_hot\\_%'"
+    )).scalars().all()
+    for name in hot:
+        op.drop_index(name, table_name='events')
+    op.drop_index('ix_events_props', table_name='events')
+    op.alter_column(
+        'events', 'props',
+        type_=sa.JSON(),
+        existing_nullable=False,
+        postgresql_using='props::json',
+    )
+    op.drop_column('projects', 'hot_props')
@@ -0,0 +1,69 @@
+"""event_rollups + rollup_watermarks; index events.created_at
+
+Revision ID: f2c8e4a6b1d7
+Revises: e7b5c1d9a204
+Create Date: 2025-12-16 16:27:10.448392
+
+nimbus_worker folds events into per-minute/hour/day counts in order of insertion
+(created_at), so the new index on events.created_at is what it walks. Like the
+other events indexes it is built ON ONLY the parent and concurrently per partition.
+The rollups themselves are filled by `python -m nimbus_worker.rollups backfill`
+(or the worker's first run), not here.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c8e4a6b1d7'
+down_revision: Union[str, Sequence[str], None] = 'e7b5c1d9a204'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'event_rollups',
+        sa.Column('project_id', sa.UUID(), nullable=False),
+        sa.Column('granularity', sa.String(length=8), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(timezone=False), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('project_id', 'granularity', 'bucket_start', 'name'),
+        sa.CheckConstraint("granularity IN ('minute', 'hour', 'day')", name='ck_event_rollups_granularity'),
+    )
+    op.create_table(
+        'rollup_watermarks',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('processed_until', sa.DateTime(timezone=False), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+    conn = op.get_bind()
+    op.execute("CREATE INDEX IF NOT EXISTS ix_events_created_at ON ONLY events (created_at)")
+    partitions = list(conn.execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'events'::regclass ORDER BY 1"
+    )).scalars())
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            child = f"{partition}_created_at_idx"
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} (created_at)")
+            attached = conn.execute(sa.text(
+                "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:child) "
+                "AND inhparent = to_regclass('ix_events_created_at')"
+            ), {"child": child}).first()
+            if attached is None:
+                op.execute(f"ALTER INDEX ix_events_created_at ATTACH PARTITION {child}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_events_created_at', table_name='events')
+    op.drop_table('rollup_watermarks')
+    op.drop_table('event_rollups')
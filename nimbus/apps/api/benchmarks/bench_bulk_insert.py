@@ -0,0 +1,88 @@
+"""
+Compare bulk insert throughput: multi-row INSERT ... RETURNING vs binary COPY.
+
+Usage (against a disposable database that has the Nimbus schema):
+
+    NIMBUS_DATABASE_URL=postgresql+asyncpg://postgres:pw@localhost:5432/nimbus_test \\
+        poetry run python benchmarks/bench_bulk_insert.py [--rounds 5]
+
+Rows are written inside a transaction that is rolled back, so the table is left as found.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from sqlalchemy import text  # noqa: E402
+
+from nimbus.db import get_engine, get_sessionmaker  # noqa: E402
+from nimbus.repositories import events as events_repo  # noqa: E402
+from nimbus.settings import settings  # noqa: E402
+
+BATCH_SIZES = (10, 100, 1000, 10000)
+
+
+def _records(project_id: uuid.UUID, n: int):
+    now = dt.datetime.utcnow()
+    return [
+        {
+            "id": uuid.uuid4(),
+            "project_id": project_id,
+            "name": "page_view",
+            "ts": now - dt.timedelta(seconds=i),
+            "props": {"path": f"/p/{i % 50}", "plan": "pro", "ms": i % 997},
+            "user_id": f"u{i % 1000}",
+            "seq": None,
+        }
+        for i in range(n)
+    ]
+
+
+async def _timed_insert(project_id: uuid.UUID, n: int, use_copy: bool) -> float:
+    settings.ingest_copy_enabled = use_copy
+    settings.ingest_copy_min_rows = 1
+    records = _records(project_id, n)
+    Session = get_sessionmaker()
+    async with Session() as session:
+        started = time.perf_counter()
+        inserted = await events_repo.bulk_insert_events(session, records)
+        await session.flush()
+        elapsed = time.perf_counter() - started
+        await session.rollback()
+    assert inserted == n, (inserted, n)
+    return elapsed
+
+
+async def main(rounds: int) -> None:
+    project_id = uuid.uuid4()
+    engine = get_engine()
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("INSERT INTO projects (id, name, api_key_id, api_key_hash) VALUES (:id, 'bench', :kid, '\\x00')"),
+            {"id": project_id, "kid": f"bench-{project_id.hex[:12]}"},
+        )
+    try:
+        print(f"{'batch':>7} | {'INSERT rows/s':>14} | {'COPY rows/s':>12} | speedup")
+        print("-" * 52)
+        for n in BATCH_SIZES:
+            best = {}
+            for use_copy in (False, True):
+                await _timed_insert(project_id, n, use_copy)  # warm-up
+                best[use_copy] = min([await _timed_insert(project_id, n, use_copy) for _ in range(rounds)])
+            ins, cp = n / best[False], n / best[True]
+            print(f"{n:>7} | {ins:>14,.0f} | {cp:>12,.0f} | {cp / ins:>6.1f}x")
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM projects WHERE id = :id"), {"id": project_id})
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args().rounds))
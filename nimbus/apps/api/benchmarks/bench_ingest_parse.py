@@ -0,0 +1,88 @@
+"""
+CPU per event of the ingest request pipeline: the old multi-parse path vs the single-parse one.
+
+Old: FastAPI json.loads + model validation, HMAC over a decoded f-string, a second
+json.loads for the project_id check, json.dumps of every props dict in the validator,
+then model_dump() and dict rebuilding. New: HMAC over the raw bytes, one
+model_validate_json pass, records read straight off the models.
+
+Usage:
+
+    poetry run python benchmarks/bench_ingest_parse.py [--events 1000] [--rounds 200]
+
+No database is needed.
+"""
+import argparse
+import datetime as dt
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from nimbus.schemas.events import IngestRequest  # noqa: E402
+from nimbus.services.events import build_event_records, parse_ingest_body, records_from_request  # noqa: E402
+
+SECRET = b"bench-secret"
+
+
+def _body(n: int) -> bytes:
+    now = dt.datetime.now(dt.timezone.utc).isoformat()
+    events = [
+        {
+            "name": "page_view",
+            "ts": now,
+            "user_id": f"u{i % 1000}",
+            "props": {"path": f"/docs/{i % 50}", "plan": "pro", "ms": i % 997, "ref": {"src": "ads", "cid": i}},
+        }
+        for i in range(n)
+    ]
+    return json.dumps({"project_id": str(uuid.uuid4()), "events": events}).encode()
+
+
+def old_pipeline(raw: bytes):
+    payload = IngestRequest.model_validate(json.loads(raw))            # FastAPI body parse
+    for e in payload.events:                                            # old validate_props size check
+        json.dumps(e.props)
+    msg = f"1:POST:/v1/events:{raw.decode()}"                           # old HMAC message
+    hmac.new(SECRET, msg.encode("utf-8"), hashlib.sha256).hexdigest()
+    json.loads(raw.decode()).get("project_id")                          # second parse for project check
+    return build_event_records(payload.project_id, [e.model_dump() for e in payload.events])
+
+
+def new_pipeline(raw: bytes):
+    mac = hmac.new(SECRET, b"1:POST:/v1/events:", hashlib.sha256)
+    mac.update(raw)
+    mac.hexdigest()
+    return records_from_request(parse_ingest_body(raw))
+
+
+def _cpu_per_event(fn, raw: bytes, n: int, rounds: int) -> float:
+    fn(raw)  # warm-up
+    started = time.process_time()
+    for _ in range(rounds):
+        fn(raw)
+    return (time.process_time() - started) / (rounds * n)
+
+
+def main(events: int, rounds: int) -> None:
+    raw = _body(events)
+    assert len(old_pipeline(raw)) == len(new_pipeline(raw)) == events
+    old = _cpu_per_event(old_pipeline, raw, events, rounds)
+    new = _cpu_per_event(new_pipeline, raw, events, rounds)
+    print(f"body: {len(raw):,} bytes, {events} events, {rounds} rounds")
+    print(f"old  : {old * 1e6:8.2f} µs CPU/event")
+    print(f"new  : {new * 1e6:8.2f} µs CPU/event")
+    print(f"speedup: {old / new:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    main(args.events, args.rounds)
@@ -0,0 +1,109 @@
+"""
+`GET /v1/events?props=...` latency on a multi-million-row project, three ways:
+
+  no-index  best plan without any props index (bitmap scans off, so neither the GIN
+            nor the hot-key index can be used): walk the project's rows and test
+            every props document, which is what the old json column got
+  gin       props @> filter through the jsonb_path_ops GIN index
+  hot-key   the same filter with `plan` marked hot, served by its expression index
+
+Each mode runs the repository's offset listing (page + total count) for a selective
+filter (0.1% of rows) and a broad one (~33%).
+
+Usage (PostgreSQL, migrated to head):
+
+    NIMBUS_DATABASE_URL=postgresql+asyncpg://... \\
+        poetry run python benchmarks/bench_props_filter.py [--rows 2000000] [--repeat 5] [--keep]
+
+The fixture project is deleted afterwards unless --keep is given.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from sqlalchemy import text  # noqa: E402
+
+from nimbus.db import get_sessionmaker  # noqa: E402
+from nimbus.repositories.events import list_events_offset  # noqa: E402
+
+FILTERS = {"selective": {"plan": "enterprise"}, "broad": {"plan": "pro"}}
+HOT_COLUMNS = "(project_id, (props -> 'plan'), ts DESC) WHERE props ? 'plan'"
+HOT_INDEX = "ix_events_hot_" + hashlib.sha1(HOT_COLUMNS.encode()).hexdigest()[:12]  # nimbus_worker's name for it
+
+
+async def _fixture(Session, rows: int) -> str:
+    pid = str(uuid.uuid4())
+    async with Session() as s:
+        await s.execute(
+            text("INSERT INTO projects (id, name, api_key_id, api_key_hash) VALUES (:id, 'bench-props', :kid, '\\x00')"),
+            {"id": pid, "kid": f"bench-{pid[:8]}"},
+        )
+        for start in range(0, rows, 200_000):
+            await s.execute(text("""
+                INSERT INTO events (id, project_id, name, ts, props)
+                SELECT gen_random_uuid(), CAST(:pid AS uuid), 'page_view',
+                       now()::timestamp - (g % 5000000) * interval '1 second',
+                       jsonb_build_object(
+                           'plan', CASE WHEN g % 1000 = 0 THEN 'enterprise'
+                                        ELSE (ARRAY['free', 'pro', 'team'])[g % 3 + 1] END,
+                           'country', 'c' || (g % 50),
+                           'path', '/docs/' || (g % 200))
+                FROM generate_series(CAST(:lo AS int), CAST(:hi AS int)) g
+            """), {"pid": pid, "lo": start, "hi": min(start + 200_000, rows) - 1})
+            await s.commit()
+        # what nimbus_worker builds once `plan` is marked hot
+        await s.execute(text(f"CREATE INDEX IF NOT EXISTS {HOT_INDEX} ON events {HOT_COLUMNS}"))
+        await s.commit()
+        await s.execute(text("ANALYZE events"))
+        await s.commit()
+    return pid
+
+
+async def _time(Session, pid: str, mode: str, flt: dict, repeat: int) -> float:
+    samples = []
+    async with Session() as s:
+        await s.execute(
+            text("UPDATE projects SET hot_props = CAST(:hot AS json) WHERE id = :id"),
+            {"hot": '["plan"]' if mode == "hot-key" else "[]", "id": pid},
+        )
+        await s.commit()
+        for _ in range(repeat + 1):
+            if mode == "no-index":
+                await s.execute(text("SET LOCAL enable_bitmapscan = off"))
+            started = time.perf_counter()
+            await list_events_offset(s, pid, limit=50, offset=0, props_contains=flt)
+            samples.append(time.perf_counter() - started)
+            await s.rollback()
+    return statistics.median(samples[1:])  # first run warms the cache
+
+
+async def main(rows: int, repeat: int, keep: bool) -> None:
+    Session = get_sessionmaker()
+    print(f"building {rows:,} events ...")
+    pid = await _fixture(Session, rows)
+    try:
+        for label, flt in FILTERS.items():
+            for mode in ("no-index", "gin", "hot-key"):
+                ms = await _time(Session, pid, mode, flt, repeat) * 1000
+                print(f"{label:9s} {mode:9s} {ms:9.1f} ms/page")
+    finally:
+        if not keep:
+            async with Session() as s:
+                await s.execute(text("DELETE FROM projects WHERE id = :id"), {"id": pid})
+                await s.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat, args.keep))
@@ -0,0 +1,153 @@
+"""
+WebSocket fan-out load test: thousands of simulated dashboard clients on one process.
+
+Each client is a hub subscription drained by its own task, the way routes/ws.py
+drains one per socket; `--slow` of them take `--slow-ms` per message, like a
+client on a bad link. A publisher sends `--messages` updates per channel through
+Redis at `--rate` per second. Reported per run:
+
+  redis     subscriptions Redis holds per channel (PUBSUB NUMSUB)
+  latency   publish -> client dequeue, p50 / p99 / max, for fast and slow clients
+  delivery  messages fast clients received (should be all) and slow clients dropped
+
+`--baseline` runs the old route's shape instead, a pubsub connection per client
+(capped at 2000: Redis' maxclients is 10000 by default).
+
+Usage (Redis reachable at NIMBUS_REDIS_URL):
+
+    poetry run python benchmarks/bench_ws_fanout.py [--clients 5000] [--channels 10] \\
+        [--messages 50] [--rate 20] [--slow 0.05] [--slow-ms 200] [--baseline]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import redis.asyncio as aioredis  # noqa: E402
+
+import nimbus.cache  # noqa: E402
+from nimbus.services.ws_hub import PubSubHub  # noqa: E402
+from nimbus.settings import settings  # noqa: E402
+
+
+async def _client(sub, messages: int, delay: float, latencies: list, counts: list, i: int):
+    while True:
+        data = json.loads(await sub.get())
+        latencies.append(time.perf_counter() - data["sent"])
+        counts[i] += 1
+        if data["n"] == messages - 1:
+            return
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class _PerClientPubSub:
+    """The old route: one pubsub connection per socket."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.pubsubs = []
+
+    async def subscribe(self, channel: str):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(channel)
+        self.pubsubs.append(pubsub)
+        return _Listener(pubsub)
+
+    async def close(self):
+        await asyncio.gather(*(p.aclose() for p in self.pubsubs), return_exceptions=True)
+
+
+class _Listener:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+        self.dropped = 0
+
+    async def get(self) -> str:
+        while True:
+            msg = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if msg and msg.get("type") == "message":
+                return msg["data"]
+
+
+def _pct(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+async def run(args) -> None:
+    redis = aioredis.from_url(settings.redis_url, decode_responses=True, max_connections=None)
+    publisher = aioredis.from_url(settings.redis_url, decode_responses=True)
+    nimbus.cache.redis = redis
+    channels = [f"metrics:bench-{uuid.uuid4()}" for _ in range(args.channels)]
+    clients = min(args.clients, 2000) if args.baseline else args.clients
+    hub = _PerClientPubSub(redis) if args.baseline else PubSubHub(queue_size=args.queue)
+
+    t0 = time.perf_counter()
+    subs = [await hub.subscribe(channels[i % len(channels)]) for i in range(clients)]
+    subscribe_s = time.perf_counter() - t0
+    n_slow = int(clients * args.slow)
+    fast_lat, slow_lat = [], []
+    counts = [0] * clients
+    tasks = [
+        asyncio.create_task(_client(
+            s, args.messages, args.slow_ms / 1000 if i < n_slow else 0,
+            slow_lat if i < n_slow else fast_lat, counts, i,
+        ))
+        for i, s in enumerate(subs)
+    ]
+
+    numsub = dict(await publisher.pubsub_numsub(*channels))
+    t0 = time.perf_counter()
+    for n in range(args.messages):
+        for ch in channels:
+            await publisher.publish(ch, json.dumps({"n": n, "sent": time.perf_counter(), "series": [{"ts": "", "value": n}]}))
+        await asyncio.sleep(1 / args.rate)
+    # Drop-oldest keeps the last message, so slow clients finish once they drain their queue
+    done, pending = await asyncio.wait(tasks, timeout=args.messages * args.slow_ms / 1000 + 5)
+    elapsed = time.perf_counter() - t0
+    for t in pending:
+        t.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    fast_counts = counts[n_slow:]
+    dropped = sum(getattr(s, "dropped", 0) for s in subs[:n_slow])
+    print(f"mode       {'per-client pubsub' if args.baseline else 'shared hub'}: {clients} clients, {len(channels)} channels, "
+          f"{args.messages} msgs/channel, {n_slow} slow")
+    print(f"subscribe  {subscribe_s * 1000:.0f} ms for all clients")
+    print(f"redis      {sum(numsub.values())} subscriptions, {min(numsub.values())}..{max(numsub.values())} per channel")
+    print(f"latency    fast p50 {_pct(fast_lat, 0.5):.1f} ms  p99 {_pct(fast_lat, 0.99):.1f} ms  max {_pct(fast_lat, 1.0):.1f} ms")
+    print(f"           slow p50 {_pct(slow_lat, 0.5):.1f} ms  p99 {_pct(slow_lat, 0.99):.1f} ms")
+    print(f"delivery   fast clients got {min(fast_counts) if fast_counts else 0}..{max(fast_counts) if fast_counts else 0} "
+          f"of {args.messages}; slow clients dropped {dropped}; run {elapsed:.1f} s")
+
+    for s in subs:
+        if not args.baseline:
+            await hub.unsubscribe(s)
+    await hub.close()
+    await publisher.aclose()
+    await redis.aclose()
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--clients", type=int, default=5000)
+    p.add_argument("--channels", type=int, default=10)
+    p.add_argument("--messages", type=int, default=50)
+    p.add_argument("--rate", type=float, default=20.0, help="publish rounds per second")
+    p.add_argument("--slow", type=float, default=0.05, help="fraction of slow clients")
+    p.add_argument("--slow-ms", type=float, default=200.0, help="time a slow client spends per message")
+    p.add_argument("--queue", type=int, default=settings.ws_client_queue_size)
+    p.add_argument("--baseline", action="store_true", help="one pubsub connection per client, like the old route")
+    asyncio.run(run(p.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Fire-and-forget tasks started from after-commit hooks (cache invalidations, top-K
+summaries, key-cache broadcasts).
+
+The event loop only keeps weak references to tasks, so one nobody holds can be
+garbage-collected mid-flight. `spawn` keeps each task in a module-level set until
+it is done; `drain` lets shutdown wait for the ones still running.
+"""
+import asyncio
+import logging
+from typing import Coroutine, Set
+
+logger = logging.getLogger(__name__)
+
+_tasks: Set[asyncio.Task] = set()
+
+
+def spawn(coro: Coroutine) -> asyncio.Task:
+    """Schedule `coro` on the running loop; raises RuntimeError without one."""
+    task = asyncio.get_running_loop().create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+def pending() -> int:
+    return len(_tasks)
+
+
+async def drain(timeout: float = 5.0) -> None:
+    """Wait up to `timeout` seconds for the tasks still running, then cancel the rest."""
+    if not _tasks:
+        return
+    done, still_running = await asyncio.wait(set(_tasks), timeout=timeout)
+    for task in still_running:
+        task.cancel()
+    if still_running:
+        logger.warning(f"Cancelled {len(still_running)} background tasks at shutdown")
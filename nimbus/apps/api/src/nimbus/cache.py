@@ -1,14 +1,134 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
 import redis.asyncio as aioredis
-from typing import Optional
 
+from . import stats
 from .settings import settings
 
+logger = logging.getLogger(__name__)
+
 # Redis connection - may fail if Redis is not running
 redis: Optional[aioredis.Redis] = None
 
 try:
     redis = aioredis.from_url(settings.redis_url, encoding="utf-8", decode_responses=True)
 except Exception as e:
-    import logging
     logging.warning(f"Redis connection failed (will operate without cache): {e}")
     redis = None
+
+# After a Redis error, serve from the local fallback this long before retrying
+_REDIS_RETRY_S = 5.0
+
+
+class QueryCache:
+    """
+    JSON-serialisable query results by key, plus per-scope version counters that
+    callers fold into their keys to invalidate without deleting anything.
+
+    Entries and versions live in Redis (shared by every API process) while it is
+    configured and reachable; otherwise in a process-local LRU. Local versions
+    track the largest Redis version seen and are bumped at once by this
+    process's writes; local entries never outlive `local_max_ttl`.
+    """
+
+    def __init__(self, name: str, prefix: str, max_entries: int, local_max_ttl: float):
+        self.prefix = prefix
+        self.max_entries = max_entries
+        self.local_max_ttl = local_max_ttl
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._versions: Dict[str, Dict[str, int]] = {}
+        self._redis_down_until = 0.0
+        self._errors = stats.counter("nimbus_query_cache_redis_errors_total", "Redis failures that sent a query cache to its local fallback", labels={"cache": name})
+        self._size = stats.gauge("nimbus_query_cache_local_entries", "Entries in a query cache's local fallback", labels={"cache": name})
+
+    def _redis(self) -> Optional[aioredis.Redis]:
+        if redis is None or self._redis_down_until > time.monotonic():
+            return None
+        return redis
+
+    def _redis_failed(self, e: Exception) -> None:
+        logger.warning(f"Query cache {self.prefix}: Redis error ({e}); using the local fallback for {_REDIS_RETRY_S:g}s")
+        self._errors.inc()
+        self._redis_down_until = time.monotonic() + _REDIS_RETRY_S
+
+    def _versions_key(self, scope: str) -> str:
+        return f"{self.prefix}:ver:{scope}"
+
+    async def versions(self, scope: str, fields: Sequence[str]) -> List[int]:
+        r = self._redis()
+        if r is not None:
+            try:
+                values = await r.hmget(self._versions_key(scope), list(fields))
+                # Our own bumps reach Redis a moment after the local ones: keep the larger
+                local = self._versions.setdefault(scope, {})
+                for f, v in zip(fields, values):
+                    local[f] = max(int(v or 0), local.get(f, 0))
+                return [local[f] for f in fields]
+            except Exception as e:
+                self._redis_failed(e)
+        local = self._versions.get(scope, {})
+        return [local.get(f, 0) for f in fields]
+
+    def bump_local(self, scope: str, fields: Sequence[str]) -> None:
+        local = self._versions.setdefault(scope, {})
+        for f in fields:
+            local[f] = local.get(f, 0) + 1
+
+    async def bump(self, scope: str, fields: Sequence[str], local: bool = True) -> None:
+        """Invalidate every entry keyed on these versions, here (unless already done) and in Redis."""
+        if local:
+            self.bump_local(scope, fields)
+        r = self._redis()
+        if r is None:
+            return
+        try:
+            async with r.pipeline(transaction=False) as pipe:
+                for f in fields:
+                    pipe.hincrby(self._versions_key(scope), f, 1)
+                await pipe.execute()
+        except Exception as e:
+            self._redis_failed(e)
+
+    async def get(self, key: str) -> Optional[Any]:
+        r = self._redis()
+        if r is not None:
+            try:
+                raw = await r.get(f"{self.prefix}:{key}")
+                return None if raw is None else json.loads(raw)
+            except Exception as e:
+                self._redis_failed(e)
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._entries[key]
+            self._size.set(len(self._entries))
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        r = self._redis()
+        if r is not None:
+            try:
+                await r.set(f"{self.prefix}:{key}", json.dumps(value, separators=(",", ":")), px=max(1, int(ttl * 1000)))
+                return
+            except Exception as e:
+                self._redis_failed(e)
+        self._entries[key] = (time.monotonic() + min(ttl, self.local_max_ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._size.set(len(self._entries))
+
+    def clear_local(self) -> None:
+        self._entries.clear()
+        self._versions.clear()
+        self._size.set(0)
@@ -0,0 +1,196 @@
+"""
+Streaming Content-Encoding (gzip, zstd) decoding for request bodies.
+
+Bodies are decompressed chunk by chunk as they arrive and handed out in pieces of
+bounded size, however much a chunk expands. A cap on the decoded size, or on the
+decoded / wire ratio for bodies of unbounded length, stops a small compressed
+payload from expanding into gigabytes (zip bomb). Callers that sign the wire bytes
+get each raw chunk through `on_wire` before it is decoded and discarded.
+"""
+from __future__ import annotations
+
+import sys
+import time
+import zlib
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+
+from nimbus import stats
+
+try:  # a declared dependency; only a partial install lacks it (zstd is then not offered)
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+RATIO_BUCKETS = (1, 1.5, 2, 3, 5, 8, 12, 20, 50, 100)
+
+_IDENTITY = ("", "identity")
+
+# Largest decoded piece iter_decoded yields by default
+PIECE_BYTES = 64 * 1024
+
+# Decoded bytes allowed on top of max_ratio * wire bytes, so short bodies that
+# compress very well are not refused
+_RATIO_SLACK = 1024 * 1024
+
+
+class UnsupportedEncoding(Exception):
+    """Content-Encoding is not one we can decode."""
+
+
+class BodyTooLarge(Exception):
+    """The decoded body exceeds the configured limit."""
+
+
+class CorruptBody(Exception):
+    """The compressed stream is truncated or invalid."""
+
+
+def supported_encodings() -> List[str]:
+    return ["gzip"] + (["zstd"] if zstandard is not None else [])
+
+
+class _GzipDecoder:
+    def __init__(self):
+        self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decode(self, data: bytes, piece: int) -> Iterator[bytes]:
+        """Decoded output of `data` in pieces of at most `piece` bytes."""
+        while True:
+            # max_length caps each call; input it did not reach waits in unconsumed_tail
+            out = self._d.decompress(data, piece)
+            if out:
+                yield out
+            data = self._d.unconsumed_tail
+            if not data and len(out) < piece:
+                return
+
+    def finish(self) -> bytes:
+        if not self._d.eof:
+            raise CorruptBody("truncated gzip stream")
+        return b""
+
+
+class _ZstdDecoder:
+    # zstd has no output cap per call. A block takes at least 3 input bytes and decodes
+    # to at most 128 KiB, so a slice of 3 * k bytes (plus a block buffered from earlier
+    # input) yields at most (k + 1) * 128 KiB: 96-byte slices bound every call to about
+    # 4 MiB, which is then handed out in pieces.
+    _MAX_BLOCK = 128 * 1024
+    _SLICE = 3 * (4 * 1024 * 1024 // _MAX_BLOCK)
+
+    def __init__(self):
+        self._d = zstandard.ZstdDecompressor().decompressobj()
+
+    def decode(self, data: bytes, piece: int) -> Iterator[bytes]:
+        """Decoded output of `data` in pieces of at most `piece` bytes."""
+        view = memoryview(data)
+        for i in range(0, len(view), self._SLICE):
+            out = self._d.decompress(view[i:i + self._SLICE])
+            for j in range(0, len(out), piece):
+                yield out[j:j + piece]
+
+    def finish(self) -> bytes:
+        if getattr(self._d, "eof", True) is False:
+            raise CorruptBody("truncated zstd stream")
+        return b""
+
+
+def _decoder_for(encoding: str):
+    if encoding == "gzip":
+        return _GzipDecoder()
+    if encoding == "zstd" and zstandard is not None:
+        return _ZstdDecoder()
+    raise UnsupportedEncoding(encoding)
+
+
+def normalize(encoding: Optional[str]) -> str:
+    return (encoding or "").strip().lower()
+
+
+async def iter_decoded(
+    chunks: AsyncIterator[bytes],
+    encoding: Optional[str],
+    limit: Optional[int] = None,
+    on_wire: Optional[Callable[[bytes], None]] = None,
+    piece: int = PIECE_BYTES,
+    max_ratio: Optional[float] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Yield decoded pieces of a (possibly compressed) body as its chunks arrive, none
+    longer than `piece` bytes once decoded. Raises BodyTooLarge past `limit` decoded
+    bytes, or once a compressed body decodes to over `max_ratio` times its wire size.
+    """
+    encoding = normalize(encoding)
+    decoder = None if encoding in _IDENTITY else _decoder_for(encoding)
+    label = encoding or "identity"
+    wire = decoded = 0
+    spent = 0.0
+    budget = limit if limit is not None else sys.maxsize - 1
+
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if on_wire is not None:
+                on_wire(chunk)
+            wire += len(chunk)
+            if decoder is None:
+                if decoded + len(chunk) > budget:
+                    raise BodyTooLarge()
+                decoded += len(chunk)
+                yield chunk
+                continue
+            pieces = decoder.decode(chunk, piece)
+            while True:
+                started = time.perf_counter()
+                try:
+                    out = next(pieces, None)
+                except (zlib.error, ValueError) as e:
+                    raise CorruptBody(str(e)) from e
+                except Exception as e:
+                    if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                        raise CorruptBody(str(e)) from e
+                    raise
+                finally:
+                    spent += time.perf_counter() - started
+                if out is None:
+                    break
+                decoded += len(out)
+                if decoded > budget:
+                    raise BodyTooLarge()
+                if max_ratio is not None and decoded > max_ratio * wire + _RATIO_SLACK:
+                    raise BodyTooLarge(f"Compressed body expands more than {max_ratio:g}x")
+                yield out
+        if decoder is not None:
+            decoder.finish()
+    except BodyTooLarge:
+        stats.counter(
+            "nimbus_request_body_too_large_total", "Bodies refused for exceeding the decoded size limit",
+            labels={"encoding": label},
+        ).inc()
+        raise
+
+    stats.counter("nimbus_request_body_wire_bytes_total", "Request body bytes as received", labels={"encoding": label}).inc(wire)
+    stats.counter("nimbus_request_body_decoded_bytes_total", "Request body bytes after decoding", labels={"encoding": label}).inc(decoded)
+    if decoder is not None and wire:
+        stats.histogram(
+            "nimbus_request_body_compression_ratio", "Decoded / wire size of compressed bodies",
+            labels={"encoding": label}, buckets=RATIO_BUCKETS,
+        ).observe(decoded / wire)
+        stats.histogram(
+            "nimbus_request_body_decode_seconds", "CPU time spent decompressing one body",
+            labels={"encoding": label},
+        ).observe(spent)
+
+
+async def read_body(
+    chunks: AsyncIterator[bytes],
+    encoding: Optional[str],
+    limit: int,
+    on_wire: Optional[Callable[[bytes], None]] = None,
+) -> bytes:
+    """Decode a whole body into one bytes object; only the decoded copy is kept."""
+    out = bytearray()
+    async for piece in iter_decoded(chunks, encoding, limit, on_wire):
+        out += piece
+    return bytes(out)
@@ -1,7 +1,8 @@
+import time
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.pool import NullPool
-from sqlalchemy import text
+from sqlalchemy.pool import NullPool, AsyncAdaptedQueuePool
+from sqlalchemy import event, text
 from nimbus.settings import settings
 from nimbus.models.base import Base
 import logging
@@ -12,6 +13,41 @@ logger = logging.getLogger(__name__)
 _engine = None
 _sessionmaker = None
 
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that reports how long each checkout waited to admission control."""
+
+    def _do_get(self):
+        from nimbus.services.admission import admission
+
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            admission.observe_pool_wait(time.perf_counter() - started)
+
+
+def _instrument(engine) -> None:
+    """
+    Feed statement latency to admission control. Analytics scans are expected to
+    take seconds and say nothing about database health, so statements executed with
+    the `nimbus_analytics=True` execution option are left out.
+    """
+    from nimbus.services.admission import admission
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and context.execution_options.get("nimbus_analytics"):
+            conn.info.pop("nimbus_query_start", None)
+            return
+        conn.info["nimbus_query_start"] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("nimbus_query_start", None)
+        if started is not None:
+            admission.observe_db_latency(time.perf_counter() - started)
+
 def get_engine():
     global _engine
     if _engine is None:
@@ -45,6 +81,7 @@ def get_engine():
         else:
             # Production connection pooling
             engine_kwargs.update({
+                "poolclass": TimedQueuePool,
                 "pool_size": settings.db_pool_size,
                 "max_overflow": settings.db_max_overflow,
                 "pool_timeout": settings.db_pool_timeout,
@@ -54,6 +91,7 @@ def get_engine():
             logger.info(f"Database engine created with pool_size={settings.db_pool_size}, max_overflow={settings.db_max_overflow}")
         
         _engine = create_async_engine(**engine_kwargs)
+        _instrument(_engine)
     
     return _engine
 
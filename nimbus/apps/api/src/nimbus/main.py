@@ -1,24 +1,46 @@
 import uuid
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import ValidationError
 from sqlalchemy.exc import SQLAlchemyError
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-from slowapi.util import get_remote_address
+from nimbus import background
 from nimbus.settings import settings
-from nimbus.routes import health, auth, events, metrics
+from nimbus.db import cleanup_database
+from nimbus.routes import health, auth, events, funnels, metrics, retention, ws
 from nimbus.routes import projects
+from nimbus.services.ingest_buffer import get_ingest_buffer, shutdown_ingest_buffer
+from nimbus.services.live import run_live_flusher
+from nimbus.services.ws_hub import hub as ws_hub
+from nimbus.security.key_cache import run_invalidation_listener
 
 # Setup logging
 logging.basicConfig(level=getattr(logging, settings.log_level))
 logger = logging.getLogger(__name__)
 
-# Rate limiter setup
-limiter = Limiter(key_func=get_remote_address) if settings.rate_limit_enabled else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.ingest_mode == "buffered":
+        get_ingest_buffer()
+    stop = asyncio.Event()
+    key_listener = asyncio.create_task(run_invalidation_listener(stop))
+    live_flusher = asyncio.create_task(run_live_flusher(stop))
+    yield
+    stop.set()
+    key_listener.cancel()
+    await asyncio.gather(key_listener, live_flusher, return_exceptions=True)
+    await ws_hub.close()
+    # Drain buffered events before the engine goes away
+    await shutdown_ingest_buffer()
+    # ...and let their after-commit Redis updates finish
+    await background.drain()
+    await cleanup_database()
+
 
 app = FastAPI(
     title=settings.app_name,
@@ -34,13 +56,9 @@ app = FastAPI(
         "url": "https://github.com/bahagh/nimbus/blob/master/LICENSE",
     },
     debug=settings.debug,
+    lifespan=lifespan,
 )
 
-# Add rate limiter to app state
-if limiter:
-    app.state.limiter = limiter
-    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
 # Global exception handlers
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -72,7 +90,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
             "error": exc.detail,
             "status_code": exc.status_code,
             "path": request.url.path
-        }
+        },
+        headers=getattr(exc, "headers", None),
     )
 
 @app.exception_handler(RequestValidationError)
@@ -119,4 +138,8 @@ app.include_router(health.router)
 app.include_router(auth.router)
 app.include_router(events.router)
 app.include_router(metrics.router)
+app.include_router(funnels.router)
+app.include_router(retention.router)
 app.include_router(projects.router)
+if settings.enable_websockets:
+    app.include_router(ws.router)
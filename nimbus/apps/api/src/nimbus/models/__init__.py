@@ -2,3 +2,4 @@ from .base import Base  # re-export
 # Import the models so their Table objects register on Base.metadata
 from .project import Project  # noqa: F401
 from .event import Event      # noqa: F401
+from .rollup import EventRollup, PropSketchBin, RollupWatermark, UserActivity, UserFirstSeen, UserSketch  # noqa: F401
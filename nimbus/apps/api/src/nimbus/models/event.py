@@ -2,7 +2,8 @@ import datetime as dt
 import uuid
 from typing import Optional, Dict, Any
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, JSON, Integer, ForeignKey, DateTime
+from sqlalchemy import String, JSON, Integer, ForeignKey, DateTime, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
 from nimbus.models.base import Base, UUIDMixin, Timestamped
 
 class Event(Base, UUIDMixin, Timestamped):
@@ -10,11 +11,31 @@ class Event(Base, UUIDMixin, Timestamped):
 
     project_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
     name: Mapped[str] = mapped_column(String(200), nullable=False)
-    ts: Mapped[dt.datetime] = mapped_column(DateTime(timezone=False), nullable=False)
-    props: Mapped[Dict[str, Any]] = mapped_column(JSON, default=dict, nullable=False)
+    # Range partition key on PostgreSQL, hence part of the primary key
+    ts: Mapped[dt.datetime] = mapped_column(DateTime(timezone=False), primary_key=True, nullable=False)
+    # GIN (jsonb_path_ops) index ix_events_props and the per-key ix_events_hot_* indexes
+    # are managed by the migration / nimbus_worker (their shape depends on btree_gin)
+    props: Mapped[Dict[str, Any]] = mapped_column(JSONB().with_variant(JSON(), "sqlite"), default=dict, nullable=False)
     user_id: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
     seq: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
-    # NOTE: idempotency_key column doesn't exist yet in database (migration pending)
-    # idempotency_key: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        # SDK retries carry the same key (and ts); ON CONFLICT DO NOTHING relies on this index
+        Index(
+            "ux_events_project_idempotency_key",
+            "project_id",
+            "idempotency_key",
+            "ts",
+            unique=True,
+            postgresql_where=text("idempotency_key IS NOT NULL"),
+            sqlite_where=text("idempotency_key IS NOT NULL"),
+        ),
+        # Listing pages walk these in (ts DESC, id DESC) order instead of sorting
+        Index("ix_events_project_ts_id", "project_id", text("ts DESC"), text("id DESC")),
+        Index("ix_events_project_user_ts", "project_id", "user_id", text("ts DESC"), text("id DESC")),
+        Index("ix_events_project_name_ts", "project_id", "name", text("ts DESC"), text("id DESC")),
+        # nimbus_worker's rollup job walks events in insertion order
+        Index("ix_events_created_at", "created_at"),
+        {"extend_existing": True, "postgresql_partition_by": "RANGE (ts)"},
+    )
@@ -1,6 +1,7 @@
 import uuid
+from typing import List
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, LargeBinary
+from sqlalchemy import String, LargeBinary, JSON, text
 from nimbus.models.base import Base, UUIDMixin, Timestamped
 
 class Project(Base, UUIDMixin, Timestamped):
@@ -9,3 +10,9 @@ class Project(Base, UUIDMixin, Timestamped):
     name: Mapped[str] = mapped_column(String(200), nullable=False)
     api_key_id: Mapped[str] = mapped_column(String(128), unique=True, nullable=False)
     api_key_hash: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    # props keys filtered often enough to get their own expression index (see nimbus_worker)
+    hot_props: Mapped[List[str]] = mapped_column(JSON, default=list, server_default=text("'[]'"), nullable=False)
+    # numeric props keys nimbus_worker keeps quantile sketches for (prop_sketch_bins)
+    numeric_props: Mapped[List[str]] = mapped_column(JSON, default=list, server_default=text("'[]'"), nullable=False)
+    # the numeric_props whose bins nimbus_worker has built from all events so far
+    numeric_props_folded: Mapped[List[str]] = mapped_column(JSON, default=list, server_default=text("'[]'"), nullable=False)
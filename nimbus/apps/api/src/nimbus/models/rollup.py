@@ -0,0 +1,93 @@
+import datetime as dt
+import uuid
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import String, BigInteger, Integer, SmallInteger, Date, ForeignKey, DateTime, CheckConstraint, Index, LargeBinary, func
+from nimbus.models.base import Base
+
+# Written only by nimbus_worker (rollups.py); the API reads them for /v1/metrics
+GRANULARITIES = ("minute", "hour", "day")
+
+
+class EventRollup(Base):
+    __tablename__ = "event_rollups"
+    __table_args__ = (
+        CheckConstraint("granularity IN ('minute', 'hour', 'day')", name="ck_event_rollups_granularity"),
+        {"extend_existing": True},
+    )
+
+    project_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    granularity: Mapped[str] = mapped_column(String(8), primary_key=True)
+    bucket_start: Mapped[dt.datetime] = mapped_column(DateTime(timezone=False), primary_key=True)
+    name: Mapped[str] = mapped_column(String(200), primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class RollupWatermark(Base):
+    """Events with created_at below `processed_until` are counted in event_rollups."""
+
+    __tablename__ = "rollup_watermarks"
+    __table_args__ = {"extend_existing": True}
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    processed_until: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    updated_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=False), server_default=func.now(), nullable=False)
+
+
+class UserSketch(Base):
+    """HyperLogLog registers (nimbus.sketches.hll) of the user_ids seen per project and bucket."""
+
+    __tablename__ = "user_sketches"
+    __table_args__ = (
+        CheckConstraint("granularity IN ('hour', 'day')", name="ck_user_sketches_granularity"),
+        {"extend_existing": True},
+    )
+
+    project_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    granularity: Mapped[str] = mapped_column(String(8), primary_key=True)
+    bucket_start: Mapped[dt.datetime] = mapped_column(DateTime(timezone=False), primary_key=True)
+    registers: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+
+class UserFirstSeen(Base):
+    """Earliest event ts per user; /v1/retention assigns cohorts by it."""
+
+    __tablename__ = "user_first_seen"
+    __table_args__ = (
+        Index("ix_user_first_seen_project_first_ts", "project_id", "first_ts"),
+        {"extend_existing": True},
+    )
+
+    project_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    user_id: Mapped[str] = mapped_column(String(200), primary_key=True)
+    first_ts: Mapped[dt.datetime] = mapped_column(DateTime(timezone=False), nullable=False)
+
+
+class UserActivity(Base):
+    """Days a user had events in a (UTC) month: bit d-1 of `days` is day d."""
+
+    __tablename__ = "user_activity"
+    __table_args__ = {"extend_existing": True}
+
+    project_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    user_id: Mapped[str] = mapped_column(String(200), primary_key=True)
+    month: Mapped[dt.date] = mapped_column(Date, primary_key=True)
+    days: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class PropSketchBin(Base):
+    """DDSketch bin counts (nimbus.sketches.ddsketch) of a numeric prop per project, name and bucket."""
+
+    __tablename__ = "prop_sketch_bins"
+    __table_args__ = (
+        CheckConstraint("granularity IN ('hour', 'day')", name="ck_prop_sketch_bins_granularity"),
+        {"extend_existing": True},
+    )
+
+    project_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    prop: Mapped[str] = mapped_column(String(64), primary_key=True)
+    granularity: Mapped[str] = mapped_column(String(8), primary_key=True)
+    bucket_start: Mapped[dt.datetime] = mapped_column(DateTime(timezone=False), primary_key=True)
+    name: Mapped[str] = mapped_column(String(200), primary_key=True)
+    sign: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    bin: Mapped[int] = mapped_column(Integer, primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, nullable=False)
@@ -1,47 +1,227 @@
 from __future__ import annotations
-from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+import json
 import uuid as _uuid
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import select, func, literal, text, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
+from nimbus import stats
 from nimbus.models.event import Event
+from nimbus.models.project import Project
+from nimbus.services.live import record_on_commit as count_live_on_commit
+from nimbus.services.metrics import invalidate_on_commit as invalidate_metrics_on_commit
+from nimbus.services.topk import record_on_commit as record_topk_on_commit
+from nimbus.settings import settings
+from nimbus.sketches import RotatingBloomFilter
+
+_MAX_ROWS_PER_STATEMENT = 2000
+
+# Columns streamed by COPY; created_at/updated_at take their server defaults
+_COPY_COLUMNS = ("id", "project_id", "name", "ts", "props", "user_id", "seq", "idempotency_key")
+
+_duplicates = stats.counter("nimbus_ingest_duplicates_total", "Keyed events skipped because their idempotency_key was already stored")
+_filter_fresh = stats.counter("nimbus_idempotency_filter_fresh_total", "Keyed events the Bloom filter had never seen (no conflict lookup)")
+_filter_maybe = stats.counter("nimbus_idempotency_filter_maybe_total", "Keyed events the Bloom filter may have seen (ON CONFLICT path)")
+_copy_conflicts = stats.counter("nimbus_idempotency_copy_conflicts_total", "Fresh batches that still hit a stored key (seen by another process or before the window)")
+
+_seen_keys = RotatingBloomFilter(
+    capacity=settings.idempotency_filter_capacity,
+    error_rate=settings.idempotency_filter_error_rate,
+    window_s=settings.idempotency_filter_window_s,
+)
+
+
+def _can_copy(session: AsyncSession, records: List[Dict[str, Any]]) -> bool:
+    """COPY needs asyncpg underneath."""
+    if not settings.ingest_copy_enabled or len(records) < settings.ingest_copy_min_rows:
+        return False
+    bind = session.bind
+    return bind is not None and bind.dialect.name == "postgresql" and bind.dialect.driver == "asyncpg"
+
+
+def _is_unique_violation(exc: BaseException) -> bool:
+    while exc is not None:
+        if getattr(exc, "sqlstate", None) == "23505" or getattr(exc, "pgcode", None) == "23505":
+            return True
+        exc = exc.__cause__ or getattr(exc, "orig", None)
+    return False
+
+
+async def _copy_insert_events(session: AsyncSession, records: List[Dict[str, Any]]) -> int:
+    """Stream rows with the binary COPY protocol on the session's own connection/transaction."""
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    if not raw.driver_connection.is_in_transaction():
+        # SQLAlchemy's asyncpg adapter opens its transaction lazily on the first statement;
+        # make sure COPY runs inside it so the caller's commit/rollback covers these rows.
+        await conn.execute(text("SELECT 1"))
+    rows = [
+        (
+            r.get("id") or _uuid.uuid4(),
+            r["project_id"],
+            r["name"],
+            r["ts"],
+            json.dumps(r.get("props") or {}, separators=(",", ":")),
+            r.get("user_id"),
+            r.get("seq"),
+            r.get("idempotency_key"),
+        )
+        for r in records
+    ]
+    status = await raw.driver_connection.copy_records_to_table(
+        Event.__tablename__, records=rows, columns=_COPY_COLUMNS
+    )
+    # asyncpg returns the command tag, e.g. "COPY 1000"
+    try:
+        return int(status.rsplit(" ", 1)[-1])
+    except (AttributeError, ValueError):
+        return len(rows)
+
+
+def _insert_stmt(session: AsyncSession):
+    dialect = session.bind.dialect.name if session.bind is not None else "postgresql"
+    return sqlite_insert if dialect == "sqlite" else pg_insert
+
+
+async def _insert_rows(session: AsyncSession, records: List[Dict[str, Any]], skip_duplicates: bool) -> List[Dict[str, Any]]:
+    """Insert `records` (each with an id); returns those actually written."""
+    # asyncpg caps a statement at 32767 bind params; buffered flushes can exceed that
+    insert_ = _insert_stmt(session)
+    if not skip_duplicates:
+        for start in range(0, len(records), _MAX_ROWS_PER_STATEMENT):
+            await session.execute(insert_(Event).values(records[start:start + _MAX_ROWS_PER_STATEMENT]))
+        return records
+    written: List[Dict[str, Any]] = []
+    for start in range(0, len(records), _MAX_ROWS_PER_STATEMENT):
+        chunk = records[start:start + _MAX_ROWS_PER_STATEMENT]
+        stmt = insert_(Event).values(chunk).on_conflict_do_nothing(
+            index_elements=["project_id", "idempotency_key", "ts"],
+            index_where=text("idempotency_key IS NOT NULL"),
+        )
+        ids = {str(i) for i in (await session.execute(stmt.returning(Event.id))).scalars()}
+        written.extend(r for r in chunk if str(r["id"]) in ids)
+    return written
+
+
+async def _insert_plain(session: AsyncSession, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if _can_copy(session, records):
+        await _copy_insert_events(session, records)
+    else:
+        await _insert_rows(session, records, skip_duplicates=False)
+    return records
+
+
+async def _insert_keyed(session: AsyncSession, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Keys the filter has never seen go through the plain path inside a savepoint; the
+    filter is per process and time-windowed, so a unique violation there (key stored by
+    another process or long ago) just replays that part with ON CONFLICT DO NOTHING.
+    Returns the records actually written.
+    """
+    fresh: List[Dict[str, Any]] = []
+    maybe: List[Dict[str, Any]] = []
+    use_filter = settings.idempotency_filter_enabled
+    for r in records:
+        key = f"{r['project_id']}:{r['idempotency_key']}"
+        (maybe if not use_filter or key in _seen_keys else fresh).append(r)
+    _filter_fresh.inc(len(fresh))
+    _filter_maybe.inc(len(maybe))
+
+    written: List[Dict[str, Any]] = []
+    if fresh:
+        try:
+            async with session.begin_nested():
+                written += await _insert_plain(session, fresh)
+        except Exception as e:
+            if not _is_unique_violation(e):
+                raise
+            _copy_conflicts.inc()
+            maybe.extend(fresh)
+    if maybe:
+        written += await _insert_rows(session, maybe, skip_duplicates=True)
+
+    if use_filter:
+        for r in records:
+            _seen_keys.add(f"{r['project_id']}:{r['idempotency_key']}")
+    return written
+
 
 async def bulk_insert_events(session: AsyncSession, records: List[Dict[str, Any]]) -> int:
     """
-    Insert many events. Skips duplicates if idempotency_key is provided (idempotent).
+    Insert many events; returns how many rows were actually written.
+
+    Events carrying an idempotency_key that is already stored for the project (SDK
+    retries) are skipped, as are repeats of a key within the batch. On
+    PostgreSQL/asyncpg rows are streamed with COPY; everything else uses a multi-row
+    INSERT. Only the rows written reach the after-commit hooks (cache invalidation,
+    top-K summaries, live counters), so a retried batch is not counted twice.
     """
     if not records:
         return 0
 
-    # Ensure each record has a UUID id
+    plain: List[Dict[str, Any]] = []
+    keyed: Dict[tuple, Dict[str, Any]] = {}
     for r in records:
         r.setdefault("id", _uuid.uuid4())
-        # Remove idempotency_key if column doesn't exist yet (migration not applied)
-        if "idempotency_key" in r and r["idempotency_key"] is None:
-            del r["idempotency_key"]
-    
-    stmt = pg_insert(Event).values(records)
-    stmt = stmt.returning(Event.id)
-
-    res = await session.execute(stmt)
-    inserted = len(res.fetchall())
+        key = r.get("idempotency_key")
+        if key:
+            keyed.setdefault((r["project_id"], key), r)
+        else:
+            plain.append(r)
+
+    written: List[Dict[str, Any]] = []
+    if plain:
+        written += await _insert_plain(session, plain)
+    if keyed:
+        written += await _insert_keyed(session, list(keyed.values()))
+    _duplicates.inc(len(records) - len(written))
+    invalidate_metrics_on_commit(session, written)
+    record_topk_on_commit(session, written)
+    count_live_on_commit(session, written)
     # Remove duplicate commit - let the service handle it
-    return inserted
+    return len(written)
 
-async def list_events_offset(
-    session: AsyncSession,
+def _hot_value(value: Any) -> bool:
+    """Whether a filter value is a JSON scalar, comparable with jsonb `=`."""
+    return value is not None and isinstance(value, (str, int, float, bool))
+
+
+def _props_filter(props_contains: Dict[str, Any], hot_props: Sequence[str] = ()) -> list:
+    """
+    `props @> :filter`, served by the jsonb_path_ops GIN index. Scalar conditions on the
+    project's hot keys are repeated as `props ? 'key' AND props -> 'key' = :value` with
+    the key inlined, which is what the per-key ix_events_hot_* expression indexes match.
+    The comparison is jsonb to jsonb, so it agrees with `@>` (5 matches 5.0).
+    """
+    conds = [Event.props.contains(props_contains)]
+    for key in hot_props:
+        value = props_contains.get(key)
+        if not _hot_value(value):
+            continue
+        inline = literal(key, literal_execute=True)
+        conds.append(Event.props.has_key(inline))
+        # `->` spelled out: subscripting (props['key']) would not match the index expression
+        conds.append(Event.props.op("->", return_type=JSONB)(inline) == literal(value, JSONB))
+    return conds
+
+
+async def _hot_props(session: AsyncSession, project_id: str) -> List[str]:
+    row = await session.execute(select(Project.hot_props).where(Project.id == _uuid.UUID(project_id)))
+    return list(row.scalar() or [])
+
+
+def _filtered_query(
     project_id: str,
-    limit: int,
-    offset: int,
     name: Optional[List[str]] = None,
     user_id: Optional[str] = None,
     since: Optional[datetime] = None,
     until: Optional[datetime] = None,
     props_contains: Optional[Dict[str, Any]] = None,
+    hot_props: Sequence[str] = (),
 ):
     q = select(Event).where(Event.project_id == _uuid.UUID(project_id))
     if name:
@@ -53,10 +233,51 @@ async def list_events_offset(
     if until:
         q = q.where(Event.ts < until)
     if props_contains:
-        q = q.where(func.jsonb_contains(Event.props, props_contains))  # PG jsonb @> equivalent
+        q = q.where(*_props_filter(props_contains, hot_props))
+    return q
+
+
+def _keyset_query(
+    project_id: str,
+    limit: int,
+    after_ts: datetime,
+    after_id: str,
+    name: Optional[List[str]] = None,
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    props_contains: Optional[Dict[str, Any]] = None,
+    hot_props: Sequence[str] = (),
+):
+    """
+    Next page in (ts DESC, id DESC) order. The row-value comparison is a single range
+    condition on ix_events_project_ts_id (or the user/name variants), so PG walks the
+    index from the cursor instead of sorting; the plain `ts <= after_ts` bound also
+    prunes newer partitions.
+    """
+    q = _filtered_query(project_id, name, user_id, since, until, props_contains, hot_props)
+    return q.where(
+        Event.ts <= after_ts,
+        tuple_(Event.ts, Event.id) < tuple_(after_ts, _uuid.UUID(after_id)),
+    ).order_by(Event.ts.desc(), Event.id.desc()).limit(limit)
+
+
+async def list_events_offset(
+    session: AsyncSession,
+    project_id: str,
+    limit: int,
+    offset: int,
+    name: Optional[List[str]] = None,
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    props_contains: Optional[Dict[str, Any]] = None,
+):
+    hot = await _hot_props(session, project_id) if props_contains else ()
+    q = _filtered_query(project_id, name, user_id, since, until, props_contains, hot)
 
     # total count
-    count_q = q.with_only_columns(func.count()).order_by(None)
+    count_q = q.with_only_columns(func.count()).order_by(None).execution_options(nimbus_analytics=True)
     total = (await session.execute(count_q)).scalar() or 0
 
     # page
@@ -92,24 +313,8 @@ async def list_events_keyset(
     until: Optional[datetime] = None,
     props_contains: Optional[Dict[str, Any]] = None,
 ):
-    q = select(Event).where(Event.project_id == _uuid.UUID(project_id))
-    if name:
-        q = q.where(Event.name.in_(name))
-    if user_id:
-        q = q.where(Event.user_id == user_id)
-    if since:
-        q = q.where(Event.ts >= since)
-    if until:
-        q = q.where(Event.ts < until)
-    if props_contains:
-        q = q.where(func.jsonb_contains(Event.props, props_contains))
-
-    # keyset (ts DESC, id DESC)
-    q = q.where(
-        (Event.ts < after_ts) |
-        ((Event.ts == after_ts) & (Event.id < _uuid.UUID(after_id)))
-    ).order_by(Event.ts.desc(), Event.id.desc()).limit(limit)
-
+    hot = await _hot_props(session, project_id) if props_contains else ()
+    q = _keyset_query(project_id, limit, after_ts, after_id, name, user_id, since, until, props_contains, hot)
     rows = (await session.execute(q)).scalars().all()
     items = [
         {
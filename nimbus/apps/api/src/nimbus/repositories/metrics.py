@@ -1,42 +1,539 @@
-from typing import List, Dict
+import asyncio
+import datetime as dt
+import math
+from typing import List, Dict, Optional, Tuple
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from nimbus.sketches.ddsketch import DDSketch, log_gamma
+from nimbus.sketches.hll import DEFAULT_PRECISION, HyperLogLog, relative_error
+
+# Bucket widths; buckets are aligned to the Unix epoch (date_bin's origin below)
+BUCKET_SECONDS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "1d": 86400}
+
+# Finest nimbus_worker rollup each bucket width can be summed from
+_ROLLUP_GRANULARITY = {"1m": "minute", "5m": "minute", "15m": "minute", "1h": "hour", "1d": "day"}
+_GRANULARITY_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+_EPOCH = dt.datetime(1970, 1, 1)
+
+# Bucket widths nimbus_worker keeps sketches for (users.unique, props quantiles)
+SKETCH_BUCKETS = {"1h": "hour", "1d": "day"}
+
+# Every bucket in [start, end) appears once, zero-filled; counts only ever look at
+# ts in [since, until), so the scan is bounded by the window being charted.
+# SQLite has neither date_bin nor generate_series: bucket on epoch seconds and
+# enumerate the buckets with a recursive CTE instead.
 _SQLITE_Q = """
-SELECT
-  strftime('%Y-%m-%dT%H:00:00Z', ts) as ts,
-  COUNT(*) as value
-FROM events
-WHERE project_id = :project_id
-GROUP BY 1
-ORDER BY 1 DESC
-LIMIT :limit
+WITH RECURSIVE buckets(bucket) AS (
+    SELECT :start
+    UNION ALL
+    SELECT bucket + :step FROM buckets WHERE bucket + :step < :end
+),
+counts AS (
+    SELECT CAST(strftime('%s', ts) AS INTEGER) / :step * :step AS bucket, COUNT(*) AS n
+    FROM events
+    WHERE project_id = :project_id AND ts >= :since AND ts < :until
+    GROUP BY 1
+)
+SELECT strftime('%Y-%m-%dT%H:%M:00Z', b.bucket, 'unixepoch') AS ts,
+       COALESCE(c.n, 0) AS value
+FROM buckets b LEFT JOIN counts c ON c.bucket = b.bucket
+ORDER BY b.bucket
+"""
+
+_PG_GAP_FILL = """
+SELECT to_char(b.bucket, 'YYYY-MM-DD"T"HH24:MI:00"Z"') AS ts,
+       COALESCE(c.n, 0)::int AS value
+FROM generate_series(CAST(:start AS timestamp), CAST(:last AS timestamp), CAST(:step AS interval)) AS b(bucket)
+LEFT JOIN counts c ON c.bucket = b.bucket
+ORDER BY b.bucket
 """
 
 _PG_Q = """
-SELECT to_char(date_trunc(:bucket, ts), 'YYYY-MM-DD"T"HH24:00:00"Z"') AS ts,
-       COUNT(*)::int AS value
+WITH counts AS (
+    SELECT date_bin(CAST(:step AS interval), ts, TIMESTAMP '1970-01-01') AS bucket, COUNT(*) AS n
+    FROM events
+    WHERE project_id = :project_id AND ts >= :since AND ts < :until
+    GROUP BY 1
+)
+""" + _PG_GAP_FILL
+
+# Whole rollup buckets in [full_lo, full_hi) come from nimbus_worker's rollups. Raw
+# events fill in the rest: the partial rollup buckets at either edge of an unaligned
+# window, and whatever was inserted after the worker's watermark (found through
+# ix_events_created_at). The three raw branches never overlap, so nothing is
+# counted twice.
+_PG_ROLLUP_Q = """
+WITH parts AS (
+    SELECT date_bin(CAST(:step AS interval), bucket_start, TIMESTAMP '1970-01-01') AS bucket, count AS n
+    FROM event_rollups
+    WHERE project_id = :project_id AND granularity = :granularity
+      AND bucket_start >= :full_lo AND bucket_start < :full_hi
+    UNION ALL
+    SELECT date_bin(CAST(:step AS interval), ts, TIMESTAMP '1970-01-01'), 1
+    FROM events
+    WHERE project_id = :project_id AND ts >= :since AND ts < :full_lo
+    UNION ALL
+    SELECT date_bin(CAST(:step AS interval), ts, TIMESTAMP '1970-01-01'), 1
+    FROM events
+    WHERE project_id = :project_id AND ts >= :full_hi AND ts < :until
+    UNION ALL
+    SELECT date_bin(CAST(:step AS interval), ts, TIMESTAMP '1970-01-01'), 1
+    FROM events
+    WHERE project_id = :project_id AND ts >= :full_lo AND ts < :full_hi AND created_at >= CAST(:watermark AS timestamptz)
+),
+counts AS (
+    SELECT bucket, SUM(n) AS n FROM parts GROUP BY bucket
+)
+""" + _PG_GAP_FILL
+
+_WATERMARK_Q = "SELECT processed_until FROM rollup_watermarks WHERE name = 'events'"
+
+# Breakdowns: the top `top` keys by count, then everything else folded into one
+# `other` row, so the result never exceeds top + 2 rows (a NULL key counts events
+# without the dimension). {counts} yields (key, n) rows.
+_BREAKDOWN_TOP = """
+WITH counts AS (
+    SELECT key, SUM(n) AS n FROM ({counts}) c GROUP BY key
+),
+ranked AS (
+    SELECT key, n, row_number() OVER (ORDER BY n DESC, key IS NULL, key) AS rn FROM counts
+)
+SELECT CASE WHEN rn <= :top THEN key END AS key,
+       rn > :top AS other,
+       SUM(n) AS value
+FROM ranked
+GROUP BY 1, 2
+ORDER BY MIN(rn)
+"""
+
+_BREAKDOWN_RAW = """
+SELECT {dimension} AS key, COUNT(*) AS n
 FROM events
-WHERE project_id = :project_id
+WHERE project_id = :project_id AND ts >= :since AND ts < :until
 GROUP BY 1
-ORDER BY 1 DESC
-LIMIT :limit
 """
 
-async def fetch_metrics(session: AsyncSession, project_id: str, bucket: str = "1h", limit: int = 24) -> List[Dict]:
+# by=name from hourly rollups, with the same raw edges/tail as _PG_ROLLUP_Q
+_BREAKDOWN_NAME_ROLLUP = """
+SELECT name AS key, count AS n
+FROM event_rollups
+WHERE project_id = :project_id AND granularity = 'hour' AND bucket_start >= :full_lo AND bucket_start < :full_hi
+UNION ALL
+SELECT name, 1 FROM events WHERE project_id = :project_id AND ts >= :since AND ts < :full_lo
+UNION ALL
+SELECT name, 1 FROM events WHERE project_id = :project_id AND ts >= :full_hi AND ts < :until
+UNION ALL
+SELECT name, 1 FROM events
+WHERE project_id = :project_id AND ts >= :full_lo AND ts < :full_hi AND created_at >= CAST(:watermark AS timestamptz)
+"""
+
+_DIMENSIONS = {
+    "postgresql": {"name": "name", "user_id": "user_id", "props": "props ->> :prop_key"},
+    "sqlite": {"name": "name", "user_id": "user_id", "props": "json_extract(props, '$.\"' || :prop_key || '\"')"},
+}
+
+
+# users.unique: HyperLogLog registers from nimbus_worker's user_sketches for whole
+# buckets at or before the watermark, and from raw events for unaligned edges and the
+# tail after it. The derivation matches nimbus_worker.rollups._SKETCH_REGISTERS;
+# merging is a register-wise max, so a raw event that is also in a stored sketch
+# is harmless.
+_UNIQUE_SKETCHES = """
+SELECT bucket_start, registers
+FROM user_sketches
+WHERE project_id = :project_id AND granularity = :granularity AND bucket_start >= :full_lo AND bucket_start < :full_hi
+"""
+
+_UNIQUE_RAW = """
+WITH h AS (
+    SELECT date_bin(CAST(:step AS interval), ts, TIMESTAMP '1970-01-01') AS bucket,
+           hashtextextended(user_id, 0)::bit(64) AS bits
+    FROM events
+    WHERE project_id = :project_id AND user_id IS NOT NULL AND ts >= :since AND ts < :until
+      AND (ts < :full_lo OR ts >= :full_hi OR created_at >= CAST(:watermark AS timestamptz))
+)
+SELECT bucket, substring(bits from 1 for {p})::bit({p})::int AS idx,
+       max(COALESCE(NULLIF(position(B'1' in substring(bits from {p} + 1)), 0), {rho_max})) AS rho
+FROM h
+GROUP BY 1, 2
+""".format(p=DEFAULT_PRECISION, rho_max=64 - DEFAULT_PRECISION + 1)
+
+# Exact on SQLite (tests, local runs): distinct users per bucket, unioned in Python
+_UNIQUE_SQLITE = """
+SELECT DISTINCT CAST(strftime('%s', ts) AS INTEGER) / :step * :step AS bucket, user_id
+FROM events
+WHERE project_id = :project_id AND user_id IS NOT NULL AND ts >= :since AND ts < :until
+"""
+
+
+# props.<key>.pNN: DDSketch bins from nimbus_worker's prop_sketch_bins for whole
+# buckets, raw events for the edges and the tail after the watermark, split like
+# _PG_ROLLUP_Q so no event is counted twice. Bins add up across names and buckets.
+# Until the worker has built a newly declared key's bins from its history (it is
+# then listed in numeric_props_folded), the key is read from raw events only.
+# Numbers outside float8's range are skipped like nimbus_worker skips them.
+_PROP_FOLDED_Q = "SELECT CAST(numeric_props_folded AS jsonb) @> to_jsonb(CAST(:prop AS text)) FROM projects WHERE id = :project_id"
+
+_PROP_BINS = """
+SELECT bucket, sign, bin, sum(n) AS n FROM (
+    SELECT bucket_start AS bucket, sign, bin, count AS n
+    FROM prop_sketch_bins
+    WHERE project_id = :project_id AND prop = :prop AND granularity = :granularity
+      AND bucket_start >= :full_lo AND bucket_start < :full_hi {name_filter}
+    UNION ALL
+    SELECT bucket, sign(x)::smallint, CASE WHEN x = 0 THEN 0 ELSE ceil(ln(abs(x)) / :log_gamma)::int END, 1
+    FROM (
+        SELECT date_bin(CAST(:step AS interval), ts, TIMESTAMP '1970-01-01') AS bucket, (props ->> :prop)::float8 AS x
+        FROM events
+        WHERE project_id = :project_id AND ts >= :since AND ts < :until {name_filter}
+          AND (ts < :full_lo OR ts >= :full_hi OR created_at >= CAST(:watermark AS timestamptz))
+          AND jsonb_typeof(props -> :prop) = 'number'
+          AND props -> :prop BETWEEN '-1e308'::jsonb AND '1e308'::jsonb
+          AND (props -> :prop = '0'::jsonb OR NOT props -> :prop BETWEEN '-1e-307'::jsonb AND '1e-307'::jsonb)
+    ) raw
+) parts
+GROUP BY 1, 2, 3
+"""
+
+_PROP_VALUES_SQLITE = """
+SELECT CAST(strftime('%s', ts) AS INTEGER) / :step * :step AS bucket, json_extract(props, '$."' || :prop || '"') AS x
+FROM events
+WHERE project_id = :project_id AND ts >= :since AND ts < :until {name_filter}
+  AND json_type(props, '$."' || :prop || '"') IN ('integer', 'real')
+"""
+
+
+def _naive_utc(value: dt.datetime) -> dt.datetime:
+    """events.ts is naive UTC; convert aware datetimes to match."""
+    if value.tzinfo is not None:
+        value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def floor_bucket(value: dt.datetime, step: int) -> dt.datetime:
+    """Start of the epoch-aligned `step`-second bucket containing `value`."""
+    return _EPOCH + dt.timedelta(seconds=(value - _EPOCH) // dt.timedelta(seconds=step) * step)
+
+
+def _ceil(value: dt.datetime, step: int) -> dt.datetime:
+    floor = floor_bucket(value, step)
+    return floor if floor == value else floor + dt.timedelta(seconds=step)
+
+
+def bucket_window(
+    bucket: str,
+    limit: int,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+) -> Tuple[dt.datetime, dt.datetime, dt.datetime, dt.datetime]:
+    """
+    (start, end, since, until) for a series of at most `limit` buckets.
+
+    [start, end) are the bucket boundaries to emit; [since, until) bounds the events
+    counted. `until` defaults to the end of the current bucket and `since` to `limit`
+    buckets before it. An explicit range wider than `limit` buckets keeps the most
+    recent ones, as the unbounded query's LIMIT used to.
+    """
+    step = BUCKET_SECONDS[bucket]
+    if until is None:
+        until = floor_bucket(dt.datetime.now(dt.timezone.utc).replace(tzinfo=None), step) + dt.timedelta(seconds=step)
+    until = _naive_utc(until)
+    end = _ceil(until, step)
+    start = end - dt.timedelta(seconds=step * max(limit, 1))
+    if since is not None:
+        since = _naive_utc(since)
+        start = max(start, floor_bucket(since, step))
+    if since is None or since < start:
+        since = start
+    return start, end, since, until
+
+
+async def fetch_metrics(
+    session: AsyncSession,
+    project_id: str,
+    bucket: str = "1h",
+    limit: int = 24,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+) -> List[Dict]:
     import uuid
-    # Convert bucket format (1h -> hour, 1d -> day, 1m -> minute, etc.)
-    bucket_map = {"1m": "minute", "5m": "minute", "15m": "minute", "1h": "hour", "1d": "day"}
-    pg_bucket = bucket_map.get(bucket, "hour")
-    
+    bucket = bucket if bucket in BUCKET_SECONDS else "1h"
+    step = BUCKET_SECONDS[bucket]
+
     # Convert project_id string to UUID
     try:
         project_uuid = uuid.UUID(project_id)
     except:
         return []
-    
+
+    start, end, since, until = bucket_window(bucket, limit, since, until)
+    if since >= until:
+        return []
     if session.bind and session.bind.dialect.name == "postgresql":
-        rows = (await session.execute(text(_PG_Q), {"project_id": project_uuid, "bucket": pg_bucket, "limit": limit})).mappings().all()
+        params = {
+            "project_id": project_uuid,
+            "step": dt.timedelta(seconds=step),
+            "start": start,
+            "last": end - dt.timedelta(seconds=step),
+            "since": since,
+            "until": until,
+        }
+        # No watermark: the worker has not run yet or is rebuilding; count raw events
+        watermark = (await session.execute(text(_WATERMARK_Q))).scalar()
+        if watermark is None:
+            rows = (await session.execute(text(_PG_Q).execution_options(nimbus_analytics=True), params)).mappings().all()
+        else:
+            granularity = _ROLLUP_GRANULARITY[bucket]
+            full_lo = _ceil(since, _GRANULARITY_SECONDS[granularity])
+            full_hi = floor_bucket(until, _GRANULARITY_SECONDS[granularity])
+            if full_lo >= full_hi:
+                # Window narrower than one rollup bucket: all raw
+                full_lo = full_hi = until
+            rows = (await session.execute(text(_PG_ROLLUP_Q).execution_options(nimbus_analytics=True), {
+                **params, "granularity": granularity, "full_lo": full_lo, "full_hi": full_hi, "watermark": watermark,
+            })).mappings().all()
     else:
-        rows = (await session.execute(text(_SQLITE_Q), {"project_id": str(project_uuid), "limit": limit})).mappings().all()
-    return list(reversed([dict(r) for r in rows]))
+        rows = (await session.execute(text(_SQLITE_Q).execution_options(nimbus_analytics=True), {
+            # Uuid columns are stored as 32-char hex off PostgreSQL
+            "project_id": project_uuid.hex,
+            "step": step,
+            "start": int((start - _EPOCH).total_seconds()),
+            "end": int((end - _EPOCH).total_seconds()),
+            "since": since.isoformat(sep=" "),
+            "until": until.isoformat(sep=" "),
+        })).mappings().all()
+    return [dict(r) for r in rows]
+
+
+async def fetch_breakdown(
+    session: AsyncSession,
+    project_id: str,
+    by: str,
+    top: int,
+    since: dt.datetime,
+    until: dt.datetime,
+) -> Dict:
+    """
+    Event counts in [since, until) grouped by `by` ("name", "user_id" or
+    "props.<key>"): {"groups": [{"key", "value"}] (top first), "other", "total"}.
+    """
+    import uuid
+    project_uuid = uuid.UUID(project_id)
+    since, until = _naive_utc(since), _naive_utc(until)
+    dialect = "postgresql" if session.bind and session.bind.dialect.name == "postgresql" else "sqlite"
+    dimension, _, prop_key = by.partition(".")
+    params = {
+        "project_id": project_uuid if dialect == "postgresql" else project_uuid.hex,
+        "since": since if dialect == "postgresql" else since.isoformat(sep=" "),
+        "until": until if dialect == "postgresql" else until.isoformat(sep=" "),
+        "top": top,
+        "prop_key": prop_key,
+    }
+    counts = _BREAKDOWN_RAW.format(dimension=_DIMENSIONS[dialect][dimension])
+    if dialect == "postgresql" and dimension == "name":
+        watermark = (await session.execute(text(_WATERMARK_Q))).scalar()
+        if watermark is not None:
+            full_lo, full_hi = _ceil(since, 3600), floor_bucket(until, 3600)
+            if full_lo >= full_hi:
+                full_lo = full_hi = until
+            counts = _BREAKDOWN_NAME_ROLLUP
+            params.update(full_lo=full_lo, full_hi=full_hi, watermark=watermark)
+
+    rows = (await session.execute(text(_BREAKDOWN_TOP.format(counts=counts)).execution_options(nimbus_analytics=True), params)).all()
+    groups = [{"key": None if key is None else str(key), "value": int(value)} for key, other, value in rows if not other]
+    other = sum(int(value) for _, is_other, value in rows if is_other)
+    return {"groups": groups, "other": other, "total": sum(g["value"] for g in groups) + other}
+
+
+def _rolling(items: List, width: int, union) -> List:
+    """
+    union(items[i - width + 1 .. i]) for every i, in O(len(items)) unions: per block
+    of `width` items, suffix unions from the block's end and prefix unions from its
+    start; each window is one block's suffix plus the next block's prefix.
+    """
+    if width == 1:
+        return list(items)
+    n = len(items)
+    prefix, suffix = [None] * n, [None] * n
+    for lo in range(0, n, width):
+        hi = min(lo + width, n)
+        prefix[lo] = items[lo]
+        for i in range(lo + 1, hi):
+            prefix[i] = union(prefix[i - 1], items[i])
+        suffix[hi - 1] = items[hi - 1]
+        for i in range(hi - 2, lo - 1, -1):
+            suffix[i] = union(items[i], suffix[i + 1])
+    return [
+        prefix[i] if (i + 1) % width == 0 else union(suffix[i - width + 1], prefix[i])
+        for i in range(width - 1, n)
+    ]
+
+
+def _rolling_estimates(per_bucket: List[HyperLogLog], rolling: int) -> Tuple[List[int], int]:
+    """Estimates of the rolling unions, and of the union of the buckets from `rolling - 1` on."""
+    points = _rolling(per_bucket, rolling, lambda a, b: HyperLogLog(registers=a.registers).merge(b))
+    return [len(h) for h in points], len(HyperLogLog.union(per_bucket[rolling - 1:]))
+
+
+async def fetch_unique_users(
+    session: AsyncSession,
+    project_id: str,
+    bucket: str = "1h",
+    limit: int = 24,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    rolling: int = 1,
+) -> Dict:
+    """
+    Distinct user_ids per bucket (1h or 1d) as {"series", "total", "error"}. Each
+    point counts the users of its bucket and the `rolling - 1` before it; `total`
+    the users of the whole window. `error` is the relative standard error of the
+    estimates (0 where they are exact).
+    """
+    import uuid
+    bucket = bucket if bucket in SKETCH_BUCKETS else "1h"
+    step = BUCKET_SECONDS[bucket]
+    try:
+        project_uuid = uuid.UUID(project_id)
+    except ValueError:
+        return {"series": [], "total": 0, "error": 0.0}
+
+    start, end, since, until = bucket_window(bucket, limit, since, until)
+    if since >= until:
+        return {"series": [], "total": 0, "error": 0.0}
+    back = dt.timedelta(seconds=step * (rolling - 1))
+    # Buckets read: the window plus the rolling-1 before its first point
+    first = start - back
+    n_read = (end - first) // dt.timedelta(seconds=step)
+    buckets = [first + dt.timedelta(seconds=step * i) for i in range(n_read)]
+    labels = [b.strftime("%Y-%m-%dT%H:%M:00Z") for b in buckets[rolling - 1:]]
+
+    if not (session.bind and session.bind.dialect.name == "postgresql"):
+        users: Dict[int, set] = {}
+        rows = await session.execute(text(_UNIQUE_SQLITE).execution_options(nimbus_analytics=True), {
+            "project_id": project_uuid.hex,
+            "step": step,
+            "since": (since - back).isoformat(sep=" "),
+            "until": until.isoformat(sep=" "),
+        })
+        for b, user_id in rows:
+            users.setdefault(b, set()).add(user_id)
+        sets = [users.get(int((b - _EPOCH).total_seconds()), set()) for b in buckets]
+        points = _rolling(sets, rolling, lambda a, b: a | b)
+        return {
+            "series": [{"ts": ts, "value": len(u)} for ts, u in zip(labels, points)],
+            "total": len(set().union(*sets[rolling - 1:])),
+            "error": 0.0,
+        }
+
+    watermark = (await session.execute(text(_WATERMARK_Q))).scalar()
+    full_lo, full_hi = _ceil(since - back, step), floor_bucket(until, step)
+    if watermark is None or full_lo >= full_hi:
+        # Everything from raw events
+        full_lo = full_hi = until
+        watermark = dt.datetime.min
+    params = {"project_id": project_uuid, "full_lo": full_lo, "full_hi": full_hi}
+    sketches = {
+        b: HyperLogLog.from_bytes(registers)
+        for b, registers in await session.execute(
+            text(_UNIQUE_SKETCHES).execution_options(nimbus_analytics=True), {**params, "granularity": SKETCH_BUCKETS[bucket]}
+        )
+    }
+    rows = await session.execute(text(_UNIQUE_RAW).execution_options(nimbus_analytics=True), {
+        **params, "step": dt.timedelta(seconds=step), "since": since - back, "until": until, "watermark": watermark,
+    })
+    for b, idx, rho in rows:
+        if b not in sketches:
+            sketches[b] = HyperLogLog()
+        sketches[b].offer(idx, rho)
+
+    empty = HyperLogLog()
+    per_bucket = [sketches.get(b, empty) for b in buckets]
+    # Thousands of 16 KiB merges and estimates for long windows: keep them off the event loop
+    values, total = await asyncio.to_thread(_rolling_estimates, per_bucket, rolling)
+    return {
+        "series": [{"ts": ts, "value": v} for ts, v in zip(labels, values)],
+        "total": total,
+        "error": relative_error(),
+    }
+
+
+async def fetch_prop_quantiles(
+    session: AsyncSession,
+    project_id: str,
+    prop: str,
+    q: float,
+    bucket: str = "1h",
+    limit: int = 24,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    name: Optional[str] = None,
+) -> Dict:
+    """
+    The q-quantile of numeric `props[prop]` per bucket (1h or 1d; null when a bucket
+    has no values) as {"series", "total", "error"}: `total` over the whole window,
+    `error` the relative accuracy of every value. Only events named `name` if given.
+    """
+    import uuid
+    bucket = bucket if bucket in SKETCH_BUCKETS else "1h"
+    step = BUCKET_SECONDS[bucket]
+    empty = {"series": [], "total": None, "error": 0.0}
+    try:
+        project_uuid = uuid.UUID(project_id)
+    except ValueError:
+        return empty
+    start, end, since, until = bucket_window(bucket, limit, since, until)
+    if since >= until:
+        return empty
+    buckets = [start + dt.timedelta(seconds=step * i) for i in range((end - start) // dt.timedelta(seconds=step))]
+    sketches: Dict[dt.datetime, DDSketch] = {}
+    name_filter = "AND name = :name" if name is not None else ""
+
+    if session.bind and session.bind.dialect.name == "postgresql":
+        watermark = (await session.execute(text(_WATERMARK_Q))).scalar()
+        folded = (await session.execute(text(_PROP_FOLDED_Q), {"prop": prop, "project_id": project_uuid})).scalar()
+        full_lo, full_hi = _ceil(since, step), floor_bucket(until, step)
+        if watermark is None or not folded or full_lo >= full_hi:
+            full_lo = full_hi = until
+            watermark = dt.datetime.min
+        rows = await session.execute(text(_PROP_BINS.format(name_filter=name_filter)).execution_options(nimbus_analytics=True), {
+            "project_id": project_uuid,
+            "prop": prop,
+            "name": name,
+            "granularity": SKETCH_BUCKETS[bucket],
+            "step": dt.timedelta(seconds=step),
+            "since": since,
+            "until": until,
+            "full_lo": full_lo,
+            "full_hi": full_hi,
+            "watermark": watermark,
+            "log_gamma": log_gamma(),
+        })
+        for b, sign, bin, n in rows:
+            sketches.setdefault(b, DDSketch()).add_bin(sign, bin, int(n))
+    else:
+        rows = await session.execute(text(_PROP_VALUES_SQLITE.format(name_filter=name_filter)).execution_options(nimbus_analytics=True), {
+            # Uuid columns are stored as 32-char hex off PostgreSQL
+            "project_id": project_uuid.hex,
+            "prop": prop,
+            "name": name,
+            "step": step,
+            "since": since.isoformat(sep=" "),
+            "until": until.isoformat(sep=" "),
+        })
+        for b, x in rows:
+            x = float(x)
+            if math.isfinite(x):
+                sketches.setdefault(_EPOCH + dt.timedelta(seconds=b), DDSketch()).add(x)
+
+    total = DDSketch.union(sketches.values())
+    return {
+        "series": [
+            {"ts": b.strftime("%Y-%m-%dT%H:%M:00Z"), "value": sketches[b].quantile(q) if b in sketches else None}
+            for b in buckets
+        ],
+        "total": total.quantile(q),
+        "error": total.alpha,
+    }
@@ -9,6 +9,7 @@ from sqlalchemy import select, func, update, delete, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from nimbus.models.project import Project
+from nimbus.security.key_cache import invalidate_on_commit
 
 # --- helpers ---------------------------------------------------------------
 
@@ -74,6 +75,8 @@ async def list_projects(session: AsyncSession, limit: int = 50, offset: int = 0)
         "id": str(p.id),
         "name": p.name,
         "api_key_id": p.api_key_id,
+        "hot_props": list(p.hot_props or []),
+        "numeric_props": list(p.numeric_props or []),
         "created_at": p.created_at,
         "updated_at": p.updated_at,
     } for p in rows]
@@ -88,29 +91,47 @@ async def get_project(session: AsyncSession, project_id: str) -> Optional[Dict]:
         "id": str(obj.id),
         "name": obj.name,
         "api_key_id": obj.api_key_id,
+        "hot_props": list(obj.hot_props or []),
+        "numeric_props": list(obj.numeric_props or []),
         "created_at": obj.created_at,
         "updated_at": obj.updated_at,
     }
 
-async def update_project(session: AsyncSession, project_id: str, name: Optional[str]) -> Optional[Dict]:
-    if name is None:
+async def update_project(
+    session: AsyncSession,
+    project_id: str,
+    name: Optional[str],
+    hot_props: Optional[List[str]] = None,
+    numeric_props: Optional[List[str]] = None,
+) -> Optional[Dict]:
+    values: Dict = {}
+    if name is not None:
+        values["name"] = name
+    if hot_props is not None:
+        values["hot_props"] = list(dict.fromkeys(hot_props))
+    if numeric_props is not None:
+        values["numeric_props"] = list(dict.fromkeys(numeric_props))
+    if not values:
         return await get_project(session, project_id)
 
+    projects = Project.__table__
     stmt = (
-        update(Project)
-        .where(Project.id == uuid.UUID(project_id))
-        .values(name=name)
-        .returning(Project)
+        update(projects)
+        .where(projects.c.id == uuid.UUID(project_id))
+        .values(**values)
+        .returning(projects.c.id, projects.c.name, projects.c.api_key_id, projects.c.hot_props, projects.c.numeric_props, projects.c.created_at, projects.c.updated_at)
     )
-    obj = (await session.execute(stmt)).scalars().first()
-    if not obj:
+    row = (await session.execute(stmt)).first()
+    if not row:
         return None
     return {
-        "id": str(obj.id),
-        "name": obj.name,
-        "api_key_id": obj.api_key_id,
-        "created_at": obj.created_at,
-        "updated_at": obj.updated_at,
+        "id": str(row.id),
+        "name": row.name,
+        "api_key_id": row.api_key_id,
+        "hot_props": list(row.hot_props or []),
+        "numeric_props": list(row.numeric_props or []),
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
     }
 
 async def rotate_project_key(session: AsyncSession, project_id: str) -> Optional[tuple[Dict, str, str]]:
@@ -118,25 +139,38 @@ async def rotate_project_key(session: AsyncSession, project_id: str) -> Optional
     api_key_secret = _new_key_secret()
     api_key_hash = _hash_secret(api_key_secret)
 
+    old_key_id = (
+        await session.execute(select(Project.api_key_id).where(Project.id == uuid.UUID(project_id)))
+    ).scalar_one_or_none()
+    if old_key_id is None:
+        return None
+
+    # Core UPDATE with explicit columns: RETURNING the ORM entity leaves the onupdate
+    # updated_at expired, and lazy-loading it is not allowed under asyncio
+    projects = Project.__table__
     stmt = (
-        update(Project)
-        .where(Project.id == uuid.UUID(project_id))
+        update(projects)
+        .where(projects.c.id == uuid.UUID(project_id))
         .values(api_key_id=api_key_id, api_key_hash=api_key_hash)
-        .returning(Project)
+        .returning(projects.c.id, projects.c.name, projects.c.api_key_id, projects.c.created_at, projects.c.updated_at)
     )
-    obj = (await session.execute(stmt)).scalars().first()
-    if not obj:
+    row = (await session.execute(stmt)).first()
+    if not row:
         return None
+    invalidate_on_commit(session, old_key_id, api_key_id)
     out = {
-        "id": str(obj.id),
-        "name": obj.name,
-        "api_key_id": obj.api_key_id,
-        "created_at": obj.created_at,
-        "updated_at": obj.updated_at,
+        "id": str(row.id),
+        "name": row.name,
+        "api_key_id": row.api_key_id,
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
     }
     return out, api_key_id, api_key_secret
 
 async def delete_project(session: AsyncSession, project_id: str) -> bool:
-    stmt = delete(Project).where(Project.id == uuid.UUID(project_id))
-    res = await session.execute(stmt)
-    return res.rowcount > 0
+    projects = Project.__table__
+    stmt = delete(projects).where(projects.c.id == uuid.UUID(project_id)).returning(projects.c.api_key_id)
+    key_ids = (await session.execute(stmt)).scalars().all()
+    if key_ids:
+        invalidate_on_commit(session, *key_ids)
+    return bool(key_ids)
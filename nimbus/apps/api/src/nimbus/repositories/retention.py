@@ -0,0 +1,182 @@
+"""
+Retention cohorts from nimbus_worker's user_first_seen and user_activity tables.
+
+Users are placed in the cohort of the period (UTC day, or ISO week starting
+Monday) holding their first event ever, and counted as retained in every later
+period they had any event in. The tables cover events inserted before the rollup
+watermark; events inserted since are read raw (through ix_events_created_at) and
+merged per user, the same split /v1/metrics uses, so results are never behind
+ingest. Users without such events are counted per (cohort, period) in SQL; only
+the few with a tail are loaded and merged here, off the event loop. Without a
+watermark (the worker has not run yet, or is rebuilding) and on SQLite
+everything is read raw.
+"""
+import asyncio
+import datetime as dt
+import uuid
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from nimbus.repositories.metrics import _WATERMARK_Q
+
+PERIOD_DAYS = {"day": 1, "week": 7}
+
+# Monday, so weeks line up with date_trunc('week')
+_ORIGIN = dt.date(1970, 1, 5)
+
+# Cohort users (first seen in [lo, hi)) without tail events, per (cohort, active
+# period) index: day d of a month is bit d - 1 of its mask
+_COHORT_GRID = """
+SELECT (f.first_ts::date - :origin) / :period_days AS cohort,
+       (a.month + d.n - :origin) / :period_days AS period,
+       count(DISTINCT f.user_id)
+FROM user_first_seen f
+JOIN user_activity a ON a.project_id = f.project_id AND a.user_id = f.user_id
+CROSS JOIN generate_series(0, 30) AS d(n)
+WHERE f.project_id = :project_id AND f.first_ts >= :lo AND f.first_ts < :hi
+  AND a.month >= :month_lo AND a.month < :hi
+  AND a.days & (1 << d.n) <> 0 AND a.month + d.n >= :lo_date AND a.month + d.n < :hi_date
+  AND f.user_id <> ALL(CAST(:tail_users AS text[]))
+GROUP BY 1, 2
+"""
+
+# The same cohort users with tail events, with their active-day bitmasks in range
+_COHORT_ACTIVITY = """
+SELECT f.user_id, f.first_ts, a.month, a.days
+FROM user_first_seen f
+JOIN user_activity a ON a.project_id = f.project_id AND a.user_id = f.user_id
+WHERE f.project_id = :project_id AND f.first_ts >= :lo AND f.first_ts < :hi
+  AND a.month >= :month_lo AND a.month < :hi
+  AND f.user_id = ANY(CAST(:tail_users AS text[]))
+"""
+
+# Users with events inserted since the watermark, by active day, with the first
+# ts folded so far. Days before lo still matter: they can make a user older.
+_TAIL = {
+    "postgresql": """
+SELECT e.user_id, date_trunc('day', e.ts) AS day, min(f.first_ts) AS stored_first
+FROM events e
+LEFT JOIN user_first_seen f ON f.project_id = e.project_id AND f.user_id = e.user_id
+WHERE e.project_id = :project_id AND e.user_id IS NOT NULL AND e.created_at >= CAST(:watermark AS timestamptz) AND e.ts < :hi
+GROUP BY 1, 2
+""",
+    "sqlite": """
+SELECT user_id, date(ts) AS day, NULL AS stored_first
+FROM events
+WHERE project_id = :project_id AND user_id IS NOT NULL AND ts < :hi
+GROUP BY 1, 2
+""",
+}
+
+
+def period_index(day: dt.date, period: str) -> int:
+    return (day - _ORIGIN).days // PERIOD_DAYS[period]
+
+
+def period_start(index: int, period: str) -> dt.date:
+    return _ORIGIN + dt.timedelta(days=index * PERIOD_DAYS[period])
+
+
+def _as_date(value) -> dt.date:
+    if isinstance(value, str):
+        return dt.date.fromisoformat(value[:10])
+    if isinstance(value, dt.datetime):
+        return value.date()
+    return value
+
+
+def _month_days(month: dt.date, days: int):
+    d = 0
+    while days:
+        if days & 1:
+            yield month + dt.timedelta(days=d)
+        days >>= 1
+        d += 1
+
+
+def _merge_users(
+    grid: List[List[int]],
+    stored: List[Tuple],
+    tail: List[Tuple],
+    period: str,
+    first: int,
+    lo: dt.date,
+    hi: dt.date,
+) -> None:
+    """Add the users of the stored activity rows and tail rows to `grid`."""
+    # user_id -> [first day, active days in [lo, hi)]
+    users: Dict[str, Tuple[dt.date, Set[dt.date]]] = {}
+    for user_id, first_ts, month, days in stored:
+        entry = users.setdefault(user_id, (first_ts.date(), set()))
+        entry[1].update(d for d in _month_days(month, days) if lo <= d < hi)
+
+    for user_id, day, stored_first in tail:
+        day = _as_date(day)
+        entry = users.get(user_id)
+        if entry is None:
+            start = day if stored_first is None else min(day, stored_first.date())
+            entry = users[user_id] = (start, set())
+        elif day < entry[0]:
+            entry = users[user_id] = (day, entry[1])
+        if lo <= day:
+            entry[1].add(day)
+
+    for start, days in users.values():
+        if not lo <= start < hi:
+            continue
+        k = period_index(start, period) - first
+        for p in {period_index(d, period) - first for d in days}:
+            if p >= k:
+                grid[k][p - k] += 1
+
+
+async def fetch_retention(
+    session: AsyncSession,
+    project_id: str,
+    period: str,
+    first: int,
+    cohorts: int,
+) -> List[List[int]]:
+    """
+    Rows for the cohorts of periods first .. first + cohorts - 1 (period indexes):
+    row k holds the users of cohort k active in each period from its own (the
+    cohort size) to the last one.
+    """
+    try:
+        project_uuid = uuid.UUID(project_id)
+    except ValueError:
+        return [[0] * (cohorts - k) for k in range(cohorts)]
+    lo = period_start(first, period)
+    hi = period_start(first + cohorts, period)
+    lo_ts, hi_ts = dt.datetime.combine(lo, dt.time()), dt.datetime.combine(hi, dt.time())
+
+    grid = [[0] * (cohorts - k) for k in range(cohorts)]
+    stored: List[Tuple] = []
+    dialect = session.bind.dialect.name if session.bind else "postgresql"
+    if dialect == "postgresql":
+        params = {"project_id": project_uuid, "lo": lo_ts, "hi": hi_ts}
+        watermark = (await session.execute(text(_WATERMARK_Q))).scalar()
+        tail = (await session.execute(
+            text(_TAIL[dialect]).execution_options(nimbus_analytics=True),
+            {**params, "watermark": dt.datetime.min if watermark is None else watermark},
+        )).all()
+        if watermark is not None:
+            params.update(month_lo=lo.replace(day=1), tail_users=sorted({r[0] for r in tail}))
+            rows = await session.execute(text(_COHORT_GRID).execution_options(nimbus_analytics=True), {
+                **params, "origin": _ORIGIN, "period_days": PERIOD_DAYS[period], "lo_date": lo, "hi_date": hi,
+            })
+            for cohort, active, n in rows:
+                k, p = cohort - first, active - first
+                if 0 <= k <= p < cohorts:
+                    grid[k][p - k] += n
+            if params["tail_users"]:
+                stored = (await session.execute(text(_COHORT_ACTIVITY).execution_options(nimbus_analytics=True), params)).all()
+    else:
+        # Uuid columns are stored as 32-char hex off PostgreSQL
+        tail = (await session.execute(text(_TAIL["sqlite"]).execution_options(nimbus_analytics=True), {"project_id": project_uuid.hex, "hi": hi_ts.isoformat(sep=" ")})).all()
+
+    # Without a watermark the tail is every event in range: keep the loop free meanwhile
+    await asyncio.to_thread(_merge_users, grid, stored, tail, period, first, lo, hi)
+    return grid
@@ -1,58 +1,173 @@
 from __future__ import annotations
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
-from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from uuid import UUID
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 
 from nimbus.schemas.events import IngestRequest, IngestResponse
-from nimbus.security.hmac import verify_ingest_signature
-from nimbus.services.events import ingest_events
+from nimbus.content_encoding import iter_decoded, BodyTooLarge, UnsupportedEncoding, CorruptBody
+from nimbus.security.hmac import (
+    verify_ingest_signature,
+    verify_ingest_headers,
+    StreamingSignature,
+    SignedBodyRoute,
+    decode_error,
+)
+from nimbus.services.events import (
+    parse_ingest_body,
+    records_from_request,
+    insert_records,
+    ingest_ndjson,
+    list_events_page,
+    list_events_after,
+    LineTooLong,
+)
+from nimbus.services.admission import admit_ingest, admit_read
+from nimbus.services.ingest_buffer import get_ingest_buffer
+from nimbus.services.ingest_queue import enqueue_batch, QueueFull, QueueUnavailable
 from nimbus.db import get_session
 from nimbus.security.jwt import require_jwt
+from nimbus.security.rate_limit import limit_ingest, limit_ingest_stream, limit_reads
 from nimbus.settings import settings
-from nimbus.repositories.events import (
-    list_events_offset,
-    list_events_keyset,
-)
 
-router = APIRouter(prefix="/v1", tags=["events"])
+# SignedBodyRoute: accept gzip/zstd bodies, HMAC checked over the compressed bytes
+router = APIRouter(prefix="/v1", tags=["events"], route_class=SignedBodyRoute)
+
+
+
+def _inline_schema(model) -> Dict[str, Any]:
+    """JSON schema with $defs inlined, for request bodies documented via openapi_extra."""
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def _inline(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return _inline(defs[node["$ref"].rsplit("/", 1)[-1]])
+            return {k: _inline(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [_inline(v) for v in node]
+        return node
 
-# Rate limiter - enabled based on settings
-limiter = Limiter(key_func=get_remote_address) if settings.rate_limit_enabled else None
+    return _inline(schema)
 
 
-@router.post("/events", response_model=IngestResponse, summary="Ingest a batch of events (HMAC-signed)")
+@router.post(
+    "/events",
+    response_model=IngestResponse,
+    summary="Ingest a batch of events (HMAC-signed)",
+    # The body is parsed by parse_ingest_body, not by FastAPI, so document it by hand
+    openapi_extra={"requestBody": {"content": {"application/json": {"schema": _inline_schema(IngestRequest)}}, "required": True}},
+)
 async def ingest(
     request: Request,
-    payload: IngestRequest,
+    response: Response,
+    _admitted: None = Depends(admit_ingest),
     _sig_ok: bool = Depends(verify_ingest_signature),
+    _rate_ok: None = Depends(limit_ingest),
     session: AsyncSession = Depends(get_session),
 ):
-    # Apply rate limiting if enabled
-    if limiter and settings.rate_limit_enabled:
-        # Higher rate limit for ingestion endpoint
-        @limiter.limit(f"{settings.rate_limit_per_minute * 2}/minute")
-        async def _rate_limited_ingest(request: Request):
-            pass
-        await _rate_limited_ingest(request)
-
     import logging
+    # Single pass over the body: bytes were read (and HMAC'd) once by SignedBodyRequest,
+    # here they are parsed + validated once and shaped straight into table rows.
+    payload = parse_ingest_body(await request.body())
     if not payload.project_id:
         raise HTTPException(status_code=400, detail="Missing project_id")
-    if not payload.events or not isinstance(payload.events, list) or len(payload.events) == 0:
+    if not payload.events:
         raise HTTPException(status_code=400, detail="No events provided")
+    if UUID(payload.project_id) != request.state.ingest_project_id:
+        raise HTTPException(status_code=401, detail="project_id/kid mismatch")
+
+    records = records_from_request(payload)
+    if settings.ingest_mode != "direct":
+        if settings.ingest_mode == "buffered":
+            if not get_ingest_buffer().offer(records):
+                raise HTTPException(status_code=503, detail="Ingest buffer full", headers={"Retry-After": "1"})
+        else:
+            try:
+                await enqueue_batch(payload.project_id, records)
+            except QueueFull:
+                raise HTTPException(status_code=503, detail="Ingest queue full", headers={"Retry-After": "1"})
+            except QueueUnavailable as e:
+                logging.getLogger(__name__).error(f"Ingest queue unavailable: {e}")
+                raise HTTPException(status_code=503, detail="Ingest queue unavailable", headers={"Retry-After": "5"})
+        response.status_code = 202
+        return IngestResponse(accepted=len(records))
+
     try:
-        accepted = await ingest_events(session, payload.project_id, [e.model_dump() for e in payload.events])
-        logging.info(f"Ingested {accepted} events for project {payload.project_id}")
-        return IngestResponse(accepted=accepted)
+        accepted = await insert_records(session, records)
+        duplicates = len(records) - accepted
+        logging.info(f"Ingested {accepted} events for project {payload.project_id} ({duplicates} duplicates)")
+        return IngestResponse(
+            accepted=accepted,
+            rejected=duplicates,
+            errors=[f"{duplicates} duplicate events skipped (idempotency_key already ingested)"] if duplicates else [],
+        )
     except Exception as e:
         logger = logging.getLogger(__name__)
         logger.error(f"Ingestion error for project {payload.project_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Ingestion failed")
 
 
+@router.post(
+    "/events/stream",
+    response_model=IngestResponse,
+    summary="Stream-ingest NDJSON events without the 1000-event cap (HMAC-signed)",
+    openapi_extra={"requestBody": {"content": {"application/x-ndjson": {"schema": {"type": "string"}}}, "required": True}},
+)
+async def ingest_stream(
+    request: Request,
+    project_id: str = Query(..., description="Project UUID the events belong to"),
+    _admitted: None = Depends(admit_ingest),
+    signature: StreamingSignature = Depends(verify_ingest_headers),
+    _rate_ok: None = Depends(limit_ingest_stream),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    One JSON event per line, validated and bulk-inserted in chunks while the body is still
+    arriving, so memory stays bounded whatever the upload size. The HMAC is a running digest
+    over the streamed bytes; nothing is committed unless it matches at the end.
+    """
+    import logging
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in ("application/x-ndjson", "application/jsonl"):
+        raise HTTPException(status_code=415, detail="Content-Type must be application/x-ndjson")
+    if project_id != signature.project_id:
+        raise HTTPException(status_code=401, detail="project_id/kid mismatch")
+
+    # The signature covers the wire bytes; gzip/zstd bodies are decoded after signing,
+    # in pieces no longer than a line, and refused if they expand like a bomb
+    body = iter_decoded(
+        request.stream(),
+        request.headers.get("content-encoding"),
+        on_wire=signature.update,
+        piece=settings.ingest_stream_max_line_bytes,
+        max_ratio=settings.ingest_stream_max_ratio,
+    )
+
+    try:
+        result = await ingest_ndjson(session, project_id, body)
+        signature.verify()
+        await session.commit()
+    except LineTooLong as e:
+        await session.rollback()
+        raise HTTPException(status_code=413, detail=str(e))
+    except (UnsupportedEncoding, BodyTooLarge, CorruptBody) as e:
+        await session.rollback()
+        raise decode_error(e)
+    except HTTPException:
+        await session.rollback()
+        raise
+    except Exception as e:
+        await session.rollback()
+        logging.getLogger(__name__).error(f"Stream ingestion error for project {project_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Ingestion failed")
+
+    logging.info(f"Stream-ingested {result['accepted']} events for project {project_id} ({result['rejected']} rejected)")
+    return IngestResponse(**result)
+
+
 @router.get("/events", summary="List events (JWT protected) with filtering + pagination")
 async def get_events(
     request: Request,
@@ -68,15 +183,11 @@ async def get_events(
     offset: Optional[int] = Query(None, ge=0, description="Offset-based pagination"),
     after_ts: Optional[datetime] = Query(None, description="Keyset cursor timestamp"),
     after_id: Optional[str] = Query(None, description="Keyset cursor event id (uuid)"),
+    _admitted: None = Depends(admit_read),
     _claims: dict = Depends(require_jwt),
+    _rate_ok: None = Depends(limit_reads),
     session: AsyncSession = Depends(get_session),
 ):
-    # Apply rate limiting if enabled
-    if limiter and settings.rate_limit_enabled:
-        @limiter.limit(f"{settings.rate_limit_per_minute}/minute")
-        async def _rate_limited_get(request: Request):
-            pass
-        await _rate_limited_get(request)
 
     # parse props JSON if provided
     props_contains = None
@@ -103,7 +214,7 @@ async def get_events(
     if after_ts or after_id:
         if not (after_ts and after_id):
             raise HTTPException(status_code=400, detail="Provide both after_ts and after_id for keyset pagination")
-        items, next_cursor = await list_events_keyset(
+        items, next_cursor = await list_events_after(
             session,
             project_id=str(project_uuid),
             limit=limit,
@@ -119,7 +230,7 @@ async def get_events(
 
     # default: offset mode
     off = offset or 0
-    items, total = await list_events_offset(
+    items, total = await list_events_page(
         session,
         project_id=str(project_uuid),
         limit=limit,
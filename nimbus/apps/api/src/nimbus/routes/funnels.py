@@ -0,0 +1,59 @@
+import datetime as dt
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from nimbus.db import get_session
+from nimbus.schemas.funnels import FunnelRequest, FunnelResponse
+from nimbus.security.jwt import require_jwt
+from nimbus.security.rate_limit import limit_reads
+from nimbus.services.admission import admit_read
+from nimbus.services.funnels import get_funnel
+from nimbus.settings import settings
+
+router = APIRouter(prefix="/v1", tags=["funnels"])
+
+
+def _naive_utc(value: Optional[dt.datetime]) -> Optional[dt.datetime]:
+    """Request datetimes may carry an offset; events.ts is naive UTC."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+@router.post("/funnels", response_model=FunnelResponse, summary="Ordered-step conversion funnel (JWT protected)")
+async def funnel(
+    body: FunnelRequest,
+    _admitted: None = Depends(admit_read),
+    _claims: dict = Depends(require_jwt),
+    _rate_ok: None = Depends(limit_reads),
+    session: AsyncSession = Depends(get_session),
+):
+    try:
+        project_uuid = uuid.UUID(body.project_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid project_id (must be UUID)")
+    since, until = _naive_utc(body.since), _naive_utc(body.until)
+    if since is not None:
+        end = until or dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+        if since >= end:
+            raise HTTPException(status_code=400, detail="since must be before until")
+        if end - since > dt.timedelta(days=settings.funnel_max_range_days):
+            raise HTTPException(status_code=400, detail=f"Range exceeds {settings.funnel_max_range_days} days")
+    result = await get_funnel(
+        session,
+        project_id=str(project_uuid),
+        steps=[s.model_dump() for s in body.steps],
+        window_s=body.window_s,
+        since=since,
+        until=until,
+    )
+    return FunnelResponse(
+        project_id=str(project_uuid),
+        since=result["since"].isoformat() + "Z",
+        until=result["until"].isoformat() + "Z",
+        window_s=result["window_s"],
+        steps=result["steps"],
+    )
@@ -1,6 +1,10 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from nimbus import stats
 from nimbus.db import check_database_health
 from nimbus.cache import redis
+from nimbus.services.admission import admission
+from nimbus.settings import settings
 import time
 import logging
 
@@ -60,6 +64,27 @@ async def detailed_health():
             }
             # Don't mark as unhealthy - Redis is optional
     
+    # Write-behind buffer (informational)
+    if settings.ingest_mode == "buffered":
+        health_status["checks"]["ingest_buffer"] = {
+            "status": "ok",
+            **stats.snapshot("nimbus_ingest_buffer"),
+        }
+
+    # /v1/metrics result cache (informational)
+    if settings.metrics_cache_enabled:
+        health_status["checks"]["metrics_cache"] = {
+            "status": "ok",
+            **stats.snapshot("nimbus_metrics_cache"),
+        }
+
+    # Admission control (informational; shedding is by design, not a failure)
+    admission_state = admission.state()
+    health_status["checks"]["admission"] = {
+        "status": "ok" if admission_state["pressure_level"] == 0 else "warning",
+        **admission_state,
+    }
+
     # Update overall status
     health_status["status"] = "ok" if overall_healthy else "error"
     
@@ -78,3 +103,10 @@ async def kubernetes_health():
 async def readiness():
     """Readiness probe for Kubernetes"""
     return await detailed_health()
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus text exposition of in-process counters"""
+    if not settings.enable_metrics:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return PlainTextResponse(stats.render_prometheus(), media_type="text/plain; version=0.0.4")
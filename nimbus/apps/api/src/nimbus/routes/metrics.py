@@ -1,18 +1,50 @@
+import datetime as dt
+import re
+from typing import Optional
 from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from nimbus.schemas.metrics import MetricsResponse, SeriesPoint
+from nimbus.schemas.metrics import BreakdownResponse, LiveResponse, MetricsResponse, SeriesPoint, TopResponse
 from nimbus.security.jwt import require_jwt
-from nimbus.services.metrics import get_event_count_series
+from nimbus.security.rate_limit import limit_reads
+from nimbus.services.admission import admit_read
+from nimbus.services.live import live_series
+from nimbus.services.metrics import get_breakdown, get_event_count_series, get_prop_quantiles, get_top, get_unique_users
+from nimbus.repositories.projects import get_project
 from nimbus.db import get_session
+from nimbus.settings import settings
 
 router = APIRouter(prefix="/v1", tags=["metrics"])
 
-@router.get("/metrics", response_model=MetricsResponse, summary="Time series metrics (JWT protected)")
+_LIVE_STEPS = {"1s": 1, "10s": 10, "1m": 60}
+
+# props.<key>.pNN: the NNth percentile (p999: 99.9th) of a numeric prop
+_PROP_QUANTILE = re.compile(r"^props\.([A-Za-z0-9_.:-]{1,64})\.p(50|75|90|95|99|999)$")
+
+
+def _naive_utc(value: Optional[dt.datetime]) -> Optional[dt.datetime]:
+    """Query datetimes may carry an offset; events.ts is naive UTC."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+@router.get("/metrics", response_model=MetricsResponse, response_model_exclude_unset=True, summary="Time series metrics (JWT protected)")
 async def metrics(
     project_id: str,
+    metric: str = Query(
+        "events.count",
+        pattern=r"^(events\.count|users\.unique|props\.[A-Za-z0-9_.:-]{1,64}\.p(50|75|90|95|99|999))$",
+        description="events.count, users.unique or props.<key>.p50|p75|p90|p95|p99|p999 (key declared in the project's numeric_props)",
+    ),
     bucket: str = Query("1h", pattern=r"^(1m|5m|15m|1h|1d)$"),
     limit: int = Query(24, ge=1, le=1000),
+    since: Optional[dt.datetime] = Query(None, description="Count events with ts >= since (ISO 8601, UTC if naive)"),
+    until: Optional[dt.datetime] = Query(None, description="Count events with ts < until; defaults to the end of the current bucket"),
+    rolling: int = Query(1, ge=1, le=90, description="users.unique: distinct users over each bucket and the rolling-1 before it"),
+    name: Optional[str] = Query(None, max_length=200, description="props quantiles: only events with this name"),
+    _admitted: None = Depends(admit_read),
     _claims: dict = Depends(require_jwt),
+    _rate_ok: None = Depends(limit_reads),
     session: AsyncSession = Depends(get_session),
 ):
     import uuid
@@ -20,5 +52,142 @@ async def metrics(
         project_uuid = uuid.UUID(project_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid project_id (must be UUID)")
-    series = await get_event_count_series(session, project_id=str(project_uuid), bucket=bucket, limit=limit)
+    since, until = _naive_utc(since), _naive_utc(until)
+    if since is not None and until is not None and since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    if metric != "events.count" and bucket not in ("1h", "1d"):
+        raise HTTPException(status_code=400, detail=f"{metric} supports bucket=1h or 1d")
+    if metric == "users.unique" and limit * rolling > settings.metrics_unique_max_limit_rolling:
+        raise HTTPException(
+            status_code=400, detail=f"limit * rolling must be at most {settings.metrics_unique_max_limit_rolling}"
+        )
+    quantile = _PROP_QUANTILE.match(metric)
+    if quantile:
+        prop, pct = quantile.groups()
+        project = await get_project(session, str(project_uuid))
+        if project is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        if prop not in project["numeric_props"]:
+            raise HTTPException(status_code=400, detail=f"props.{prop} is not in the project's numeric_props")
+        result = await get_prop_quantiles(
+            session, project_id=str(project_uuid), prop=prop, q=int(pct) / (1000 if pct == "999" else 100),
+            bucket=bucket, limit=limit, since=since, until=until, name=name,
+        )
+        return MetricsResponse(
+            metric=metric,
+            bucket=bucket,
+            series=[SeriesPoint(**p) for p in result["series"]],
+            total=result["total"],
+            error=result["error"],
+        )
+    if metric == "users.unique":
+        result = await get_unique_users(
+            session, project_id=str(project_uuid), bucket=bucket, limit=limit, since=since, until=until, rolling=rolling
+        )
+        return MetricsResponse(
+            metric=metric,
+            bucket=bucket,
+            series=[SeriesPoint(**p) for p in result["series"]],
+            rolling=rolling,
+            total=result["total"],
+            error=result["error"],
+        )
+    series = await get_event_count_series(session, project_id=str(project_uuid), bucket=bucket, limit=limit, since=since, until=until)
     return MetricsResponse(metric="events.count", bucket=bucket, series=[SeriesPoint(**p) for p in series])
+
+
+@router.get("/metrics/live", response_model=LiveResponse, summary="Events accepted per second over the last minutes, from memory (JWT protected)")
+async def live(
+    project_id: str,
+    minutes: int = Query(5, ge=1, le=120, description="Window length, at most live_window_minutes"),
+    bucket: str = Query("10s", pattern=r"^(1s|10s|1m)$"),
+    _admitted: None = Depends(admit_read),
+    _claims: dict = Depends(require_jwt),
+    _rate_ok: None = Depends(limit_reads),
+):
+    import uuid
+    try:
+        project_uuid = uuid.UUID(project_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid project_id (must be UUID)")
+    if not settings.live_enabled:
+        raise HTTPException(status_code=404, detail="Live counters are disabled")
+    if minutes > settings.live_window_minutes:
+        raise HTTPException(status_code=400, detail=f"minutes must be at most {settings.live_window_minutes}")
+    result = await live_series(str(project_uuid), minutes, _LIVE_STEPS[bucket])
+    return LiveResponse(
+        metric="events.live",
+        bucket=bucket,
+        series=[SeriesPoint(**p) for p in result["series"]],
+        total=result["total"],
+        as_of=result["as_of"],
+    )
+
+
+@router.get("/metrics/breakdown", response_model=BreakdownResponse, summary="Event counts grouped by name, user or prop (JWT protected)")
+async def breakdown(
+    project_id: str,
+    by: str = Query("name", pattern=r"^(name|user_id|props\.[A-Za-z0-9_.:-]{1,64})$", description="name, user_id or props.<key>"),
+    top: int = Query(10, ge=1, le=100, description="Groups returned; the rest are summed into `other`"),
+    since: Optional[dt.datetime] = Query(None, description="Count events with ts >= since; defaults to 24h before until"),
+    until: Optional[dt.datetime] = Query(None, description="Count events with ts < until; defaults to now"),
+    _admitted: None = Depends(admit_read),
+    _claims: dict = Depends(require_jwt),
+    _rate_ok: None = Depends(limit_reads),
+    session: AsyncSession = Depends(get_session),
+):
+    import uuid
+    try:
+        project_uuid = uuid.UUID(project_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid project_id (must be UUID)")
+    since, until = _naive_utc(since), _naive_utc(until)
+    if since is not None and until is not None and since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    result = await get_breakdown(session, project_id=str(project_uuid), by=by, top=top, since=since, until=until)
+    return BreakdownResponse(
+        metric="events.count",
+        by=by,
+        since=result["since"].isoformat() + "Z",
+        until=result["until"].isoformat() + "Z",
+        groups=result["groups"],
+        other=result["other"],
+        total=result["total"],
+    )
+
+
+@router.get("/metrics/top", response_model=TopResponse, summary="Most frequent event names or prop values, from streaming summaries (JWT protected)")
+async def top(
+    project_id: str,
+    dimension: str = Query("name", pattern=r"^(name|props\.[A-Za-z0-9_.:-]{1,64})$", description="name, or props.<key> for a key in topk_props"),
+    k: int = Query(20, ge=1, le=100),
+    since: Optional[dt.datetime] = Query(None, description="Range start, rounded down to the hour; defaults to 24h before until"),
+    until: Optional[dt.datetime] = Query(None, description="Range end, rounded up to the hour; defaults to now"),
+    _admitted: None = Depends(admit_read),
+    _claims: dict = Depends(require_jwt),
+    _rate_ok: None = Depends(limit_reads),
+):
+    import uuid
+    try:
+        project_uuid = uuid.UUID(project_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid project_id (must be UUID)")
+    since, until = _naive_utc(since), _naive_utc(until)
+    if since is not None and until is not None and since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    if dimension != "name" and dimension[len("props."):] not in settings.topk_props:
+        raise HTTPException(status_code=400, detail=f"{dimension} is not summarized (see topk_props)")
+    if not settings.topk_enabled:
+        raise HTTPException(status_code=404, detail="Top-K summaries are disabled")
+    result = await get_top(str(project_uuid), dimension=dimension, k=k, since=since, until=until)
+    if result is None:
+        raise HTTPException(status_code=503, detail="Top-K summaries are unavailable (no Redis)")
+    return TopResponse(
+        dimension=dimension,
+        k=k,
+        since=result["since"].isoformat() + "Z",
+        until=result["until"].isoformat() + "Z",
+        items=result["items"],
+        total=result["total"],
+        error_bound=result["error_bound"],
+    )
@@ -67,7 +67,9 @@ async def update_project_endpoint(
     _claims: dict = Depends(require_jwt),
     session: AsyncSession = Depends(get_session),
 ):
-    project = await update_project(session, project_id, name=body.name)
+    project = await update_project(
+        session, project_id, name=body.name, hot_props=body.hot_props, numeric_props=body.numeric_props
+    )
     if not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
     await session.commit()
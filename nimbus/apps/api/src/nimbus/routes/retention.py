@@ -0,0 +1,42 @@
+import datetime as dt
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from nimbus.db import get_session
+from nimbus.schemas.retention import RetentionResponse
+from nimbus.security.jwt import require_jwt
+from nimbus.security.rate_limit import limit_reads
+from nimbus.services.admission import admit_read
+from nimbus.services.retention import get_retention
+
+router = APIRouter(prefix="/v1", tags=["retention"])
+
+
+@router.get("/retention", response_model=RetentionResponse, summary="Retention cohorts by first-seen period (JWT protected)")
+async def retention(
+    project_id: str,
+    period: str = Query("week", pattern=r"^(day|week)$", description="Cohort and retention period (UTC; weeks start on Monday)"),
+    cohorts: int = Query(8, ge=1, le=90, description="Number of cohorts (periods) in the grid"),
+    until: Optional[dt.datetime] = Query(None, description="End of the last period, rounded up to a period boundary; defaults to the start of the current one"),
+    _admitted: None = Depends(admit_read),
+    _claims: dict = Depends(require_jwt),
+    _rate_ok: None = Depends(limit_reads),
+    session: AsyncSession = Depends(get_session),
+):
+    try:
+        project_uuid = uuid.UUID(project_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid project_id (must be UUID)")
+    if until is not None and until.tzinfo is not None:
+        until = until.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    result = await get_retention(session, project_id=str(project_uuid), period=period, cohorts=cohorts, until=until)
+    return RetentionResponse(
+        project_id=str(project_uuid),
+        period=period,
+        since=result["since"].isoformat() + "Z",
+        until=result["until"].isoformat() + "Z",
+        cohorts=result["cohorts"],
+    )
@@ -1,27 +1,60 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import asyncio
+import uuid
+from typing import Optional
 
-from ..cache import redis
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+
+from nimbus.security.auth import decode_token
+from nimbus.services.ws_hub import hub
+from nimbus.settings import settings
 
 router = APIRouter()
 
 
+def _authorized(token: Optional[str]) -> bool:
+    """Browsers cannot set headers on a WebSocket: the access JWT comes as ?token=."""
+    claims = decode_token(token) if token else None
+    return claims is not None and claims.get("typ") == "access"
+
+
 @router.websocket("/ws/projects/{project_id}")
-async def ws_metrics(ws: WebSocket, project_id: str):
+async def ws_metrics(ws: WebSocket, project_id: str, token: Optional[str] = None):
+    try:
+        uuid.UUID(project_id)
+    except ValueError:
+        await ws.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid project_id (must be UUID)")
+        return
+    if not _authorized(token):
+        await ws.close(code=status.WS_1008_POLICY_VIOLATION, reason="Missing or invalid token")
+        return
     await ws.accept()
-    
-    # Check if Redis is available
-    if redis is None:
-        await ws.send_json({"error": "WebSocket requires Redis (not configured)"})
+
+    try:
+        sub = await hub.subscribe(f"metrics:{project_id}")
+    except Exception:
+        await ws.send_json({"error": "WebSocket requires Redis (not configured or unavailable)"})
         await ws.close()
         return
-    
-    pubsub = redis.pubsub()
-    await pubsub.subscribe(f"metrics:{project_id}")
+
+    async def send():
+        async for data in sub:
+            await asyncio.wait_for(ws.send_text(data), timeout=settings.ws_send_timeout_s)
+
+    async def until_closed():
+        # Clients only listen; reading is how a disconnect is noticed between updates
+        while (await ws.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(send()), asyncio.create_task(until_closed())]
     try:
-        async for msg in pubsub.listen():
-            if msg.get("type") == "message":
-                await ws.send_text(msg["data"])
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for t in done:
+            if isinstance(t.exception(), asyncio.TimeoutError):
+                await ws.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Client too slow")
     except WebSocketDisconnect:
         pass
     finally:
-        await pubsub.unsubscribe(f"metrics:{project_id}")
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await hub.unsubscribe(sub)
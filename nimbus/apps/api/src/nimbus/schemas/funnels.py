@@ -0,0 +1,46 @@
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel, Field, validator
+
+_PROP_KEY = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+
+
+class FunnelStep(BaseModel):
+    name: str = Field(..., min_length=1, max_length=200, examples=["signup"])
+    props: Dict[str, Union[str, int, float, bool]] = Field(
+        default_factory=dict,
+        description="Only events whose props have these (scalar) values count for the step",
+        examples=[{"plan": "pro"}],
+    )
+
+    @validator("props")
+    def validate_props(cls, v):
+        for key in v:
+            if not _PROP_KEY.match(key):
+                raise ValueError(f"Invalid prop key: {key!r}")
+        return v
+
+
+class FunnelRequest(BaseModel):
+    project_id: str
+    steps: List[FunnelStep] = Field(..., min_length=2, max_length=10)
+    window_s: int = Field(86400, ge=1, le=90 * 86400, description="Time allowed from the first step to the last")
+    since: Optional[datetime] = Field(None, description="First steps with ts >= since; defaults to 7 days before until")
+    until: Optional[datetime] = Field(None, description="First steps with ts < until; defaults to now. Later steps may follow up to window_s after it")
+
+
+class FunnelStepResult(BaseModel):
+    name: str = Field(examples=["signup"])
+    count: int = Field(examples=[120], description="Users who reached this step in order within the window")
+    conversion: float = Field(examples=[0.4], description="count / users who entered the funnel")
+    step_conversion: float = Field(examples=[0.8], description="count / users who reached the previous step")
+
+
+class FunnelResponse(BaseModel):
+    project_id: str
+    since: str = Field(examples=["2024-01-01T00:00:00Z"])
+    until: str = Field(examples=["2024-01-08T00:00:00Z"])
+    window_s: int = Field(examples=[86400])
+    steps: List[FunnelStepResult]
@@ -1,11 +1,48 @@
-from typing import List
+from typing import List, Optional, Union
 from pydantic import BaseModel, Field
 
 class SeriesPoint(BaseModel):
     ts: str = Field(examples=["2024-01-01T12:00:00Z"])
-    value: float = Field(examples=[42])
+    value: Optional[float] = Field(examples=[42], description="null for a quantile over a bucket without values")
 
 class MetricsResponse(BaseModel):
     metric: str = Field(examples=["events.count"])
     bucket: str = Field(examples=["1h"])
     series: List[SeriesPoint]
+    rolling: Optional[int] = Field(None, examples=[7], description="users.unique: buckets each point spans")
+    total: Optional[Union[int, float]] = Field(None, examples=[1830], description="users.unique / props quantiles: the value over the whole window")
+    error: Optional[float] = Field(None, examples=[0.0081], description="users.unique: relative standard error of the estimates; props quantiles: relative accuracy bound")
+
+class LiveResponse(BaseModel):
+    metric: str = Field(examples=["events.live"])
+    bucket: str = Field(examples=["10s"])
+    series: List[SeriesPoint]
+    total: int = Field(examples=[5321], description="Events accepted over the whole window")
+    as_of: str = Field(examples=["2024-01-01T12:04:59Z"], description="Second the counts run up to; the last bucket is still filling")
+
+class BreakdownGroup(BaseModel):
+    key: Optional[str] = Field(examples=["signup"], description="Dimension value; null for events without it")
+    value: int = Field(examples=[42])
+
+class BreakdownResponse(BaseModel):
+    metric: str = Field(examples=["events.count"])
+    by: str = Field(examples=["name", "props.plan"])
+    since: str = Field(examples=["2024-01-01T00:00:00Z"])
+    until: str = Field(examples=["2024-01-02T00:00:00Z"])
+    groups: List[BreakdownGroup]
+    other: int = Field(examples=[7], description="Events in every group beyond the top N")
+    total: int = Field(examples=[120])
+
+class TopItem(BaseModel):
+    key: str = Field(examples=["/pricing"])
+    count: int = Field(examples=[1204], description="Upper bound on the item's events in range")
+    error: int = Field(examples=[3], description="count - error is a lower bound")
+
+class TopResponse(BaseModel):
+    dimension: str = Field(examples=["name", "props.page"])
+    k: int = Field(examples=[20])
+    since: str = Field(examples=["2024-01-01T00:00:00Z"], description="Range start, rounded down to the hour")
+    until: str = Field(examples=["2024-01-02T00:00:00Z"], description="Range end, rounded up to the hour")
+    items: List[TopItem]
+    total: int = Field(examples=[120000], description="Events summarized in range")
+    error_bound: int = Field(examples=[41], description="Largest possible error of any count, listed or not (at most total / capacity)")
@@ -1,18 +1,38 @@
 from __future__ import annotations
 from typing import Optional, List
 from datetime import datetime
+from typing_extensions import Annotated
 from pydantic import BaseModel, Field
 
+# Inlined into index definitions and queries, so keep keys to a safe alphabet
+HotPropKey = Annotated[str, Field(pattern=r"^[A-Za-z0-9_.:-]{1,64}$")]
+MAX_HOT_PROPS = 5
+MAX_NUMERIC_PROPS = 10
+
 class ProjectCreate(BaseModel):
     name: str = Field(min_length=1, max_length=200, examples=["My Product"])
 
 class ProjectUpdate(BaseModel):
     name: Optional[str] = Field(default=None, min_length=1, max_length=200, examples=["New Name"])
+    hot_props: Optional[List[HotPropKey]] = Field(
+        default=None,
+        max_length=MAX_HOT_PROPS,
+        examples=[["plan", "country"]],
+        description="props keys to keep an expression index for (props= filters on them use it)",
+    )
+    numeric_props: Optional[List[HotPropKey]] = Field(
+        default=None,
+        max_length=MAX_NUMERIC_PROPS,
+        examples=[["latency_ms", "revenue"]],
+        description="Numeric props keys to keep quantile sketches for (metric=props.<key>.p95 on /v1/metrics)",
+    )
 
 class ProjectOut(BaseModel):
     id: str
     name: str
     api_key_id: str
+    hot_props: List[str] = Field(default_factory=list)
+    numeric_props: List[str] = Field(default_factory=list)
     created_at: datetime
     updated_at: datetime
 
@@ -0,0 +1,15 @@
+from typing import List
+from pydantic import BaseModel, Field
+
+class RetentionCohort(BaseModel):
+    start: str = Field(examples=["2024-01-01"], description="First day of the cohort's period")
+    size: int = Field(examples=[250], description="Users first seen in the period")
+    retained: List[int] = Field(examples=[[250, 90, 61]], description="Cohort users active in the period and each one after it")
+    rates: List[float] = Field(examples=[[1.0, 0.36, 0.244]], description="retained / size")
+
+class RetentionResponse(BaseModel):
+    project_id: str
+    period: str = Field(examples=["week"])
+    since: str = Field(examples=["2024-01-01T00:00:00Z"])
+    until: str = Field(examples=["2024-02-26T00:00:00Z"])
+    cohorts: List[RetentionCohort]
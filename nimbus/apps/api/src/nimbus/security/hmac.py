@@ -1,24 +1,104 @@
 from __future__ import annotations
-import hmac, hashlib, time, logging, json
-from fastapi import Depends, HTTPException, Request, status
-from sqlalchemy import select
+import hmac, hashlib, time, logging
+from typing import Callable
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from nimbus import content_encoding
 from nimbus.db import get_session
-from nimbus.models.project import Project
+from nimbus.security.key_cache import CachedKey, lookup_api_key
 from nimbus.schemas.events import IngestRequest
 from nimbus.settings import settings
 
 log = logging.getLogger(__name__)
 
+def _new_signer(ts: str, method: str, path: str, secret: str) -> "hmac.HMAC":
+    """HMAC over `{ts}:{method}:{path}:` — feed the raw body bytes with .update()."""
+    prefix = f"{ts}:{method}:{path}:".encode("utf-8")
+    return hmac.new(secret.encode("utf-8"), prefix, hashlib.sha256)
+
 def _hex_hmac(ts: str, method: str, path: str, body: bytes, secret: str) -> str:
-    msg = f"{ts}:{method}:{path}:{body.decode()}"
-    return hmac.new(secret.encode("utf-8"), msg.encode("utf-8"), hashlib.sha256).hexdigest()
+    mac = _new_signer(ts, method, path, secret)
+    mac.update(body)
+    return mac.hexdigest()
 
-async def verify_ingest_signature(
-    request: Request,
-    session: AsyncSession = Depends(get_session),
-) -> bool:
+
+class StreamingSignature:
+    """Running HMAC for bodies consumed incrementally (e.g. NDJSON uploads)."""
+
+    def __init__(self, project_id: str, kid: str, ts: str, method: str, path: str, signature: str):
+        self.project_id = project_id
+        self.kid = kid
+        self._signature = signature
+        self._mac = _new_signer(ts, method, path, settings.get_ingest_secret())
+
+    def update(self, chunk: bytes) -> None:
+        self._mac.update(chunk)
+
+    def verify(self) -> None:
+        """Raise 401 unless the bytes fed so far match the signature header."""
+        if not hmac.compare_digest(self._mac.hexdigest(), self._signature):
+            log.warning("HMAC: streamed signature mismatch kid=%s", self.kid)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Bad signature")
+
+
+def decode_error(exc: Exception) -> HTTPException:
+    """Map content_encoding failures to the HTTP status the client should see."""
+    if isinstance(exc, content_encoding.UnsupportedEncoding):
+        supported = ", ".join(content_encoding.supported_encodings())
+        return HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported Content-Encoding {exc} (supported: {supported})",
+            headers={"Accept-Encoding": supported},
+        )
+    if isinstance(exc, content_encoding.BodyTooLarge):
+        return HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(exc) or f"Decoded body exceeds {settings.ingest_max_body_bytes} bytes",
+        )
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Malformed compressed body: {exc}")
+
+
+class SignedBodyRequest(Request):
+    """
+    Request whose body() is decompressed per Content-Encoding while the HMAC runs over the
+    bytes as they came off the wire, so the compressed copy is never kept around.
+    """
+
+    wire_hmac: str | None = None
+
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            ts = self.headers.get("x-api-timestamp")
+            mac = _new_signer(ts, self.method, self.url.path, settings.get_ingest_secret()) if ts else None
+            try:
+                self._body = await content_encoding.read_body(
+                    self.stream(),
+                    self.headers.get("content-encoding"),
+                    settings.ingest_max_body_bytes,
+                    on_wire=mac.update if mac else None,
+                )
+            except (content_encoding.UnsupportedEncoding, content_encoding.BodyTooLarge, content_encoding.CorruptBody) as e:
+                raise decode_error(e) from e
+            if mac is not None:
+                self.wire_hmac = mac.hexdigest()
+        return self._body
+
+
+class SignedBodyRoute(APIRoute):
+    """Route class for HMAC-signed endpoints that accept gzip/zstd request bodies."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def signed_body_handler(request: Request) -> Response:
+            return await handler(SignedBodyRequest(request.scope, request.receive))
+
+        return signed_body_handler
+
+
+async def _check_headers(request: Request, session: AsyncSession) -> tuple[str, str, str, CachedKey]:
     headers = request.headers
     kid = headers.get("x-api-key-id")
     ts  = headers.get("x-api-timestamp")
@@ -29,8 +109,7 @@ async def verify_ingest_signature(
 
     log.warning("HMAC: received kid=%r ts=%r sig[0:8]=%s...", kid, ts, sig[:8])
 
-    res = await session.execute(select(Project).where(Project.api_key_id == kid))
-    project = res.scalar_one_or_none()
+    project = await lookup_api_key(session, kid)
     if not project:
         log.warning("HMAC: no project for kid=%r", kid)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unknown API key id")
@@ -43,18 +122,33 @@ async def verify_ingest_signature(
     if abs(now - ts_int) > 300:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Stale X-Api-Timestamp")
 
+    return kid, ts, sig, project
+
+async def verify_ingest_signature(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+) -> bool:
+    kid, ts, sig, project = await _check_headers(request, session)
+
     raw_body = await request.body()
 
-    expected = _hex_hmac(ts, request.method, request.url.path, raw_body, settings.get_ingest_secret())
+    # Signatures cover the body as sent (compressed, if Content-Encoding is set)
+    expected = getattr(request, "wire_hmac", None) or _hex_hmac(
+        ts, request.method, request.url.path, raw_body, settings.get_ingest_secret()
+    )
     if not hmac.compare_digest(expected, sig):
         log.warning("HMAC: signature mismatch kid=%s", kid)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Bad signature")
 
-    try:
-        body_obj = json.loads(raw_body.decode())
-        if body_obj.get("project_id") != str(project.id):
-            raise HTTPException(status_code=401, detail="project_id/kid mismatch")
-    except Exception:
-        pass
+    # The route checks the body's project_id against this after its single parse
+    request.state.ingest_project_id = project.project_id
 
     return True
+
+async def verify_ingest_headers(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+) -> StreamingSignature:
+    """Header half of the HMAC check; the caller feeds the body and calls .verify() at the end."""
+    kid, ts, sig, project = await _check_headers(request, session)
+    return StreamingSignature(str(project.project_id), kid, ts, request.method, request.url.path, sig)
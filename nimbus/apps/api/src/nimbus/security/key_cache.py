@@ -0,0 +1,171 @@
+"""
+Process-local cache of API key lookups for HMAC verification.
+
+`api_key_id -> (project_id, key hash)` is kept in a TTL'd LRU so ingest requests
+skip the projects query (and never check out a pooled connection) on a hit.
+Unknown key ids are remembered for a few seconds to blunt scanning traffic.
+
+Rotating or deleting a key invalidates it locally and publishes the key id on a
+Redis channel once the transaction commits; every API process runs
+`run_invalidation_listener()` and drops the entry too.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from nimbus import background, stats
+from nimbus.models.project import Project
+from nimbus.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_hits = stats.counter("nimbus_api_key_cache_hits_total", "API key lookups answered from the cache")
+_misses = stats.counter("nimbus_api_key_cache_misses_total", "API key lookups that went to the database")
+_negative_hits = stats.counter("nimbus_api_key_cache_negative_hits_total", "Unknown key ids answered from the negative cache")
+_invalidations = stats.counter("nimbus_api_key_cache_invalidations_total", "Cache entries dropped on rotate/delete")
+_size = stats.gauge("nimbus_api_key_cache_entries", "API keys currently cached")
+
+_PENDING_KEY = "nimbus.invalidate_api_keys"
+
+
+@dataclass(frozen=True)
+class CachedKey:
+    project_id: uuid.UUID
+    key_hash: bytes
+
+
+class ApiKeyCache:
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, tuple[float, Optional[CachedKey]]]" = OrderedDict()
+
+    def get(self, kid: str) -> tuple[bool, Optional[CachedKey]]:
+        """(found, value); a found None is a negative entry."""
+        item = self._entries.get(kid)
+        if item is None:
+            return False, None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._entries[kid]
+            _size.set(len(self._entries))
+            return False, None
+        self._entries.move_to_end(kid)
+        return True, value
+
+    def put(self, kid: str, value: Optional[CachedKey]) -> None:
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        self._entries[kid] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(kid)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        _size.set(len(self._entries))
+
+    def invalidate(self, kid: str) -> None:
+        if self._entries.pop(kid, None) is not None:
+            _invalidations.inc()
+            _size.set(len(self._entries))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        _size.set(0)
+
+
+key_cache = ApiKeyCache(
+    max_entries=settings.api_key_cache_max_entries,
+    ttl=settings.api_key_cache_ttl_s,
+    negative_ttl=settings.api_key_negative_ttl_s,
+)
+
+
+async def lookup_api_key(session: AsyncSession, kid: str) -> Optional[CachedKey]:
+    """Resolve a key id to its project, from the cache when possible."""
+    found, value = key_cache.get(kid)
+    if found:
+        (_hits if value is not None else _negative_hits).inc()
+        return value
+    _misses.inc()
+    row = (
+        await session.execute(select(Project.id, Project.api_key_hash).where(Project.api_key_id == kid))
+    ).first()
+    value = CachedKey(project_id=row[0], key_hash=bytes(row[1])) if row else None
+    key_cache.put(kid, value)
+    return value
+
+
+async def publish_invalidation(*kids: str) -> None:
+    from nimbus.cache import redis
+
+    if redis is None:
+        return
+    for kid in kids:
+        try:
+            await redis.publish(settings.api_key_invalidation_channel, kid)
+        except Exception as e:
+            logger.warning(f"API key invalidation publish failed for {kid}: {e}")
+
+
+def _after_commit(sync_session) -> None:
+    kids = sync_session.info.pop(_PENDING_KEY, None)
+    if not kids:
+        return
+    for kid in kids:
+        key_cache.invalidate(kid)
+    try:
+        background.spawn(publish_invalidation(*kids))
+    except RuntimeError:  # no loop (sync context); other processes fall back to the TTL
+        pass
+
+
+def invalidate_on_commit(session: AsyncSession, *kids: str) -> None:
+    """
+    Drop `kids` now and again after `session` commits (so a concurrent lookup cannot
+    re-cache the old row in between), then broadcast them to the other processes.
+    """
+    for kid in kids:
+        key_cache.invalidate(kid)
+    sync_session = session.sync_session
+    pending = sync_session.info.setdefault(_PENDING_KEY, set())
+    if not event.contains(sync_session, "after_commit", _after_commit):
+        event.listen(sync_session, "after_commit", _after_commit)
+    pending.update(kids)
+
+
+async def run_invalidation_listener(stop: asyncio.Event) -> None:
+    """Drop keys other processes rotated or deleted; reconnects until `stop` is set."""
+    from nimbus.cache import redis
+
+    if redis is None:
+        return
+    while not stop.is_set():
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(settings.api_key_invalidation_channel)
+            while not stop.is_set():
+                msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if msg and msg.get("type") == "message":
+                    key_cache.invalidate(msg["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Missed messages only delay invalidation to the TTL; clear to be safe
+            logger.warning(f"API key invalidation listener error: {e}; retrying")
+            key_cache.clear()
+            await asyncio.sleep(1)
+        finally:
+            try:
+                await pubsub.reset()
+            except Exception:
+                pass
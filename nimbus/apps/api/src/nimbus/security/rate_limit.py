@@ -0,0 +1,254 @@
+"""
+Per-project / per-user token-bucket rate limiting.
+
+The authoritative bucket lives in Redis and is updated atomically by a Lua script
+(refill by elapsed time, then take tokens). To keep Redis off the hot path each
+process leases a small batch of tokens at a time and spends them locally; a key
+whose bucket came back empty is refused locally until its refill time. A lease is
+sized from how much of the previous one was spent (one token for a key without
+recent traffic), and what an expired lease left over goes back into the bucket with
+the next lease, so idle leases never eat a quiet client's burst. Without Redis
+every process falls back to its own in-memory bucket.
+
+Ingest endpoints are keyed by the project behind the verified API key, read
+endpoints by the JWT subject. Responses carry `RateLimit-*` headers and 429s a
+`Retry-After`.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, Response, status
+
+from nimbus import stats
+from nimbus.security.hmac import StreamingSignature, verify_ingest_headers, verify_ingest_signature
+from nimbus.security.jwt import require_jwt
+from nimbus.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] bucket hash; ARGV rate (tokens/s), capacity, tokens wanted, unused tokens
+# handed back from an expired lease. Returns {granted, tokens left (floored), ms until one token is available}.
+_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local returned = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or capacity
+local ts = tonumber(b[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate + returned)
+local granted = 0
+if tokens >= 1 then
+  granted = math.min(want, math.floor(tokens))
+  tokens = tokens - granted
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+local retry_ms = 0
+if granted == 0 then
+  retry_ms = math.ceil((1 - tokens) / rate * 1000)
+end
+return {granted, math.floor(tokens), retry_ms}
+"""
+
+_SWEEP_AT = 10_000
+_REDIS_RETRY_S = 5.0
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_s: int
+    retry_after_s: int = 0
+
+
+@dataclass
+class _Lease:
+    tokens: int
+    expires: float
+    remaining: int  # bucket level in Redis when the lease was taken
+    size: int
+
+    def next_size(self, cap: int) -> int:
+        """Double a lease that was spent in full, else shrink to what was used."""
+        if self.tokens == 0:
+            return min(cap, self.size * 2)
+        return max(1, self.size - self.tokens)
+
+
+class _LocalBucket:
+    """In-process bucket, used when Redis is unavailable."""
+
+    __slots__ = ("tokens", "ts")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.ts = now
+
+    def take(self, rate: float, capacity: float, now: float) -> Tuple[bool, float]:
+        self.tokens = min(capacity, self.tokens + max(0.0, now - self.ts) * rate)
+        self.ts = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, self.tokens
+        return False, self.tokens
+
+
+class RateLimiter:
+    def __init__(self, scope: str):
+        self.scope = scope
+        self._leases: Dict[str, _Lease] = {}
+        self._blocked_until: Dict[str, float] = {}
+        self._local: Dict[str, _LocalBucket] = {}
+        self._sha: Optional[str] = None
+        self._redis_down_until = 0.0
+        self._allowed = stats.counter("nimbus_rate_limit_allowed_total", "Requests admitted by the rate limiter", labels={"scope": scope})
+        self._limited = stats.counter("nimbus_rate_limit_limited_total", "Requests refused with 429", labels={"scope": scope})
+        self._redis_calls = stats.counter("nimbus_rate_limit_redis_calls_total", "Token leases fetched from Redis", labels={"scope": scope})
+        self._fallbacks = stats.counter("nimbus_rate_limit_local_fallback_total", "Decisions made without Redis", labels={"scope": scope})
+
+    def _redis_key(self, key: str) -> str:
+        return f"nimbus:rl:{self.scope}:{key}"
+
+    def _sweep(self, now: float) -> None:
+        self._leases = {k: v for k, v in self._leases.items() if v.expires > now}
+        self._blocked_until = {k: v for k, v in self._blocked_until.items() if v > now}
+        if len(self._local) > _SWEEP_AT:
+            self._local.clear()
+
+    async def _lease(self, key: str, rate: float, capacity: int, want: int, returned: int) -> Tuple[int, int, int]:
+        from nimbus.cache import redis
+
+        if redis is None:
+            raise ConnectionError("Redis is not configured")
+        if self._sha is None:
+            self._sha = await redis.script_load(_TOKEN_BUCKET)
+        self._redis_calls.inc()
+        args = (rate, capacity, want, returned)
+        try:
+            res = await redis.evalsha(self._sha, 1, self._redis_key(key), *args)
+        except Exception as e:
+            if "NOSCRIPT" not in str(e):
+                raise
+            self._sha = await redis.script_load(_TOKEN_BUCKET)
+            res = await redis.evalsha(self._sha, 1, self._redis_key(key), *args)
+        granted, remaining, retry_ms = (int(x) for x in res)
+        return granted, remaining, retry_ms
+
+    def _decide(self, allowed: bool, per_minute: int, remaining: float, rate: float, retry_s: float = 0.0) -> Decision:
+        (self._allowed if allowed else self._limited).inc()
+        remaining = max(0, int(remaining))
+        return Decision(
+            allowed=allowed,
+            limit=per_minute,
+            remaining=remaining,
+            reset_s=math.ceil((per_minute - remaining) / rate) if remaining < per_minute else 0,
+            retry_after_s=max(1, math.ceil(retry_s)) if not allowed else 0,
+        )
+
+    def _local_hit(self, key: str, per_minute: int, rate: float, now: float) -> Decision:
+        self._fallbacks.inc()
+        bucket = self._local.get(key)
+        if bucket is None:
+            bucket = self._local[key] = _LocalBucket(per_minute, now)
+        ok, left = bucket.take(rate, per_minute, now)
+        return self._decide(ok, per_minute, left, rate, (1 - left) / rate)
+
+    async def hit(self, key: str, per_minute: int) -> Decision:
+        """Take one token for `key` under a `per_minute` limit (bucket capacity = one minute)."""
+        now = time.monotonic()
+        rate = per_minute / 60.0
+
+        blocked = self._blocked_until.get(key)
+        if blocked is not None:
+            if blocked > now:
+                return self._decide(False, per_minute, 0, rate, blocked - now)
+            del self._blocked_until[key]
+
+        lease = self._leases.get(key)
+        if lease is not None and lease.tokens > 0 and lease.expires > now:
+            lease.tokens -= 1
+            return self._decide(True, per_minute, lease.remaining + lease.tokens, rate)
+
+        if len(self._leases) + len(self._blocked_until) > _SWEEP_AT:
+            self._sweep(now)
+
+        if self._redis_down_until > now:
+            return self._local_hit(key, per_minute, rate, now)
+        cap = max(1, min(settings.rate_limit_lease_max, per_minute // 50))
+        want = 1 if lease is None else min(cap, lease.next_size(cap))
+        returned = lease.tokens if lease is not None else 0
+        try:
+            granted, remaining, retry_ms = await self._lease(key, rate, per_minute, want, returned)
+        except Exception as e:
+            # don't pay a failing round trip on every request while Redis is away
+            self._redis_down_until = now + _REDIS_RETRY_S
+            logger.warning(f"Rate limiter using local buckets for {_REDIS_RETRY_S:g}s: {e}")
+            return self._local_hit(key, per_minute, rate, now)
+
+        # Redis has the leftovers now, whatever it granted
+        self._leases.pop(key, None)
+        if granted == 0:
+            self._blocked_until[key] = now + retry_ms / 1000.0
+            return self._decide(False, per_minute, 0, rate, retry_ms / 1000.0)
+        self._leases[key] = _Lease(granted - 1, now + settings.rate_limit_lease_ms / 1000.0, remaining, granted)
+        return self._decide(True, per_minute, remaining + granted - 1, rate)
+
+
+ingest_limiter = RateLimiter("ingest")
+read_limiter = RateLimiter("read")
+
+
+def ingest_limit_for(project_id: str) -> int:
+    override = settings.rate_limit_overrides.get(project_id)
+    return override if override else settings.rate_limit_per_minute * 2
+
+
+def _headers(d: Decision) -> Dict[str, str]:
+    headers = {
+        "RateLimit-Limit": str(d.limit),
+        "RateLimit-Remaining": str(d.remaining),
+        "RateLimit-Reset": str(d.reset_s),
+        "RateLimit-Policy": f"{d.limit};w=60",
+    }
+    if not d.allowed:
+        headers["Retry-After"] = str(d.retry_after_s)
+    return headers
+
+
+async def _enforce(limiter: RateLimiter, key: str, per_minute: int, response: Response) -> None:
+    if not settings.rate_limit_enabled:
+        return
+    d = await limiter.hit(key, per_minute)
+    if not d.allowed:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Rate limit exceeded", headers=_headers(d))
+    response.headers.update(_headers(d))
+
+
+async def limit_ingest(
+    request: Request,
+    response: Response,
+    _sig_ok: bool = Depends(verify_ingest_signature),
+) -> None:
+    project_id = str(request.state.ingest_project_id)
+    await _enforce(ingest_limiter, project_id, ingest_limit_for(project_id), response)
+
+
+async def limit_ingest_stream(
+    response: Response,
+    signature: StreamingSignature = Depends(verify_ingest_headers),
+) -> None:
+    await _enforce(ingest_limiter, signature.project_id, ingest_limit_for(signature.project_id), response)
+
+
+async def limit_reads(response: Response, claims: dict = Depends(require_jwt)) -> None:
+    await _enforce(read_limiter, str(claims.get("sub")), settings.rate_limit_per_minute, response)
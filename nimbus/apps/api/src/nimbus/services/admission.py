@@ -0,0 +1,152 @@
+"""
+Admission control (load shedding) for ingest and read endpoints.
+
+Tracks requests in flight, how long sessions wait for a pooled connection and how
+long ingest and short read statements take (analytics scans opt out, see db.py). When those cross the configured thresholds new requests are
+refused at once with 503 + Retry-After instead of queueing behind the pool for
+`db_pool_timeout` seconds. Reads are shed first: they are refused at a lower
+in-flight count and at the first pressure level, ingest only when the database is
+clearly saturated.
+
+Latency signals are time-decayed moving averages, so after shedding stops feeding
+them they relax on their own and traffic is let back in.
+"""
+from __future__ import annotations
+
+import math
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Literal
+
+from fastapi import HTTPException
+
+from nimbus import stats
+from nimbus.settings import settings
+
+RequestClass = Literal["ingest", "read"]
+
+_DECAY_S = 2.0  # time constant of the latency averages
+
+
+class _DecayingAverage:
+    """EWMA whose weight follows wall time and that relaxes towards 0 when idle."""
+
+    def __init__(self, tau: float = _DECAY_S):
+        self.tau = tau
+        self.value = 0.0
+        self.ts = time.monotonic()
+
+    def _decay(self, now: float) -> None:
+        elapsed = now - self.ts
+        if elapsed > 0:
+            self.value *= math.exp(-elapsed / self.tau)
+            self.ts = now
+
+    def observe(self, sample: float) -> None:
+        now = time.monotonic()
+        self._decay(now)
+        self.value += 0.2 * (sample - self.value)
+
+    def current(self) -> float:
+        self._decay(time.monotonic())
+        return self.value
+
+
+class AdmissionController:
+    def __init__(self):
+        self.in_flight: Dict[str, int] = {"ingest": 0, "read": 0}
+        self.pool_wait = _DecayingAverage()
+        self.db_latency = _DecayingAverage()
+        self._in_flight_gauges = {c: stats.gauge("nimbus_admission_in_flight", "Requests being served", labels={"class": c}) for c in self.in_flight}
+        self._shed = {c: stats.counter("nimbus_admission_shed_total", "Requests refused with 503 by admission control", labels={"class": c}) for c in self.in_flight}
+        self._pool_wait_gauge = stats.gauge("nimbus_admission_pool_wait_seconds", "Decayed average pool checkout wait")
+        self._db_latency_gauge = stats.gauge("nimbus_admission_db_latency_seconds", "Decayed average statement latency")
+        self._level_gauge = stats.gauge("nimbus_admission_pressure_level", "0 = normal, 1 = shedding reads, 2 = shedding everything")
+
+    # --- signals ------------------------------------------------------------
+
+    def observe_pool_wait(self, seconds: float) -> None:
+        self.pool_wait.observe(seconds)
+
+    def observe_db_latency(self, seconds: float) -> None:
+        self.db_latency.observe(seconds)
+
+    def pressure_level(self) -> int:
+        pool_wait, db_latency = self.pool_wait.current(), self.db_latency.current()
+        self._pool_wait_gauge.set(pool_wait)
+        self._db_latency_gauge.set(db_latency)
+        wait_ratio = pool_wait * 1000 / settings.admission_max_pool_wait_ms
+        latency_ratio = db_latency * 1000 / settings.admission_max_db_latency_ms
+        worst = max(wait_ratio, latency_ratio)
+        level = 2 if worst >= 2 else 1 if worst >= 1 else 0
+        self._level_gauge.set(level)
+        return level
+
+    # --- decisions ----------------------------------------------------------
+
+    def _limit_for(self, request_class: RequestClass) -> int:
+        if request_class == "ingest":
+            return settings.admission_max_in_flight
+        return max(1, int(settings.admission_max_in_flight * settings.admission_read_share))
+
+    def check(self, request_class: RequestClass) -> None:
+        """Raise 503 if a new request of this class should not be started now."""
+        total = self.in_flight["ingest"] + self.in_flight["read"]
+        level = self.pressure_level()
+        shed = (
+            total >= self._limit_for(request_class)
+            or level >= 2
+            or (level >= 1 and request_class == "read")
+        )
+        if shed:
+            self._shed[request_class].inc()
+            retry = settings.admission_retry_after_s * (1 if request_class == "ingest" else 2)
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, retry later",
+                headers={"Retry-After": str(retry)},
+            )
+
+    @contextmanager
+    def admitted(self, request_class: RequestClass):
+        self.check(request_class)
+        self.in_flight[request_class] += 1
+        self._in_flight_gauges[request_class].set(self.in_flight[request_class])
+        try:
+            yield
+        finally:
+            self.in_flight[request_class] -= 1
+            self._in_flight_gauges[request_class].set(self.in_flight[request_class])
+
+    def state(self) -> Dict[str, object]:
+        level = self.pressure_level()
+        return {
+            "enabled": settings.admission_enabled,
+            "pressure_level": level,
+            "in_flight": dict(self.in_flight),
+            "limits": {"ingest": self._limit_for("ingest"), "read": self._limit_for("read")},
+            "pool_wait_ms": round(self.pool_wait.value * 1000, 3),
+            "db_latency_ms": round(self.db_latency.value * 1000, 3),
+            "shed": {c: int(counter.value) for c, counter in self._shed.items()},
+        }
+
+
+admission = AdmissionController()
+
+
+async def admit_ingest() -> AsyncIterator[None]:
+    """Dependency: admission control for ingest endpoints (priority class)."""
+    if not settings.admission_enabled:
+        yield
+        return
+    with admission.admitted("ingest"):
+        yield
+
+
+async def admit_read() -> AsyncIterator[None]:
+    """Dependency: admission control for list/metrics queries (shed first)."""
+    if not settings.admission_enabled:
+        yield
+        return
+    with admission.admitted("read"):
+        yield
@@ -1,10 +1,21 @@
 from __future__ import annotations
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator
 from uuid import uuid4, UUID
 from datetime import datetime, timezone
 
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from nimbus.repositories.events import bulk_insert_events
+from nimbus.repositories.events import bulk_insert_events, list_events_offset, list_events_keyset
+from nimbus.schemas.events import IngestEvent, IngestRequest
+from nimbus.services.singleflight import query_key, reads
+from nimbus.settings import settings
+
+_MAX_REPORTED_ERRORS = 100
+
+
+class LineTooLong(Exception):
+    """An NDJSON line exceeded `ingest_stream_max_line_bytes`."""
 
 def _to_dt(ts: Any) -> datetime:
     """Return a naive UTC datetime for DB (TIMESTAMP WITHOUT TIME ZONE)."""
@@ -26,12 +37,12 @@ def _to_dt(ts: Any) -> datetime:
     # Return naive UTC for Postgres column without tz
     return dt_aware.replace(tzinfo=None)
 
-async def ingest_events(session: AsyncSession, project_id: str, events: List[Dict[str, Any]]) -> int:
-    """Validate/shape records, insert, and COMMIT."""
+def build_event_records(project_id: str, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Shape validated events into rows for the events table."""
     records: List[Dict[str, Any]] = []
     # Convert project_id string to UUID
     project_uuid = UUID(project_id)
-    
+
     for e in events:
         records.append({
             "id": e.get("id") or uuid4(),
@@ -43,10 +54,140 @@ async def ingest_events(session: AsyncSession, project_id: str, events: List[Dic
             "seq": e.get("seq"),
             "idempotency_key": e.get("idempotency_key"),
         })
+    return records
+
+def _event_record(project_uuid: UUID, e: IngestEvent) -> Dict[str, Any]:
+    return {
+        "id": uuid4(),
+        "project_id": project_uuid,
+        "name": e.name,
+        "ts": _to_dt(e.ts),
+        "props": e.props,
+        "user_id": e.user_id,
+        "seq": None,
+        "idempotency_key": e.idempotency_key,
+    }
+
 
+def parse_ingest_body(raw: bytes) -> IngestRequest:
+    """
+    Parse and validate a raw ingest body in one pass.
+
+    pydantic-core reads the JSON bytes straight into the model (no json.loads/dict
+    round trip); errors are reported in FastAPI's usual 422 shape.
+    """
+    try:
+        return IngestRequest.model_validate_json(raw)
+    except ValidationError as e:
+        errors = e.errors(include_url=False, include_context=False)
+        for err in errors:
+            err["loc"] = ("body", *err["loc"])
+        raise RequestValidationError(errors)
+
+
+def records_from_request(payload: IngestRequest) -> List[Dict[str, Any]]:
+    """Rows for the events table, read straight off the validated models."""
+    project_uuid = UUID(payload.project_id)
+    return [_event_record(project_uuid, e) for e in payload.events]
+
+
+async def insert_records(session: AsyncSession, records: List[Dict[str, Any]]) -> int:
+    """Insert pre-shaped records and COMMIT."""
     if not records:
         return 0
 
     inserted_count = await bulk_insert_events(session, records)
     await session.commit()  # ensure rows persist
     return inserted_count
+
+
+async def ingest_events(session: AsyncSession, project_id: str, events: List[Dict[str, Any]]) -> int:
+    """Validate/shape records, insert, and COMMIT."""
+    return await insert_records(session, build_event_records(project_id, events))
+
+
+async def ingest_ndjson(
+    session: AsyncSession,
+    project_id: str,
+    chunks: AsyncIterator[bytes],
+) -> Dict[str, Any]:
+    """
+    Validate an NDJSON body line by line and insert it in fixed-size chunks as it arrives.
+
+    Rows are written inside the session's transaction but NOT committed: the caller
+    commits once the whole body has been received (and its signature checked), or
+    rolls back. Invalid lines are counted as rejected instead of failing the upload.
+    """
+    chunk_size = settings.ingest_stream_chunk_events
+    max_line = settings.ingest_stream_max_line_bytes
+    project_uuid = UUID(project_id)
+    pending: List[Dict[str, Any]] = []
+    accepted = rejected = duplicates = line_no = 0
+    errors: List[str] = []
+    tail = b""
+
+    async def _flush() -> None:
+        nonlocal accepted, duplicates, pending
+        if pending:
+            inserted = await bulk_insert_events(session, pending)
+            accepted += inserted
+            duplicates += len(pending) - inserted
+            pending = []
+
+    def _take(line: bytes) -> None:
+        nonlocal rejected, line_no
+        line_no += 1
+        line = line.strip()
+        if not line:
+            return
+        try:
+            event = IngestEvent.model_validate_json(line)
+        except ValidationError as e:
+            rejected += 1
+            if len(errors) < _MAX_REPORTED_ERRORS:
+                first = e.errors()[0]
+                loc = ".".join(str(p) for p in first.get("loc", ())) or "event"
+                errors.append(f"line {line_no}: {loc}: {first.get('msg')}")
+            return
+        pending.append(_event_record(project_uuid, event))
+
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        if len(tail) > max_line:
+            raise LineTooLong(f"line {line_no + 1} exceeds {max_line} bytes")
+        for line in lines:
+            if len(line) > max_line:
+                raise LineTooLong(f"line {line_no + 1} exceeds {max_line} bytes")
+            _take(line)
+            if len(pending) >= chunk_size:
+                await _flush()
+    _take(tail)
+    await _flush()
+
+    if duplicates:
+        errors.append(f"{duplicates} duplicate events skipped (idempotency_key already ingested)")
+    return {"accepted": accepted, "rejected": rejected + duplicates, "errors": errors}
+
+
+async def list_events_page(session: AsyncSession, project_id: str, limit: int, offset: int, **filters: Any):
+    """(items, total) for one offset page; identical concurrent requests share one query."""
+    key = query_key("events:offset", project_id, limit, offset, filters)
+    items, total = await reads.do(
+        key, lambda: list_events_offset(session, project_id=project_id, limit=limit, offset=offset, **filters)
+    )
+    return items, total
+
+
+async def list_events_after(
+    session: AsyncSession, project_id: str, limit: int, after_ts: datetime, after_id: str, **filters: Any
+):
+    """(items, next_cursor) for one keyset page; identical concurrent requests share one query."""
+    key = query_key("events:keyset", project_id, limit, after_ts, after_id, filters)
+    items, next_cursor = await reads.do(
+        key,
+        lambda: list_events_keyset(
+            session, project_id=project_id, limit=limit, after_ts=after_ts, after_id=after_id, **filters
+        ),
+    )
+    return items, next_cursor
@@ -0,0 +1,68 @@
+"""
+Funnel conversion counts for /v1/funnels.
+
+A funnel whose scan (until + window) ended before the current hour only changes
+when a late event lands before that point, and such a write bumps the project's
+`closed:1h` metrics version (`closed:1d` too if the scan ended before today). Those
+results are cached in the metrics cache under that version; funnels reaching
+into the current hour are only coalesced.
+"""
+import datetime as dt
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from nimbus.repositories.funnels import fetch_funnel
+from nimbus.services.metrics import closed_version, metrics_cache
+from nimbus.services.singleflight import query_key, reads
+from nimbus.settings import settings
+
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+
+
+def _conversions(steps: Sequence[Dict[str, Any]], counts: List[int]) -> List[Dict[str, Any]]:
+    out = []
+    for i, (step, count) in enumerate(zip(steps, counts)):
+        prev = counts[i - 1] if i else count
+        out.append({
+            "name": step["name"],
+            "count": count,
+            "conversion": count / counts[0] if counts[0] else 0.0,
+            "step_conversion": count / prev if prev else 0.0,
+        })
+    return out
+
+
+async def get_funnel(
+    session: AsyncSession,
+    project_id: str,
+    steps: Sequence[Dict[str, Any]],
+    window_s: int = 86400,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+) -> Dict[str, Any]:
+    """Step counts and conversion rates; [since, until) defaults to the last 7 days."""
+    now = _utcnow()
+    until = until or now
+    since = since or until - dt.timedelta(days=7)
+    window = dt.timedelta(seconds=window_s)
+    key = query_key("funnel", project_id, steps, window_s, since, until)
+
+    async def compute() -> Dict[str, Any]:
+        field = closed_version(until + window, now) if settings.metrics_cache_enabled else None
+        cache_key = None
+        if field is not None:
+            (version,) = await metrics_cache.versions(project_id, [field])
+            cache_key = f"funnel:{key}:{field}:{version}"
+            cached = await metrics_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        counts = await fetch_funnel(session, project_id, steps, window, since, until)
+        if cache_key is not None:
+            await metrics_cache.set(cache_key, counts, settings.metrics_cache_closed_ttl_s)
+        return counts
+
+    counts = await reads.do(key, compute)
+    return {"since": since, "until": until, "window_s": window_s, "steps": _conversions(steps, counts)}
@@ -0,0 +1,163 @@
+"""
+Write-behind ingest buffer.
+
+In buffered mode POST /v1/events validates the batch, appends the shaped records
+here and answers 202. A single background task drains the buffer into large
+multi-request transactions, flushing when `ingest_buffer_flush_events` records
+are queued, when `ingest_buffer_flush_interval_ms` elapses, and on shutdown.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from nimbus import stats
+from nimbus.settings import settings
+
+logger = logging.getLogger(__name__)
+
+FlushFn = Callable[[List[Dict[str, Any]]], Awaitable[int]]
+
+_depth = stats.gauge("nimbus_ingest_buffer_depth", "Events waiting in the write-behind buffer")
+_accepted = stats.counter("nimbus_ingest_buffer_accepted_total", "Events accepted into the buffer")
+_rejected = stats.counter("nimbus_ingest_buffer_rejected_total", "Events refused because the buffer was full")
+_flushed = stats.counter("nimbus_ingest_buffer_flushed_total", "Events written by the background flusher")
+_dropped = stats.counter("nimbus_ingest_buffer_dropped_total", "Events lost after a failed flush on shutdown")
+_flush_errors = stats.counter("nimbus_ingest_buffer_flush_errors_total", "Failed flush attempts")
+_flush_latency = stats.histogram("nimbus_ingest_buffer_flush_seconds", "Time spent writing one batch")
+_batch_size = stats.histogram(
+    "nimbus_ingest_buffer_batch_size", "Events per flushed batch", buckets=stats.SIZE_BUCKETS
+)
+
+
+async def _write_batch(records: List[Dict[str, Any]]) -> int:
+    """Default flush: one transaction per batch through the bulk insert path."""
+    from nimbus.db import get_sessionmaker
+    from nimbus.repositories.events import bulk_insert_events
+
+    Session = get_sessionmaker()
+    async with Session() as session:
+        inserted = await bulk_insert_events(session, records)
+        await session.commit()
+        return inserted
+
+
+class IngestBuffer:
+    def __init__(
+        self,
+        max_events: int,
+        flush_events: int,
+        flush_interval: float,
+        flush_fn: Optional[FlushFn] = None,
+    ):
+        self.max_events = max_events
+        self.flush_events = flush_events
+        self.flush_interval = flush_interval
+        self._flush_fn = flush_fn or _write_batch
+        self._items: Deque[Dict[str, Any]] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def offer(self, records: List[Dict[str, Any]]) -> bool:
+        """Queue a request's records; False means the caller should shed load."""
+        if self._closing or len(self._items) + len(records) > self.max_events:
+            _rejected.inc(len(records))
+            return False
+        self._items.extend(records)
+        _accepted.inc(len(records))
+        _depth.set(len(self._items))
+        if len(self._items) >= self.flush_events:
+            self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        if not self.running:
+            self._closing = False
+            self._task = asyncio.create_task(self._run(), name="nimbus-ingest-flusher")
+
+    async def stop(self) -> None:
+        """Stop accepting, flush everything that is queued, then return."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            while self._items:
+                ok = await self._flush_once()
+                if not ok and not self._closing:
+                    # back off and let the buffer absorb (or refuse) traffic meanwhile
+                    await asyncio.sleep(self.flush_interval)
+                    break
+                if not self._closing and len(self._items) < self.flush_events:
+                    break
+
+            if self._closing and not self._items:
+                return
+
+    async def _flush_once(self) -> bool:
+        n = min(len(self._items), self.flush_events)
+        batch = [self._items.popleft() for _ in range(n)]
+        _depth.set(len(self._items))
+
+        started = time.perf_counter()
+        try:
+            await self._flush_fn(batch)
+        except Exception as e:
+            _flush_errors.inc()
+            if self._closing:
+                _dropped.inc(len(batch))
+                logger.error(f"Ingest buffer: dropping {len(batch)} events on shutdown: {e}", exc_info=True)
+            else:
+                # put the batch back at the head so ordering is preserved
+                self._items.extendleft(reversed(batch))
+                _depth.set(len(self._items))
+                logger.error(f"Ingest buffer: flush of {len(batch)} events failed, will retry: {e}", exc_info=True)
+            return False
+
+        _flush_latency.observe(time.perf_counter() - started)
+        _batch_size.observe(len(batch))
+        _flushed.inc(len(batch))
+        return True
+
+
+_buffer: Optional[IngestBuffer] = None
+
+
+def get_ingest_buffer() -> IngestBuffer:
+    """Return the process-wide buffer, starting its flusher on first use."""
+    global _buffer
+    if _buffer is None:
+        _buffer = IngestBuffer(
+            max_events=settings.ingest_buffer_max_events,
+            flush_events=settings.ingest_buffer_flush_events,
+            flush_interval=settings.ingest_buffer_flush_interval_ms / 1000,
+        )
+    _buffer.start()
+    return _buffer
+
+
+async def shutdown_ingest_buffer() -> None:
+    global _buffer
+    if _buffer is not None:
+        await _buffer.stop()
+        _buffer = None
@@ -0,0 +1,246 @@
+"""
+Live per-second event counters for /v1/metrics/live, kept in memory.
+
+Each API process counts the events it accepts per project in a ring of one-second
+slots covering the last `live_window_minutes`: committed inserts (bulk_insert_events
+registers an after-commit hook for the rows it actually wrote, so keyed retries it
+skips are not counted) and, in queue mode, batches appended to the ingest stream.
+Slots are stamped with arrival time, not event ts, so late or backdated events show
+up as live traffic.
+
+Every `live_flush_interval_ms` the part of each slot not yet sent is HINCRBY'd into
+a per-project, per-minute Redis hash (field = epoch second), so the hashes hold the
+sum over all processes. Adds mark their (project, second) dirty and a flush visits
+only those, not every slot of every project. A read merges those hashes with what this process has not
+sent yet: its own events appear at once, other processes' within a flush interval.
+Without Redis a process only sees its own events. No read touches the database.
+"""
+import asyncio
+import datetime as dt
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from nimbus import stats
+from nimbus.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "nimbus.live_writes"
+
+_flush_failures = stats.counter("nimbus_live_flush_failures_total", "Live counter flushes that could not reach Redis")
+
+
+class _Ring:
+    """One-second slots for one project: counts, and how much of each was flushed."""
+
+    __slots__ = ("stamps", "counts", "flushed", "touched")
+
+    def __init__(self, size: int):
+        self.stamps = [0] * size
+        self.counts = [0] * size
+        self.flushed = [0] * size
+        self.touched = 0
+
+    def add(self, second: int, n: int) -> None:
+        i = second % len(self.stamps)
+        if self.stamps[i] != second:
+            # Recycled slot: whatever it still held is older than the window
+            self.stamps[i] = second
+            self.counts[i] = 0
+            self.flushed[i] = 0
+        self.counts[i] += n
+        self.touched = second
+
+    def slots(self, since: int):
+        """(second, count, unflushed) for the live slots at or after `since`."""
+        for second, count, flushed in zip(self.stamps, self.counts, self.flushed):
+            if second >= since and count:
+                yield second, count, count - flushed
+
+
+class LiveCounters:
+    def __init__(self, window_s: int):
+        self.window_s = window_s
+        self._rings: Dict[str, _Ring] = {}
+        # (project, second) slots added to since the last take_unflushed
+        self._dirty: Set[Tuple[str, int]] = set()
+
+    def add(self, project_id: str, n: int, now: Optional[float] = None) -> None:
+        if n <= 0:
+            return
+        second = int(time.time() if now is None else now)
+        ring = self._rings.get(project_id)
+        if ring is None:
+            ring = self._rings[project_id] = _Ring(self.window_s)
+        ring.add(second, n)
+        self._dirty.add((project_id, second))
+
+    def local(self, project_id: str, since: int, unflushed: bool) -> Dict[int, int]:
+        """This process's counts per second from `since` on (only the unsent part if `unflushed`)."""
+        ring = self._rings.get(project_id)
+        if ring is None:
+            return {}
+        return {s: (u if unflushed else c) for s, c, u in ring.slots(since) if not unflushed or u}
+
+    def prune(self, now: int) -> None:
+        """Forget projects without events in the window."""
+        since = now - self.window_s + 1
+        for pid in [pid for pid, ring in self._rings.items() if ring.touched < since]:
+            del self._rings[pid]
+
+    def take_unflushed(self, now: int) -> List[Tuple[str, int, int]]:
+        """Mark every unsent delta as sent and return them as (project, second, delta)."""
+        self.prune(now)
+        out = []
+        since = now - self.window_s + 1
+        dirty, self._dirty = self._dirty, set()
+        for pid, second in dirty:
+            ring = self._rings.get(pid)
+            if ring is None or second < since:
+                continue
+            i = second % len(ring.stamps)
+            # A recycled slot holds a newer second, which is dirty in its own right
+            if ring.stamps[i] == second and ring.counts[i] > ring.flushed[i]:
+                out.append((pid, second, ring.counts[i] - ring.flushed[i]))
+                ring.flushed[i] = ring.counts[i]
+        return out
+
+    def restore(self, deltas: List[Tuple[str, int, int]]) -> None:
+        """Undo take_unflushed for deltas Redis did not get."""
+        for pid, second, delta in deltas:
+            ring = self._rings.get(pid)
+            if ring is None:
+                continue
+            i = second % len(ring.stamps)
+            if ring.stamps[i] == second:
+                ring.flushed[i] -= delta
+                self._dirty.add((pid, second))
+
+    def clear(self) -> None:
+        self._rings.clear()
+        self._dirty.clear()
+
+
+live_counters = LiveCounters(settings.live_window_minutes * 60)
+
+
+def _minute_key(project_id: str, second: int) -> str:
+    return f"{settings.live_prefix}:{project_id}:{second - second % 60}"
+
+
+def record(records: List[Dict[str, Any]], now: Optional[float] = None) -> None:
+    """Count accepted events now."""
+    if not settings.live_enabled:
+        return
+    per_project: Dict[str, int] = {}
+    for r in records:
+        pid = str(r["project_id"])
+        per_project[pid] = per_project.get(pid, 0) + 1
+    for pid, n in per_project.items():
+        live_counters.add(pid, n, now)
+
+
+def _after_commit(sync_session) -> None:
+    records = sync_session.info.pop(_PENDING_KEY, None)
+    if records:
+        record(records)
+
+
+def record_on_commit(session: AsyncSession, records: List[Dict[str, Any]]) -> None:
+    """Count `records` once `session` commits."""
+    if not settings.live_enabled or not records:
+        return
+    sync_session = session.sync_session
+    sync_session.info.setdefault(_PENDING_KEY, []).extend(records)
+    if not event.contains(sync_session, "after_commit", _after_commit):
+        event.listen(sync_session, "after_commit", _after_commit)
+
+
+async def flush(now: Optional[float] = None) -> int:
+    """Send unsent counts to Redis; returns how many (project, second) deltas went out."""
+    from nimbus.cache import redis
+
+    now_s = int(time.time() if now is None else now)
+    if redis is None:
+        live_counters.prune(now_s)
+        return 0
+    deltas = live_counters.take_unflushed(now_s)
+    if not deltas:
+        return 0
+    ttl = settings.live_window_minutes * 60 + 120
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            keys = set()
+            for pid, second, delta in deltas:
+                key = _minute_key(pid, second)
+                pipe.hincrby(key, str(second), delta)
+                keys.add(key)
+            for key in keys:
+                pipe.expire(key, ttl)
+            await pipe.execute()
+    except Exception as e:
+        # Keep them for the next round; a ring slot dropped meanwhile only loses old seconds
+        live_counters.restore(deltas)
+        _flush_failures.inc()
+        logger.warning(f"Live counters: flush failed: {e}")
+        return 0
+    return len(deltas)
+
+
+async def run_live_flusher(stop: asyncio.Event) -> None:
+    """Flush every live_flush_interval_ms until `stop` is set, then once more."""
+    interval = settings.live_flush_interval_ms / 1000
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        await flush()
+
+
+async def live_series(project_id: str, minutes: int, step: int, now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Events per `step` seconds over the last `minutes` (the last bucket holds the
+    current second), oldest first, as {"series", "total", "as_of"}.
+    """
+    from nimbus.cache import redis
+
+    now_s = int(time.time() if now is None else now)
+    end = now_s - now_s % step + step
+    start = end - minutes * 60
+    counts: Dict[int, int] = {}
+    merged = False
+    if redis is not None:
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                for minute in range(start - start % 60, end, 60):
+                    pipe.hgetall(_minute_key(project_id, minute))
+                for fields in await pipe.execute():
+                    for second, n in fields.items():
+                        second = int(second)
+                        if start <= second < end:
+                            counts[second] = counts.get(second, 0) + int(n)
+            merged = True
+        except Exception as e:
+            logger.warning(f"Live counters: read failed, serving this process only: {e}")
+            counts = {}
+    for second, n in live_counters.local(project_id, start, unflushed=merged).items():
+        if second < end:
+            counts[second] = counts.get(second, 0) + n
+
+    values = [0] * ((end - start) // step)
+    for second, n in counts.items():
+        values[(second - start) // step] += n
+    epoch = dt.datetime(1970, 1, 1)
+    return {
+        "series": [
+            {"ts": (epoch + dt.timedelta(seconds=start + i * step)).isoformat() + "Z", "value": v}
+            for i, v in enumerate(values)
+        ],
+        "total": sum(values),
+        "as_of": (epoch + dt.timedelta(seconds=now_s)).isoformat() + "Z",
+    }
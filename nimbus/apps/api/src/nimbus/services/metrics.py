@@ -1,6 +1,273 @@
-from typing import List, Dict
+"""
+Event count series for /v1/metrics, cached for polling dashboards.
+
+A series is split at the start of the open (current) bucket:
+
+  closed  buckets that have ended; cached until a late event lands in one of them,
+          which bumps the project's `closed:<bucket>` version
+  open    the current bucket (and any after it); cached until it ends or the project
+          receives any write, which bumps its `open` version
+
+Versions are bumped after the inserting transaction commits (bulk_insert_events
+registers the hook; nimbus_worker bumps the same Redis hash for queued ingest) and
+read before querying, so a result computed concurrently with a write is stored
+under a version that is already obsolete.
+"""
+import datetime as dt
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
-from nimbus.repositories.metrics import fetch_metrics
 
-async def get_event_count_series(session: AsyncSession, project_id: str, bucket: str = "1h", limit: int = 24) -> List[Dict]:
-    return await fetch_metrics(session, project_id=project_id, bucket=bucket, limit=limit)
+from nimbus import background, stats
+from nimbus.cache import QueryCache
+from nimbus.repositories.metrics import (
+    BUCKET_SECONDS,
+    SKETCH_BUCKETS,
+    bucket_window,
+    fetch_breakdown,
+    fetch_metrics,
+    fetch_prop_quantiles,
+    fetch_unique_users,
+    floor_bucket,
+)
+from nimbus.services import topk
+from nimbus.services.singleflight import query_key, reads
+from nimbus.settings import settings
+
+_PENDING_KEY = "nimbus.metrics_cache_writes"
+
+_hits = {p: stats.counter("nimbus_metrics_cache_hits_total", "Series parts answered from the metrics cache", labels={"part": p}) for p in ("closed", "open")}
+_misses = {p: stats.counter("nimbus_metrics_cache_misses_total", "Series parts computed from the database", labels={"part": p}) for p in ("closed", "open")}
+_hit_ratio = stats.gauge("nimbus_metrics_cache_hit_ratio", "Share of series parts answered from the metrics cache since start")
+_bumps = stats.counter("nimbus_metrics_cache_invalidations_total", "Per-project version bumps after committed writes")
+
+metrics_cache = QueryCache(
+    "metrics",
+    prefix=settings.metrics_cache_prefix,
+    max_entries=settings.metrics_cache_max_entries,
+    local_max_ttl=settings.metrics_cache_local_ttl_s,
+)
+
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+
+
+def _record(part: str, hit: bool) -> None:
+    (_hits if hit else _misses)[part].inc()
+    hits = sum(c.value for c in _hits.values())
+    total = hits + sum(c.value for c in _misses.values())
+    _hit_ratio.set(hits / total if total else 0.0)
+
+
+def version_fields(min_ts: dt.datetime, now: dt.datetime) -> List[str]:
+    """Versions a write reaching back to `min_ts` invalidates at `now`."""
+    fields = ["open"]
+    for bucket, step in BUCKET_SECONDS.items():
+        if min_ts < floor_bucket(now, step):
+            fields.append(f"closed:{bucket}")
+    return fields
+
+
+def closed_version(until: dt.datetime, now: dt.datetime) -> Optional[str]:
+    """
+    A version every write with ts < `until` made from `now` on is sure to bump, for
+    caching results over data before `until`; None while `until` is in the current hour.
+    """
+    if until <= floor_bucket(now, 86400):
+        return "closed:1d"  # bumped less often than closed:1h
+    if until <= floor_bucket(now, 3600):
+        return "closed:1h"
+    return None
+
+
+def _after_commit(sync_session) -> None:
+    writes = sync_session.info.pop(_PENDING_KEY, None)
+    if not writes:
+        return
+    now = _utcnow()
+    bumps = [(pid, version_fields(min_ts, now)) for pid, min_ts in writes.items()]
+    for pid, fields in bumps:
+        # Local versions move now and versions() takes the larger of them and Redis',
+        # so this process drops the old series at once; others follow the Redis bump
+        metrics_cache.bump_local(pid, fields)
+        _bumps.inc()
+    try:
+        for pid, fields in bumps:
+            background.spawn(metrics_cache.bump(pid, fields, local=False))
+    except RuntimeError:  # no loop (sync context); Redis entries expire on their own
+        return
+
+
+def invalidate_on_commit(session: AsyncSession, records: List[Dict[str, Any]]) -> None:
+    """Bump the cached series versions of every project in `records` once `session` commits."""
+    if not settings.metrics_cache_enabled or not records:
+        return
+    sync_session = session.sync_session
+    pending: Dict[str, dt.datetime] = sync_session.info.setdefault(_PENDING_KEY, {})
+    if not event.contains(sync_session, "after_commit", _after_commit):
+        event.listen(sync_session, "after_commit", _after_commit)
+    for r in records:
+        pid = str(r["project_id"])
+        ts = r["ts"]
+        if pid not in pending or ts < pending[pid]:
+            pending[pid] = ts
+
+
+async def _cached_fetch(session, project_id, bucket, parts) -> List[Dict]:
+    """
+    `parts`: [(part, since, until, n_buckets, cache key, ttl)], oldest first. A full
+    miss is answered with one query over the whole window and split afterwards.
+    """
+    found = [await metrics_cache.get(p[4]) for p in parts]
+    for p, value in zip(parts, found):
+        _record(p[0], value is not None)
+    if all(v is None for v in found) and len(parts) > 1:
+        n = sum(p[3] for p in parts)
+        rows = await fetch_metrics(session, project_id, bucket, n, since=parts[0][1], until=parts[-1][2])
+        found = [rows[:parts[0][3]], rows[parts[0][3]:]]
+        for p, value in zip(parts, found):
+            await metrics_cache.set(p[4], value, p[5])
+        return rows
+    series: List[Dict] = []
+    for p, value in zip(parts, found):
+        if value is None:
+            value = await fetch_metrics(session, project_id, bucket, p[3], since=p[1], until=p[2])
+            await metrics_cache.set(p[4], value, p[5])
+        series.extend(value)
+    return series
+
+
+async def get_event_count_series(
+    session: AsyncSession,
+    project_id: str,
+    bucket: str = "1h",
+    limit: int = 24,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+) -> List[Dict]:
+    if bucket not in BUCKET_SECONDS:
+        bucket = "1h"
+    start, end, since, until = bucket_window(bucket, limit, since, until)
+    if since >= until:
+        return []
+    key = query_key("metrics", project_id, bucket, start, end, since, until)
+    return await reads.do(key, lambda: _series(session, project_id, bucket, start, end, since, until))
+
+
+async def _series(session, project_id, bucket, start, end, since, until) -> List[Dict]:
+    n = (end - start) // dt.timedelta(seconds=BUCKET_SECONDS[bucket])
+    if not settings.metrics_cache_enabled:
+        return await fetch_metrics(session, project_id, bucket, n, since=since, until=until)
+    step = BUCKET_SECONDS[bucket]
+    now = _utcnow()
+    split = min(max(floor_bucket(now, step), start), end)
+
+    closed_v, open_v = await metrics_cache.versions(project_id, [f"closed:{bucket}", "open"])
+    parts = []
+    if start < split:
+        n = (split - start) // dt.timedelta(seconds=step)
+        hi = min(until, split)
+        key = f"{project_id}:{bucket}:{since.isoformat()}:{hi.isoformat()}:c{closed_v}"
+        parts.append(("closed", since, hi, n, key, settings.metrics_cache_closed_ttl_s))
+    if split < end:
+        n = (end - split) // dt.timedelta(seconds=step)
+        lo = max(since, split)
+        key = f"{project_id}:{bucket}:{lo.isoformat()}:{until.isoformat()}:o{open_v}"
+        # Expires when the open bucket closes; the next poll reads it as a closed part
+        ttl = (split + dt.timedelta(seconds=step) - now).total_seconds()
+        parts.append(("open", lo, until, n, key, ttl))
+    return await _cached_fetch(session, project_id, bucket, parts)
+
+
+async def get_unique_users(
+    session: AsyncSession,
+    project_id: str,
+    bucket: str = "1h",
+    limit: int = 24,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    rolling: int = 1,
+) -> Dict[str, Any]:
+    """
+    Distinct users per bucket from HyperLogLog sketches. Windows that ended before the
+    current hour are cached like funnels, under the closed version their writes bump.
+    """
+    if bucket not in SKETCH_BUCKETS:
+        bucket = "1h"
+    now = _utcnow()
+    start, end, since, until = bucket_window(bucket, limit, since, until)
+    key = query_key("users.unique", project_id, bucket, start, end, since, until, rolling)
+
+    async def compute() -> Dict[str, Any]:
+        field = closed_version(until, now) if settings.metrics_cache_enabled else None
+        cache_key = None
+        if field is not None:
+            (version,) = await metrics_cache.versions(project_id, [field])
+            cache_key = f"users.unique:{key}:{field}:{version}"
+            cached = await metrics_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        result = await fetch_unique_users(session, project_id, bucket, limit, since, until, rolling)
+        if cache_key is not None:
+            await metrics_cache.set(cache_key, result, settings.metrics_cache_closed_ttl_s)
+        return result
+
+    return await reads.do(key, compute)
+
+
+async def get_prop_quantiles(
+    session: AsyncSession,
+    project_id: str,
+    prop: str,
+    q: float,
+    bucket: str = "1h",
+    limit: int = 24,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Per-bucket quantiles of a numeric prop from DDSketch bins; not cached, only coalesced."""
+    if bucket not in SKETCH_BUCKETS:
+        bucket = "1h"
+    start, end, since, until = bucket_window(bucket, limit, since, until)
+    key = query_key("props.quantile", project_id, prop, q, bucket, start, end, since, until, name)
+    return await reads.do(
+        key, lambda: fetch_prop_quantiles(session, project_id, prop, q, bucket, limit, since, until, name)
+    )
+
+
+async def get_breakdown(
+    session: AsyncSession,
+    project_id: str,
+    by: str,
+    top: int = 10,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+) -> Dict[str, Any]:
+    """
+    Top-`top` event counts by dimension over [since, until); defaults to the 24 hours
+    up to the end of the current minute, so concurrent default requests share a key.
+    """
+    until = until or floor_bucket(_utcnow(), 60) + dt.timedelta(minutes=1)
+    since = since or until - dt.timedelta(days=1)
+    key = query_key("breakdown", project_id, by, top, since, until)
+    result = await reads.do(key, lambda: fetch_breakdown(session, project_id, by, top, since, until))
+    return {**result, "since": since, "until": until}
+
+
+async def get_top(
+    project_id: str,
+    dimension: str,
+    k: int = 20,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+) -> Optional[Dict[str, Any]]:
+    """Heavy hitters of `dimension` over [since, until) rounded out to hours; defaults to the last 24 hours."""
+    until = until or _utcnow()
+    since = since or until - dt.timedelta(days=1)
+    lo, hi = topk.hour_range(since, until)
+    key = query_key("top", project_id, dimension, k, lo, hi)
+    result = await reads.do(key, lambda: topk.top_items(project_id, dimension, k, lo, hi))
+    return None if result is None else {**result, "since": lo, "until": hi}
@@ -0,0 +1,72 @@
+"""
+Retention grids for /v1/retention.
+
+The grid only changes when an event with ts before its end is written, and the
+default range ends where the current period starts, so a write like that bumps
+the project's `closed:1d` (or `closed:1h`) metrics version. Grids are cached in
+the metrics cache under it; ranges reaching into the current hour are only
+coalesced.
+"""
+import datetime as dt
+from typing import Any, Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from nimbus.repositories.retention import fetch_retention, period_index, period_start
+from nimbus.services.metrics import closed_version, metrics_cache
+from nimbus.services.singleflight import query_key, reads
+from nimbus.settings import settings
+
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+
+
+async def get_retention(
+    session: AsyncSession,
+    project_id: str,
+    period: str = "week",
+    cohorts: int = 8,
+    until: Optional[dt.datetime] = None,
+) -> Dict[str, Any]:
+    """
+    The `cohorts` periods ending at `until` (rounded up to a period boundary;
+    defaults to the start of the current period, so only complete ones).
+    """
+    now = _utcnow()
+    if until is None:
+        last = period_index(now.date(), period)
+    else:
+        last = period_index(until.date(), period)
+        if until > dt.datetime.combine(period_start(last, period), dt.time()):
+            last += 1
+    first = last - cohorts
+    since_ts = dt.datetime.combine(period_start(first, period), dt.time())
+    until_ts = dt.datetime.combine(period_start(last, period), dt.time())
+    key = query_key("retention", project_id, period, first, cohorts)
+
+    async def compute():
+        field = closed_version(until_ts, now) if settings.metrics_cache_enabled else None
+        cache_key = None
+        if field is not None:
+            (version,) = await metrics_cache.versions(project_id, [field])
+            cache_key = f"retention:{key}:{field}:{version}"
+            cached = await metrics_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        grid = await fetch_retention(session, project_id, period, first, cohorts)
+        if cache_key is not None:
+            await metrics_cache.set(cache_key, grid, settings.metrics_cache_closed_ttl_s)
+        return grid
+
+    grid = await reads.do(key, compute)
+    rows = []
+    for k, retained in enumerate(grid):
+        size = retained[0]
+        rows.append({
+            "start": period_start(first + k, period).isoformat(),
+            "size": size,
+            "retained": retained,
+            "rates": [n / size if size else 0.0 for n in retained],
+        })
+    return {"since": since_ts, "until": until_ts, "cohorts": rows}
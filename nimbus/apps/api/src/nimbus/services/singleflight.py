@@ -0,0 +1,154 @@
+"""
+Request coalescing for identical concurrent reads.
+
+The first caller for a key runs the query; callers arriving while it is in flight
+await the same future instead of running it again. Their sessions never execute
+anything, so they never check a connection out of the pool (AsyncSession connects
+lazily) — a dashboard opening with dozens of identical requests costs one.
+
+With `singleflight_redis` the leader also takes a Redis lock (SET NX PX) for the
+key. Leaders in other processes that find the lock held poll for the result the
+holder publishes under a short-lived result key, and only run the query
+themselves if the lock goes away without one (the holder failed or died).
+Results must be JSON-serialisable for that; tuples come back as lists.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+
+from nimbus import stats
+from nimbus.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Delete the lock only if we still hold it (it may have expired and been re-taken)
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_MISSING = object()
+
+
+def query_key(*parts: Any) -> str:
+    """Stable key for a normalised query; JSON-encodes dicts with sorted keys."""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._leaders = stats.counter("nimbus_singleflight_leaders_total", "Reads that ran their query", labels={"group": name})
+        self._shared_local = stats.counter("nimbus_singleflight_shared_total", "Reads answered by another caller's query", labels={"group": name, "scope": "process"})
+        self._shared_redis = stats.counter("nimbus_singleflight_shared_total", "Reads answered by another caller's query", labels={"group": name, "scope": "redis"})
+        self._in_flight = stats.gauge("nimbus_singleflight_in_flight", "Distinct queries currently running", labels={"group": name})
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `fn()` once per `key` among concurrent callers and share its result (or exception)."""
+        if not settings.singleflight_enabled:
+            return await fn()
+        while True:
+            fut = self._calls.get(key)
+            if fut is None:
+                break
+            try:
+                result = await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                # The leader was cancelled (client went away), not us: take over
+                if fut.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+            self._shared_local.inc()
+            return result
+
+        fut = asyncio.get_running_loop().create_future()
+        self._calls[key] = fut
+        self._in_flight.set(len(self._calls))
+        try:
+            result = await self._lead(key, fn)
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # retrieved: no "never retrieved" warning without followers
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is fut:
+                del self._calls[key]
+            self._in_flight.set(len(self._calls))
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        from nimbus.cache import redis
+
+        if not settings.singleflight_redis or redis is None:
+            self._leaders.inc()
+            return await fn()
+
+        lock_key = f"{settings.singleflight_prefix}:{self.name}:lock:{key}"
+        result_key = f"{settings.singleflight_prefix}:{self.name}:result:{key}"
+        token = uuid.uuid4().hex
+        try:
+            held = await redis.set(lock_key, token, nx=True, px=settings.singleflight_lock_ms)
+            if not held:
+                shared = await self._await_remote(redis, lock_key, result_key)
+                if shared is not _MISSING:
+                    self._shared_redis.inc()
+                    return shared
+                held = await redis.set(lock_key, token, nx=True, px=settings.singleflight_lock_ms)
+        except Exception as e:
+            logger.warning(f"single-flight {self.name}: Redis unavailable ({e}); running locally")
+            held = False
+
+        self._leaders.inc()
+        try:
+            result = await fn()
+        except BaseException:
+            if held:
+                await self._release(redis, lock_key, token)
+            raise
+        if held:
+            try:
+                await redis.set(result_key, json.dumps(result, separators=(",", ":")), px=settings.singleflight_result_ms)
+            except Exception as e:
+                logger.warning(f"single-flight {self.name}: could not publish result: {e}")
+            await self._release(redis, lock_key, token)
+        return result
+
+    async def _await_remote(self, redis, lock_key: str, result_key: str) -> Any:
+        """The holder's result, or _MISSING if its lock went away without one."""
+        deadline = time.monotonic() + settings.singleflight_lock_ms / 1000
+        poll = settings.singleflight_poll_ms / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(poll)
+            # Lock first: the holder writes the result before releasing it
+            locked = await redis.exists(lock_key)
+            raw = await redis.get(result_key)
+            if raw is not None:
+                return json.loads(raw)
+            if not locked:
+                return _MISSING
+        return _MISSING
+
+    async def _release(self, redis, lock_key: str, token: str) -> None:
+        try:
+            await redis.eval(_RELEASE, 1, lock_key, token)
+        except Exception as e:
+            logger.warning(f"single-flight {self.name}: lock release failed (expires on its own): {e}")
+
+
+# Process-wide group for list/metrics reads
+reads = SingleFlight("reads")
@@ -0,0 +1,218 @@
+"""
+Heavy hitters (top event names and prop values) from Space-Saving summaries.
+
+Each (project, dimension, hour/day bucket) keeps at most `topk_capacity` items in
+Redis: a sorted set of counts plus a hash with the bucket's event total (`n`) and,
+per item, the count it inherited when it evicted the smallest one (`e:<item>`).
+A tracked item's count overestimates its true count by at most that inherited
+error, itself at most n / capacity; an untracked item occurred at most as often as
+the smallest tracked count. Summaries merge by adding counts (a full summary lacking
+an item contributes its smallest count, as both count and error), so a range is
+answered from its whole days' summaries plus the hours at either end, never from
+events: O(capacity) per bucket whatever the volume.
+
+Summaries are updated after the inserting transaction commits, here for
+bulk_insert_events and in nimbus_worker for queued ingest. Dimensions are `name`
+and `props.<key>` for the keys in `topk_props`. bulk_insert_events only passes
+the rows it actually wrote, so keyed retries it skips are not counted again;
+queued ingest still counts the keyed rows it skips on redelivery.
+"""
+import datetime as dt
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from nimbus import background, stats
+from nimbus.repositories.metrics import floor_bucket
+from nimbus.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "nimbus.topk_writes"
+
+# KEYS: counts zset, meta hash. ARGV: capacity, ttl_s, then item, count pairs.
+_SPACE_SAVING = """
+local cap = tonumber(ARGV[1])
+local total = 0
+for i = 3, #ARGV, 2 do
+  local item, n = ARGV[i], tonumber(ARGV[i + 1])
+  total = total + n
+  if redis.call('ZSCORE', KEYS[1], item) then
+    redis.call('ZINCRBY', KEYS[1], n, item)
+  elseif redis.call('ZCARD', KEYS[1]) < cap then
+    redis.call('ZADD', KEYS[1], n, item)
+  else
+    local min = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    local floor = tonumber(min[2])
+    redis.call('ZREM', KEYS[1], min[1])
+    redis.call('HDEL', KEYS[2], 'e:' .. min[1])
+    redis.call('ZADD', KEYS[1], floor + n, item)
+    redis.call('HSET', KEYS[2], 'e:' .. item, floor)
+  end
+end
+redis.call('HINCRBY', KEYS[2], 'n', total)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return total
+"""
+
+_GRANULARITIES = (("hour", 3600), ("day", 86400))
+_MAX_ITEM_CHARS = 200
+
+_updates = stats.counter("nimbus_topk_updates_total", "Events added to heavy-hitter summaries")
+_failures = stats.counter("nimbus_topk_update_failures_total", "Summary updates lost to Redis errors")
+
+
+def summary_keys(project_id: str, dimension: str, granularity: str, bucket: dt.datetime) -> Tuple[str, str]:
+    base = f"{settings.topk_prefix}:{project_id}:{dimension}:{granularity}:{bucket:%Y%m%d%H}"
+    return base, base + ":meta"
+
+
+def _ttl(granularity: str) -> int:
+    return int(settings.topk_hour_ttl_s if granularity == "hour" else settings.topk_day_ttl_s)
+
+
+def dimension_values(record: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """(dimension, item) pairs an event counts for."""
+    out = [("name", record["name"])]
+    props = record.get("props") or {}
+    for key in settings.topk_props:
+        value = props.get(key)
+        if value is None or isinstance(value, (dict, list)):
+            continue
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        out.append((f"props.{key}", str(value)[:_MAX_ITEM_CHARS]))
+    return out
+
+
+def aggregate(records: Sequence[Dict[str, Any]]) -> Dict[Tuple[str, str, str, dt.datetime], Counter]:
+    """Per summary (project, dimension, granularity, bucket): item counts."""
+    out: Dict[Tuple[str, str, str, dt.datetime], Counter] = {}
+    for r in records:
+        pid = str(r["project_id"])
+        for granularity, step in _GRANULARITIES:
+            bucket = floor_bucket(r["ts"], step)
+            for dimension, item in dimension_values(r):
+                out.setdefault((pid, dimension, granularity, bucket), Counter())[item] += 1
+    return out
+
+
+async def record(records: Sequence[Dict[str, Any]]) -> None:
+    """Fold committed events into the summaries (one script call per summary, pipelined)."""
+    from nimbus.cache import redis
+
+    if redis is None or not records:
+        return
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for (pid, dimension, granularity, bucket), items in aggregate(records).items():
+                args: List[Any] = [settings.topk_capacity, _ttl(granularity)]
+                for item, n in items.items():
+                    args += [item, n]
+                pipe.eval(_SPACE_SAVING, 2, *summary_keys(pid, dimension, granularity, bucket), *args)
+            await pipe.execute()
+        _updates.inc(len(records))
+    except Exception as e:
+        # The events are stored; the summaries just undercount them
+        _failures.inc()
+        logger.warning(f"Top-K summaries: update failed: {e}")
+
+
+def _after_commit(sync_session) -> None:
+    records = sync_session.info.pop(_PENDING_KEY, None)
+    if not records:
+        return
+    try:
+        background.spawn(record(records))
+    except RuntimeError:  # no loop (sync context)
+        return
+
+
+def record_on_commit(session: AsyncSession, records: List[Dict[str, Any]]) -> None:
+    """Add `records` to the heavy-hitter summaries once `session` commits."""
+    if not settings.topk_enabled or not records:
+        return
+    sync_session = session.sync_session
+    sync_session.info.setdefault(_PENDING_KEY, []).extend(records)
+    if not event.contains(sync_session, "after_commit", _after_commit):
+        event.listen(sync_session, "after_commit", _after_commit)
+
+
+def hour_range(since: dt.datetime, until: dt.datetime) -> Tuple[dt.datetime, dt.datetime]:
+    """[since, until) rounded out to whole hours, the finest summaries kept."""
+    lo = floor_bucket(since, 3600)
+    hi = floor_bucket(until, 3600)
+    if hi < until:
+        hi += dt.timedelta(hours=1)
+    return lo, hi
+
+
+def cover(lo: dt.datetime, hi: dt.datetime) -> List[Tuple[str, dt.datetime]]:
+    """Summaries covering the whole hours [lo, hi): whole days, then the hours around them."""
+    day_lo = floor_bucket(lo, 86400)
+    if day_lo < lo:
+        day_lo += dt.timedelta(days=1)
+    day_hi = floor_bucket(hi, 86400)
+    if day_lo >= day_hi:
+        day_lo = day_hi = hi
+    out = []
+    for start, end, granularity, step in (
+        (lo, day_lo, "hour", dt.timedelta(hours=1)),
+        (day_lo, day_hi, "day", dt.timedelta(days=1)),
+        (day_hi, hi, "hour", dt.timedelta(hours=1)),
+    ):
+        t = start
+        while t < end:
+            out.append((granularity, t))
+            t += step
+    return out
+
+
+async def top_items(project_id: str, dimension: str, k: int, lo: dt.datetime, hi: dt.datetime) -> Optional[Dict[str, Any]]:
+    """
+    The k largest merged counts over the whole hours [lo, hi) as {"items", "total",
+    "error_bound"}; None without Redis. Each item occurred between count - error and
+    count times. `error_bound`, the sum of the full summaries' smallest counts
+    (<= total / topk_capacity), bounds every error and every unlisted item's count.
+    """
+    from nimbus.cache import redis
+
+    if redis is None:
+        return None
+    buckets = cover(lo, hi)
+    async with redis.pipeline(transaction=False) as pipe:
+        for granularity, bucket in buckets:
+            counts_key, meta_key = summary_keys(project_id, dimension, granularity, bucket)
+            pipe.zrange(counts_key, 0, -1, withscores=True)
+            pipe.hgetall(meta_key)
+        replies = await pipe.execute()
+
+    counts: Counter = Counter()
+    errors: Counter = Counter()
+    # Per item, the floors of the buckets it is tracked in
+    tracked_floors: Counter = Counter()
+    total = 0
+    error_bound = 0.0
+    for items, meta in zip(replies[0::2], replies[1::2]):
+        total += int(meta.get("n", 0))
+        # Only a full summary has evicted anything; items it lacks occurred at most `floor` times
+        floor = items[0][1] if len(items) >= settings.topk_capacity else 0
+        error_bound += floor
+        for item, n in items:
+            counts[item] += n
+            errors[item] += float(meta.get(f"e:{item}", 0))
+            tracked_floors[item] += floor
+    # A bucket not tracking an item may still have seen it up to its floor times
+    for item in counts:
+        missing = error_bound - tracked_floors[item]
+        counts[item] += missing
+        errors[item] += missing
+    return {
+        "items": [{"key": item, "count": int(n), "error": int(errors[item])} for item, n in counts.most_common(k)],
+        "total": total,
+        "error_bound": int(error_bound),
+    }
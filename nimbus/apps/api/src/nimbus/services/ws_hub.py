@@ -0,0 +1,183 @@
+"""
+One Redis subscription per channel per process for WebSocket fan-out.
+
+nimbus_worker publishes dashboard updates on `metrics:<project_id>`. Instead of a
+pubsub connection per socket, each process keeps a single one: a channel is
+SUBSCRIBEd when its first local client arrives and UNSUBSCRIBEd when the last one
+leaves, and one reader task hands every message to the channel's clients.
+
+Each client has a bounded queue (`ws_client_queue_size`) drained by its own
+socket's send loop, so a slow socket never holds up the reader or the other
+clients: once its queue is full the oldest message is dropped. Updates are
+snapshots of a bucket, so a lagging client simply skips to the newer ones.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Optional, Set
+
+from nimbus import stats
+from nimbus.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_delivered = stats.counter("nimbus_ws_messages_delivered_total", "Pub/sub messages queued for local WebSocket clients")
+_dropped = stats.counter("nimbus_ws_messages_dropped_total", "Messages dropped from full client queues (slow consumers)")
+_clients_gauge = stats.gauge("nimbus_ws_clients", "WebSocket clients subscribed in this process")
+_channels_gauge = stats.gauge("nimbus_ws_channels", "Redis channels this process is subscribed to")
+
+
+class Subscription:
+    """A client's view of a channel: the newest `maxlen` messages it has not read yet."""
+
+    __slots__ = ("channel", "_queue", "_ready", "dropped")
+
+    def __init__(self, channel: str, maxlen: int):
+        self.channel = channel
+        self._queue: deque = deque(maxlen=maxlen)
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def offer(self, data: str) -> None:
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+            _dropped.inc()
+        self._queue.append(data)
+        self._ready.set()
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    async def get(self) -> str:
+        while not self._queue:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._queue.popleft()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        return await self.get()
+
+
+class PubSubHub:
+    def __init__(self, queue_size: Optional[int] = None):
+        self.queue_size = queue_size or settings.ws_client_queue_size
+        self._clients: Dict[str, Set[Subscription]] = {}
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    def _redis(self):
+        from nimbus.cache import redis
+
+        return redis
+
+    def channels(self) -> int:
+        return len(self._clients)
+
+    def clients(self) -> int:
+        return sum(len(c) for c in self._clients.values())
+
+    def _update_gauges(self) -> None:
+        _clients_gauge.set(self.clients())
+        _channels_gauge.set(self.channels())
+
+    async def subscribe(self, channel: str) -> Subscription:
+        """Register a client; raises RuntimeError without Redis."""
+        redis = self._redis()
+        if redis is None:
+            raise RuntimeError("Redis is not configured")
+        sub = Subscription(channel, self.queue_size)
+        clients = self._clients.get(channel)
+        if clients is None:
+            clients = self._clients[channel] = set()
+            if self._pubsub is None:
+                self._pubsub = redis.pubsub()
+            try:
+                await self._pubsub.subscribe(channel)
+            except Exception:
+                del self._clients[channel]
+                raise
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+        clients.add(sub)
+        self._update_gauges()
+        return sub
+
+    async def unsubscribe(self, sub: Subscription) -> None:
+        clients = self._clients.get(sub.channel)
+        if clients is None:
+            return
+        clients.discard(sub)
+        if not clients:
+            del self._clients[sub.channel]
+            try:
+                if self._pubsub is not None:
+                    await self._pubsub.unsubscribe(sub.channel)
+            except Exception as e:
+                # The reader's reconnect only resubscribes channels that still have clients
+                logger.warning(f"WebSocket hub: unsubscribe from {sub.channel} failed: {e}")
+        self._update_gauges()
+
+    def _fan_out(self, channel: str, data: str) -> None:
+        clients = self._clients.get(channel)
+        if not clients:
+            return
+        for sub in clients:
+            sub.offer(data)
+        _delivered.inc(len(clients))
+
+    async def _read(self) -> None:
+        """Dispatch messages until no channel is left; reconnects on errors."""
+        while self._clients:
+            try:
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if msg and msg.get("type") == "message":
+                    self._fan_out(msg["channel"], msg["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Messages published meanwhile are lost; clients get the next update
+                logger.warning(f"WebSocket hub: pub/sub error: {e}; resubscribing")
+                await asyncio.sleep(1)
+                await self._reconnect()
+        # Detach before awaiting anything, so a subscribe from here on starts a new reader
+        pubsub, self._pubsub, self._reader = self._pubsub, None, None
+        if pubsub is not None:
+            try:
+                await pubsub.reset()
+            except Exception:
+                pass
+
+    async def _reconnect(self) -> None:
+        await self._reset()
+        redis = self._redis()
+        if redis is None or not self._clients:
+            return
+        try:
+            if self._pubsub is None:  # a subscribe may have opened one meanwhile
+                self._pubsub = redis.pubsub()
+            await self._pubsub.subscribe(*self._clients)
+        except Exception as e:
+            logger.warning(f"WebSocket hub: resubscribe failed: {e}")
+
+    async def _reset(self) -> None:
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.reset()
+            except Exception:
+                pass
+
+    async def close(self) -> None:
+        self._clients.clear()
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        await self._reset()
+        self._update_gauges()
+
+
+hub = PubSubHub()
@@ -1,4 +1,4 @@
-from typing import List, Literal
+from typing import Dict, List, Literal
 from pydantic_settings import BaseSettings
 from pydantic import AnyUrl, Field, SecretStr
 
@@ -45,9 +45,58 @@ class Settings(BaseSettings):
                 self.allowed_origins = json.loads(self.allowed_origins)
             except Exception:
                 self.allowed_origins = [o.strip() for o in self.allowed_origins.split(",") if o.strip()]
+    api_key_cache_ttl_s: float = Field(default=60.0, ge=0, description="How long a verified API key lookup is cached in-process (0 disables)")
+    api_key_negative_ttl_s: float = Field(default=5.0, ge=0, description="How long an unknown API key id is remembered (0 disables)")
+    api_key_cache_max_entries: int = Field(default=10_000, ge=1, description="LRU bound for the API key cache")
+    api_key_invalidation_channel: str = Field(default="nimbus:apikeys:invalidate", description="Redis pub/sub channel for API key rotate/delete invalidations")
     rate_limit_enabled: bool = Field(default=True, description="Enable rate limiting")
     rate_limit_per_minute: int = Field(default=10000, ge=1, le=100000)
+    rate_limit_overrides: Dict[str, int] = Field(default_factory=dict, description="Per-project ingest limits (requests/minute) keyed by project id; others get 2x rate_limit_per_minute")
+    rate_limit_lease_max: int = Field(default=20, ge=1, description="Most tokens a process leases from the Redis bucket per round trip")
+    rate_limit_lease_ms: int = Field(default=500, ge=1, description="Leased tokens unused after this long go back to the Redis bucket with the next lease")
     
+    # /v1/metrics result cache (Redis, or a per-process LRU without it)
+    metrics_cache_enabled: bool = Field(default=True, description="Cache /v1/metrics series; closed buckets until a late write, the open bucket until it closes or is written to")
+    metrics_cache_prefix: str = Field(default="nimbus:mcache", description="Redis key prefix for cached series and per-project versions (must match nimbus_worker's)")
+    metrics_cache_closed_ttl_s: float = Field(default=7 * 86400, gt=0, description="Expiry of closed-bucket entries; they never go stale, this only reclaims superseded versions")
+    metrics_cache_max_entries: int = Field(default=10_000, ge=1, description="LRU bound for the local fallback")
+    metrics_cache_local_ttl_s: float = Field(default=30.0, gt=0, description="Cap on local fallback entries, which other processes' writes cannot invalidate")
+    # users.unique: each point unions `rolling` HyperLogLog sketches
+    metrics_unique_max_limit_rolling: int = Field(default=20_000, ge=1, description="Largest limit * rolling a users.unique request may ask for")
+
+    # /v1/funnels (closed ranges are cached in the metrics cache)
+    funnel_max_range_days: int = Field(default=92, ge=1, description="Widest [since, until) a funnel may scan for first steps")
+
+    # /v1/metrics/top: Space-Saving summaries in Redis, updated after ingest commits
+    topk_enabled: bool = Field(default=True, description="Maintain per-hour/day heavy-hitter summaries of event names and topk_props values")
+    topk_prefix: str = Field(default="nimbus:topk", description="Redis key prefix for the summaries (must match nimbus_worker's)")
+    topk_capacity: int = Field(default=200, ge=10, le=10_000, description="Items kept per summary; counts are off by at most events / capacity (must match nimbus_worker's)")
+    topk_props: List[str] = Field(default_factory=list, description="Prop keys whose values are summarized, e.g. [\"page\", \"plan\"] (must match nimbus_worker's)")
+    topk_hour_ttl_s: int = Field(default=8 * 86400, ge=3600, description="Expiry of hourly summaries, which only cover range edges")
+    topk_day_ttl_s: int = Field(default=90 * 86400, ge=86400, description="Expiry of daily summaries: how far back /v1/metrics/top can look")
+
+    # /v1/metrics/live: in-process per-second counters merged through Redis
+    live_enabled: bool = Field(default=True, description="Count accepted events per project and second for /v1/metrics/live")
+    live_window_minutes: int = Field(default=15, ge=1, le=120, description="How far back live counters reach")
+    live_flush_interval_ms: int = Field(default=250, ge=10, description="How often a process sends its counts to Redis (other processes' lag)")
+    live_prefix: str = Field(default="nimbus:live", description="Redis key prefix for the merged per-minute counter hashes")
+
+    # Single-flight: identical concurrent reads share one query
+    singleflight_enabled: bool = Field(default=True, description="Coalesce identical concurrent /v1/events and /v1/metrics queries within a process")
+    singleflight_redis: bool = Field(default=False, description="Also coalesce across API processes with a Redis lock plus result key")
+    singleflight_prefix: str = Field(default="nimbus:sf", description="Redis key prefix for single-flight locks and results")
+    singleflight_lock_ms: int = Field(default=5000, ge=1, description="Lock TTL; also how long other processes wait for the holder's result")
+    singleflight_result_ms: int = Field(default=500, ge=1, description="How long a finished query's result stays readable by waiting processes")
+    singleflight_poll_ms: int = Field(default=10, ge=1, description="How often waiting processes check for the result")
+
+    # Admission control (load shedding)
+    admission_enabled: bool = Field(default=True, description="Answer 503 + Retry-After under overload instead of queueing on the DB pool")
+    admission_max_in_flight: int = Field(default=256, ge=1, description="Concurrent requests (ingest + reads) above which new ingest requests are shed")
+    admission_read_share: float = Field(default=0.5, gt=0, le=1, description="Fraction of admission_max_in_flight at which list/metrics reads are shed")
+    admission_max_pool_wait_ms: float = Field(default=100.0, gt=0, description="Average pool checkout wait that starts shedding reads (2x sheds ingest too)")
+    admission_max_db_latency_ms: float = Field(default=250.0, gt=0, description="Average statement latency that starts shedding reads (2x sheds ingest too)")
+    admission_retry_after_s: int = Field(default=1, ge=1, description="Retry-After for shed ingest requests; reads get twice this")
+
     # Monitoring and Observability
     enable_metrics: bool = Field(default=True, description="Enable Prometheus metrics")
     enable_tracing: bool = Field(default=False, description="Enable OpenTelemetry tracing")
@@ -55,8 +104,31 @@ class Settings(BaseSettings):
 
     # Feature Flags
     enable_websockets: bool = Field(default=True, description="Enable WebSocket support")
+    ws_client_queue_size: int = Field(default=32, ge=1, description="Updates buffered per WebSocket client; a slow client loses the oldest")
+    ws_send_timeout_s: float = Field(default=10.0, gt=0, description="A WebSocket client that takes longer than this to accept one message is disconnected")
     enable_batch_processing: bool = Field(default=True, description="Enable batch event processing")
 
+    # Ingestion
+    ingest_mode: Literal["direct", "buffered", "queue"] = Field(default="direct", description="direct: insert + commit per request; buffered: answer 202 and flush in background batches; queue: XADD to Redis Streams drained by nimbus_worker")
+    ingest_buffer_max_events: int = Field(default=100_000, ge=1, description="Buffered mode: max events held in memory before answering 503")
+    ingest_buffer_flush_events: int = Field(default=5000, ge=1, description="Buffered mode: flush as soon as this many events are queued")
+    ingest_buffer_flush_interval_ms: int = Field(default=250, ge=1, description="Buffered mode: max time an event waits before being flushed")
+    ingest_stream_prefix: str = Field(default="nimbus:ingest", description="Queue mode: Redis Stream key prefix (one stream per shard)")
+    ingest_stream_shards: int = Field(default=4, ge=1, le=256, description="Queue mode: number of shard streams; a project always maps to the same shard")
+    ingest_stream_max_backlog: int = Field(default=1_000_000, ge=1, description="Queue mode: refuse new batches (503) once a shard holds this many entries")
+    ingest_stream_chunk_events: int = Field(default=1000, ge=1, description="NDJSON endpoint: events per bulk insert while the upload is arriving")
+    ingest_stream_max_line_bytes: int = Field(default=64 * 1024, ge=1024, description="NDJSON endpoint: longest accepted line")
+    ingest_stream_max_ratio: float = Field(default=200.0, ge=1, description="NDJSON endpoint: refuse gzip/zstd bodies that decode to more than this many times their wire size")
+    ingest_max_body_bytes: int = Field(default=16 * 1024 * 1024, ge=1024, description="Largest accepted ingest body after Content-Encoding (gzip/zstd) is decoded")
+    idempotency_filter_enabled: bool = Field(default=True, description="Bloom pre-filter so keyed events that were never seen skip the ON CONFLICT path")
+    idempotency_filter_capacity: int = Field(default=1_000_000, ge=1000, description="Idempotency keys per filter generation (~1.2 MB each at 1%)")
+    idempotency_filter_error_rate: float = Field(default=0.01, gt=0, lt=1, description="Bloom false-positive rate for idempotency keys")
+    idempotency_filter_window_s: int = Field(default=3600, ge=1, description="Filter generation length; keys are remembered for one to two windows")
+    events_partition_interval: Literal["day", "month"] = Field(default="month", description="Range partition size of the events table on ts (migration + nimbus_worker EVENTS_PARTITION_INTERVAL must agree)")
+    events_partition_premake: int = Field(default=3, ge=1, description="Future partitions the migration creates up front (the worker keeps this many ahead afterwards)")
+    ingest_copy_enabled: bool = Field(default=True, description="Use binary COPY for bulk inserts on PostgreSQL/asyncpg")
+    ingest_copy_min_rows: int = Field(default=1, ge=1, description="Smallest batch sent through COPY; smaller ones use INSERT")
+
     class Config:
         env_prefix = "NIMBUS_"
         case_sensitive = False
@@ -0,0 +1,4 @@
+"""Probabilistic data structures used on the ingest and query paths."""
+from .bloom import BloomFilter, RotatingBloomFilter  # noqa: F401
+from .ddsketch import DDSketch  # noqa: F401
+from .hll import HyperLogLog  # noqa: F401
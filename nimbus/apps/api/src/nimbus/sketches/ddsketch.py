@@ -0,0 +1,87 @@
+"""
+DDSketch quantiles with a relative-error guarantee.
+
+A value x != 0 falls in bin ceil(log_gamma(|x|)), gamma = (1 + alpha) / (1 - alpha),
+kept separately per sign; zeros are counted apart. Every value in a bin lies
+within a factor of gamma of the others, so answering a quantile with the bin's
+midpoint 2 * gamma**i / (gamma + 1) is off by at most `alpha` relative to the true
+value. Sketches merge by adding bin counts, which is how nimbus_worker's
+`prop_sketch_bins` rollups and the API's raw-event tail combine (see
+nimbus_worker.rollups, which bins in SQL with the same `log_gamma`).
+"""
+from __future__ import annotations
+
+import math
+from typing import Dict, Iterable, Optional, Tuple
+
+DEFAULT_ALPHA = 0.01
+
+
+def log_gamma(alpha: float = DEFAULT_ALPHA) -> float:
+    return math.log((1 + alpha) / (1 - alpha))
+
+
+class DDSketch:
+    def __init__(self, alpha: float = DEFAULT_ALPHA):
+        if not 0 < alpha < 1:
+            raise ValueError("alpha must be between 0 and 1")
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = log_gamma(alpha)
+        # (sign, bin) -> count; sign is -1, 0 (bin 0 only) or 1
+        self.bins: Dict[Tuple[int, int], int] = {}
+
+    def key(self, x: float) -> Tuple[int, int]:
+        if x == 0:
+            return 0, 0
+        return (1 if x > 0 else -1), math.ceil(math.log(abs(x)) / self._log_gamma)
+
+    def add(self, x: float, count: int = 1) -> None:
+        self.add_bin(*self.key(x), count)
+
+    def add_bin(self, sign: int, bin: int, count: int) -> None:
+        k = (sign, bin)
+        self.bins[k] = self.bins.get(k, 0) + count
+
+    def merge(self, other: "DDSketch") -> "DDSketch":
+        """Fold `other` into this sketch (bin-wise sum); returns self."""
+        if other.alpha != self.alpha:
+            raise ValueError("cannot merge sketches of different accuracy")
+        for (sign, bin), count in other.bins.items():
+            self.add_bin(sign, bin, count)
+        return self
+
+    @classmethod
+    def union(cls, sketches: Iterable["DDSketch"], alpha: float = DEFAULT_ALPHA) -> "DDSketch":
+        out = cls(alpha)
+        for s in sketches:
+            out.merge(s)
+        return out
+
+    @property
+    def count(self) -> int:
+        return sum(self.bins.values())
+
+    def _value(self, sign: int, bin: int) -> float:
+        return sign * 2 * self.gamma ** bin / (self.gamma + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The value at rank q * (count - 1); None when empty."""
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1")
+        n = self.count
+        if n == 0:
+            return None
+        rank = q * (n - 1)
+        # Ascending by value: negatives by decreasing magnitude, zero, positives
+        order = sorted(self.bins, key=lambda k: (k[0], k[1] * k[0]))
+        seen = 0
+        for sign, bin in order:
+            seen += self.bins[sign, bin]
+            if seen > rank:
+                return 0.0 if sign == 0 else self._value(sign, bin)
+        sign, bin = order[-1]
+        return 0.0 if sign == 0 else self._value(sign, bin)
+
+    def __len__(self) -> int:
+        return self.count
@@ -0,0 +1,126 @@
+"""
+HyperLogLog distinct counting.
+
+A sketch is `2**p` one-byte registers. A 64-bit hash picks a register with its top
+`p` bits and offers the position of the first 1-bit in the remaining bits (rho);
+each register keeps the largest rho it has seen. Sketches of the same precision
+merge by taking the register-wise max, so the distinct count over any union of
+buckets comes from merging their sketches, never from rescanning events.
+
+The relative standard error is 1.04 / sqrt(2**p): 0.81% at the default p = 14,
+in 16 KiB of registers. `add_hash` matches the register derivation nimbus_worker
+performs in SQL over `hashtextextended(user_id, 0)` (see nimbus_worker.rollups).
+"""
+from __future__ import annotations
+
+import math
+from functools import lru_cache
+from typing import Iterable, Optional
+
+DEFAULT_PRECISION = 14
+
+_MASK64 = (1 << 64) - 1
+
+
+@lru_cache(maxsize=8)
+def _lanes(n: int) -> int:
+    return int.from_bytes(b"\x80" * n, "big")
+
+
+def _max_bytes(a: bytes, b: bytes) -> bytes:
+    """
+    Byte-wise max of two equal-length register arrays, as big-int arithmetic over all
+    lanes at once (C speed, no per-register Python loop). Registers stay below 0x80,
+    so (a | 0x80) - b never borrows across lanes and its top bit is set where a >= b.
+    """
+    n = len(a)
+    high = _lanes(n)
+    x, y = int.from_bytes(a, "big"), int.from_bytes(b, "big")
+    ge = ((x | high) - y) & high
+    mask = (ge >> 7) * 0xFF
+    return ((x & mask) | (y & ~mask)).to_bytes(n, "big")
+
+
+def relative_error(p: int = DEFAULT_PRECISION) -> float:
+    """Relative standard error of a precision-`p` estimate."""
+    return 1.04 / math.sqrt(1 << p)
+
+
+def _alpha(m: int) -> float:
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+
+class HyperLogLog:
+    def __init__(self, p: int = DEFAULT_PRECISION, registers: Optional[bytes] = None):
+        if not 4 <= p <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.p = p
+        self.m = 1 << p
+        if registers is not None and len(registers) != self.m:
+            raise ValueError(f"expected {self.m} registers, got {len(registers)}")
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(p=int(math.log2(len(data))), registers=data)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    def offer(self, index: int, rho: int) -> None:
+        if rho > self.registers[index]:
+            self.registers[index] = rho
+
+    def add_hash(self, h: int) -> None:
+        """Add a (signed or unsigned) 64-bit hash."""
+        u = h & _MASK64
+        rest_bits = 64 - self.p
+        w = u & ((1 << rest_bits) - 1)
+        self.offer(u >> rest_bits, rest_bits - w.bit_length() + 1)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Fold `other` into this sketch (register-wise max); returns self."""
+        if other.p != self.p:
+            raise ValueError("cannot merge sketches of different precision")
+        self.registers = bytearray(_max_bytes(self.registers, other.registers))
+        return self
+
+    @classmethod
+    def union(cls, sketches: Iterable["HyperLogLog"], p: int = DEFAULT_PRECISION) -> "HyperLogLog":
+        out = cls(p)
+        for s in sketches:
+            out.merge(s)
+        return out
+
+    def estimate(self) -> float:
+        m = self.m
+        # Register histogram: bytearray.count runs in C, a Python loop over 16k registers does not.
+        # Stop once every register is accounted for; high values are rare.
+        counts = []
+        seen = 0
+        for r in range(64 - self.p + 2):
+            c = self.registers.count(r)
+            counts.append(c)
+            seen += c
+            if seen == m:
+                break
+        total = sum(c * 2.0 ** -r for r, c in enumerate(counts) if c)
+        zeros = counts[0]
+        e = _alpha(m) * m * m / total
+        # Small-range correction: linear counting while registers are still empty
+        if e <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return e
+
+    def __len__(self) -> int:
+        return int(round(self.estimate()))
+
+    @property
+    def error(self) -> float:
+        return relative_error(self.p)
@@ -0,0 +1,172 @@
+"""
+Tiny in-process metrics registry.
+
+Counters, gauges and histograms live in module-level registries so any layer can
+record without threading a client around. `render_prometheus()` produces the
+Prometheus text exposition served on GET /metrics, `snapshot()` a JSON-able dict
+for the detailed health endpoint.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 2500, 5000, 10000, 50000, 100000)
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_metrics: Dict[Tuple[str, _Labels], "_Metric"] = {}
+_help: Dict[str, Tuple[str, str]] = {}
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> _Labels:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _fmt_labels(labels: _Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, labels: _Labels):
+        self.name = name
+        self.labels = labels
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, labels: _Labels):
+        super().__init__(name, labels)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(self.labels)} {self.value:g}"]
+
+    def export(self):
+        return self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, labels: _Labels):
+        super().__init__(name, labels)
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(self.labels)} {self.value:g}"]
+
+    def export(self):
+        return self.value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, labels: _Labels, buckets=LATENCY_BUCKETS):
+        super().__init__(name, labels)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def render(self) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, ('le', f'{bound:g}'))} {cumulative}")
+        lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, ('le', '+Inf'))} {self.count}")
+        lines.append(f"{self.name}_sum{_fmt_labels(self.labels)} {self.sum:g}")
+        lines.append(f"{self.name}_count{_fmt_labels(self.labels)} {self.count}")
+        return lines
+
+    def export(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else 0.0,
+            "max": round(self.max, 6),
+        }
+
+
+def _get_or_create(cls, name: str, help: str, labels: Optional[Dict[str, str]], **kwargs):
+    key = (name, _label_key(labels))
+    metric = _metrics.get(key)
+    if metric is None:
+        with _lock:
+            metric = _metrics.get(key)
+            if metric is None:
+                metric = cls(name, key[1], **kwargs)
+                _metrics[key] = metric
+                _help.setdefault(name, (cls.kind, help))
+    return metric
+
+
+def counter(name: str, help: str = "", labels: Optional[Dict[str, str]] = None) -> Counter:
+    return _get_or_create(Counter, name, help, labels)
+
+
+def gauge(name: str, help: str = "", labels: Optional[Dict[str, str]] = None) -> Gauge:
+    return _get_or_create(Gauge, name, help, labels)
+
+
+def histogram(
+    name: str, help: str = "", labels: Optional[Dict[str, str]] = None, buckets=LATENCY_BUCKETS
+) -> Histogram:
+    return _get_or_create(Histogram, name, help, labels, buckets=buckets)
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    seen = set()
+    for (name, _), metric in sorted(_metrics.items(), key=lambda kv: kv[0]):
+        if name not in seen:
+            kind, help = _help[name]
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            seen.add(name)
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def snapshot(prefix: str = "") -> Dict[str, object]:
+    out: Dict[str, object] = {}
+    for (name, labels), metric in sorted(_metrics.items(), key=lambda kv: kv[0]):
+        if not name.startswith(prefix):
+            continue
+        key = name + _fmt_labels(labels)
+        out[key] = metric.export()
+    return out
@@ -39,3 +39,16 @@ async def cleanup_db_connections():
         reset_engine()
     except Exception:
         pass
+
+
+@pytest_asyncio.fixture
+async def redis_client(monkeypatch):
+    """A Redis client bound to this test's event loop, installed as nimbus.cache.redis and closed afterwards."""
+    import redis.asyncio as aioredis
+    import nimbus.cache
+    from nimbus.settings import settings
+
+    client = aioredis.from_url(settings.redis_url, decode_responses=True)
+    monkeypatch.setattr(nimbus.cache, "redis", client)
+    yield client
+    await client.aclose()
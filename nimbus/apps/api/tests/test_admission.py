@@ -0,0 +1,71 @@
+import time
+import pytest
+from fastapi import HTTPException
+from httpx import AsyncClient, ASGITransport
+
+from nimbus.main import app
+from nimbus.services.admission import AdmissionController, admission
+from nimbus.settings import settings
+
+
+def _shed(ctrl: AdmissionController, request_class: str) -> bool:
+    try:
+        ctrl.check(request_class)
+        return False
+    except HTTPException as e:
+        assert e.status_code == 503 and int(e.headers["Retry-After"]) >= 1
+        return True
+
+
+def test_reads_are_shed_before_ingest(monkeypatch):
+    monkeypatch.setattr(settings, "admission_max_in_flight", 10)
+    monkeypatch.setattr(settings, "admission_read_share", 0.5)
+    ctrl = AdmissionController()
+    ctrl.in_flight["ingest"] = 6
+    assert _shed(ctrl, "read")
+    assert not _shed(ctrl, "ingest")
+    ctrl.in_flight["ingest"] = 10
+    assert _shed(ctrl, "ingest")
+
+
+def test_db_latency_pressure_levels_and_decay(monkeypatch):
+    monkeypatch.setattr(settings, "admission_max_db_latency_ms", 100.0)
+    ctrl = AdmissionController()
+    for _ in range(20):
+        ctrl.observe_db_latency(0.15)
+    assert ctrl.pressure_level() == 1
+    assert _shed(ctrl, "read") and not _shed(ctrl, "ingest")
+    for _ in range(20):
+        ctrl.observe_db_latency(0.5)
+    assert ctrl.pressure_level() == 2
+    assert _shed(ctrl, "ingest")
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 30)
+    assert ctrl.pressure_level() == 0
+
+
+@pytest.mark.asyncio
+async def test_read_endpoint_answers_503_under_pressure(monkeypatch):
+    monkeypatch.setattr(admission.pool_wait, "value", 10.0)
+    monkeypatch.setattr(admission.pool_wait, "ts", time.monotonic() + 60)  # freeze decay
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.get("/v1/metrics", params={"project_id": "00000000-0000-0000-0000-000000000000"})
+        health = await ac.get("/health/detailed")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == str(settings.admission_retry_after_s * 2)
+    assert health.json()["checks"]["admission"]["pressure_level"] == 2
+
+
+@pytest.mark.asyncio
+async def test_analytics_statements_do_not_feed_db_latency(monkeypatch):
+    from sqlalchemy import text
+    from nimbus.db import get_sessionmaker
+
+    samples = []
+    monkeypatch.setattr(admission, "observe_db_latency", samples.append)
+    async with get_sessionmaker()() as s:
+        await s.execute(text("SELECT pg_sleep(0.2)").execution_options(nimbus_analytics=True))
+        assert samples == []
+        await s.execute(text("SELECT 1"))
+    assert len(samples) == 1 and samples[0] < 0.2
@@ -0,0 +1,127 @@
+import gzip, hmac, hashlib, json, os, time, datetime as dt
+import pytest
+from httpx import AsyncClient, ASGITransport
+from nimbus.main import app
+from nimbus.settings import settings
+from tests.testutils import ensure_project, count_events
+
+
+def _sig_bytes(ts: int, path: str, body: bytes) -> str:
+    secret = os.getenv("INGEST_API_KEY_SECRET", "local-super-secret")
+    return hmac.new(secret.encode(), f"{ts}:POST:{path}:".encode() + body, hashlib.sha256).hexdigest()
+
+
+def _batch(pid: str, n: int) -> bytes:
+    now = dt.datetime.now(dt.timezone.utc).isoformat()
+    events = [{"name": "page_view", "ts": now, "props": {"path": "/pricing", "i": i}} for i in range(n)]
+    return json.dumps({"project_id": pid, "events": events}, separators=(",", ":")).encode()
+
+
+async def _post(key_id: str, wire: bytes, encoding: str, signed: bytes | None = None, path: str = "/v1/events", ctype="application/json"):
+    ts = int(time.time())
+    headers = {
+        "content-type": ctype,
+        "content-encoding": encoding,
+        "X-Api-Key-Id": key_id,
+        "X-Api-Timestamp": str(ts),
+        "X-Api-Signature": _sig_bytes(ts, path.split("?")[0], wire if signed is None else signed),
+    }
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        return await ac.post(path, headers=headers, content=wire)
+
+
+@pytest.mark.asyncio
+async def test_gzip_body_signed_over_compressed_bytes():
+    pid, key_id = await ensure_project()
+    raw = _batch(pid, 200)
+    r = await _post(key_id, gzip.compress(raw), "gzip")
+    assert r.status_code == 200, r.text
+    assert r.json()["accepted"] == 200
+    assert await count_events(pid) == 200
+
+    # a signature over the decompressed JSON is not valid for a compressed body
+    r = await _post(key_id, gzip.compress(raw), "gzip", signed=raw)
+    assert r.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_gzip_bomb_and_unknown_encoding_are_refused():
+    pid, key_id = await ensure_project()
+    bomb = gzip.compress(b" " * (settings.ingest_max_body_bytes + 1))
+    r = await _post(key_id, bomb, "gzip")
+    assert r.status_code == 413
+
+    r = await _post(key_id, _batch(pid, 1), "br")
+    assert r.status_code == 415
+
+    r = await _post(key_id, gzip.compress(_batch(pid, 1))[:-12], "gzip")
+    assert r.status_code == 400
+    assert await count_events(pid) == 0
+
+
+@pytest.mark.asyncio
+async def test_zstd_body_round_trip_bomb_and_truncation():
+    import zstandard
+
+    pid, key_id = await ensure_project()
+    raw = _batch(pid, 200)
+    wire = zstandard.ZstdCompressor().compress(raw)
+    r = await _post(key_id, wire, "zstd")
+    assert r.status_code == 200, r.text
+    assert r.json()["accepted"] == 200
+
+    bomb = zstandard.ZstdCompressor().compress(b" " * (settings.ingest_max_body_bytes + 1))
+    assert (await _post(key_id, bomb, "zstd")).status_code == 413
+    assert (await _post(key_id, wire[:-12], "zstd")).status_code == 400
+    assert await count_events(pid) == 200
+
+
+def _rle_frame(blocks: int) -> bytes:
+    # Frame header: no content size, window 2**17; then RLE blocks of 128 KiB from 4 bytes each
+    out = bytearray(b"\x28\xb5\x2f\xfd\x00\x38")
+    for i in range(blocks):
+        header = (128 * 1024) << 3 | 1 << 1 | (i == blocks - 1)
+        out += header.to_bytes(3, "little") + b"A"
+    return bytes(out)
+
+
+def test_zstd_decoder_bounds_output_of_stacked_rle_blocks():
+    from nimbus.content_encoding import _ZstdDecoder
+
+    frame = _rle_frame(64)  # 8 MiB from 262 bytes
+    decoder, largest = _ZstdDecoder(), []
+    inner = decoder._d
+
+    class Spy:
+        def decompress(self, data):
+            out = inner.decompress(data)
+            largest.append(len(out))
+            return out
+
+    decoder._d = Spy()
+    pieces = list(decoder.decode(frame, 64 * 1024))
+    assert sum(map(len, pieces)) == 64 * 128 * 1024
+    assert max(map(len, pieces)) == 64 * 1024
+    # never more than 32 blocks plus one buffered block in a single call
+    assert max(largest) <= 33 * 128 * 1024
+
+
+def test_gzip_decoder_yields_bounded_pieces():
+    from nimbus.content_encoding import _GzipDecoder
+
+    wire = gzip.compress(b"A" * (8 * 1024 * 1024))
+    decoder = _GzipDecoder()
+    pieces = [p for i in range(0, len(wire), 1000) for p in decoder.decode(wire[i:i + 1000], 64 * 1024)]
+    decoder.finish()
+    assert sum(map(len, pieces)) == 8 * 1024 * 1024
+    assert max(map(len, pieces)) <= 64 * 1024
+
+
+@pytest.mark.asyncio
+async def test_gzip_ndjson_stream():
+    pid, key_id = await ensure_project()
+    now = dt.datetime.now(dt.timezone.utc).isoformat()
+    body = "".join(json.dumps({"name": "click", "ts": now}) + "\n" for _ in range(50)).encode()
+    r = await _post(key_id, gzip.compress(body), "gzip", path=f"/v1/events/stream?project_id={pid}", ctype="application/x-ndjson")
+    assert r.status_code == 200, r.text
+    assert r.json()["accepted"] == 50
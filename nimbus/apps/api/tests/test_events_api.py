@@ -35,3 +35,50 @@ async def test_ingest_event_success():
     assert data["accepted"] == 1
     assert data["rejected"] == 0
     assert await count_events(pid) >= 1
+
+
+@pytest.mark.asyncio
+async def test_props_filter_with_hot_key():
+    from sqlalchemy import text
+    from nimbus.db import get_sessionmaker
+    from nimbus.security.auth import create_token
+
+    pid, key_id = await ensure_project()
+    now = dt.datetime.now(dt.timezone.utc).isoformat()
+    body_s = json.dumps({
+        "project_id": pid,
+        "events": [
+            {"name": "purchase", "ts": now, "props": {"plan": "pro", "seats": 3, "trial": False}},
+            {"name": "purchase", "ts": now, "props": {"plan": "pro", "seats": 5}},
+            {"name": "purchase", "ts": now, "props": {"plan": "free"}},
+            {"name": "purchase", "ts": now, "props": {"plan": "team", "seats": 5.0}},
+        ],
+    }, separators=(",", ":"))
+    ts = int(time.time())
+    secret = os.getenv("INGEST_API_KEY_SECRET", "local-super-secret")
+    headers = {
+        "content-type": "application/json",
+        "X-Api-Key-Id": key_id,
+        "X-Api-Timestamp": str(ts),
+        "X-Api-Signature": hmac_sig(ts, "POST", "/v1/events", body_s, secret),
+    }
+    async with get_sessionmaker()() as s:
+        await s.execute(text("UPDATE projects SET hot_props = CAST(:hot AS json) WHERE id = :id"), {"hot": '["plan", "seats", "trial"]', "id": pid})
+        await s.commit()
+
+    auth = {"Authorization": f"Bearer {create_token('user@example.com', 60)}"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        assert (await ac.post("/v1/events", headers=headers, content=body_s)).status_code == 200
+
+        async def listed(flt):
+            r = await ac.get("/v1/events", params={"project_id": pid, "props": json.dumps(flt)}, headers=auth)
+            assert r.status_code == 200
+            return r.json()["count"]
+
+        assert await listed({"plan": "pro"}) == 2
+        assert await listed({"plan": "pro", "seats": 5}) == 1
+        # jsonb equality, like @>: an int filter matches a stored 5.0
+        assert await listed({"seats": 5}) == 2
+        assert await listed({"seats": 5.0}) == 2
+        assert await listed({"trial": False}) == 1
+        assert await listed({"plan": "enterprise"}) == 0
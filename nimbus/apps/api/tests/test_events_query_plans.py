@@ -0,0 +1,71 @@
+"""
+EXPLAIN regression tests for the event listing queries.
+
+Sorts and sequential scans are disabled for the session: the planner then only
+avoids them when an index really delivers the rows in (ts DESC, id DESC) order
+and the predicates are sargable. If one still shows up, an index or the keyset
+predicate regressed. (The tiny test tables would otherwise make a seq scan win.)
+"""
+import datetime as dt
+import uuid
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from nimbus.db import get_sessionmaker
+from nimbus.repositories.events import _filtered_query, _keyset_query
+from nimbus.models.event import Event
+
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, stmt):
+        self.stmt = stmt
+
+
+@compiles(_Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.stmt, **kw)
+
+
+def _nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _nodes(child)
+
+
+async def _plan(stmt):
+    async with get_sessionmaker()() as s:
+        await s.execute(text("SET enable_seqscan = off"))
+        await s.execute(text("SET enable_sort = off"))
+        await s.execute(text("SET enable_bitmapscan = off"))
+        raw = (await s.execute(_Explain(stmt))).scalar()
+        await s.rollback()
+    return list(_nodes(raw[0]["Plan"]))
+
+
+def _assert_index_ordered(nodes):
+    kinds = [n["Node Type"] for n in nodes]
+    assert not any("Sort" in k for k in kinds), kinds
+    assert "Seq Scan" not in kinds, kinds
+    assert any(k in ("Index Scan", "Index Only Scan") for k in kinds), kinds
+
+
+CURSOR = dict(after_ts=dt.datetime(2030, 1, 1), after_id=str(uuid.uuid4()))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("filters", [{}, {"user_id": "u1"}, {"name": ["signup"]}])
+async def test_keyset_page_walks_an_index(filters):
+    nodes = await _plan(_keyset_query(str(uuid.uuid4()), 50, **CURSOR, **filters))
+    _assert_index_ordered(nodes)
+
+
+@pytest.mark.asyncio
+async def test_offset_page_walks_an_index():
+    q = _filtered_query(str(uuid.uuid4()), since=dt.datetime(2024, 1, 1))
+    nodes = await _plan(q.order_by(Event.ts.desc(), Event.id.desc()).limit(50).offset(100))
+    _assert_index_ordered(nodes)
@@ -0,0 +1,138 @@
+import asyncio
+import datetime as dt
+import json
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import text
+
+import nimbus.cache
+from nimbus.main import app
+from nimbus.db import get_sessionmaker
+from nimbus.repositories.events import bulk_insert_events
+from nimbus.repositories.funnels import fetch_funnel
+from nimbus.security.auth import create_token
+from nimbus.services.metrics import metrics_cache
+from tests.testutils import ensure_project
+
+D = dt.datetime(2001, 3, 9)
+STEPS = [{"name": "view", "props": {}}, {"name": "signup", "props": {"plan": "pro"}}, {"name": "buy", "props": {}}]
+SINCE, UNTIL, WINDOW = D.replace(hour=9, minute=30), D.replace(hour=13), dt.timedelta(hours=1)
+
+_EVENTS = [
+    # (user_id, name, minutes after midnight, props)
+    ("u1", "view", 600, {}), ("u1", "signup", 605, {"plan": "pro"}), ("u1", "buy", 630, {}),
+    # signs up after the window closed
+    ("u2", "view", 600, {}), ("u2", "signup", 720, {"plan": "pro"}),
+    # a signup before the view does not count
+    ("u3", "signup", 600, {"plan": "pro"}), ("u3", "view", 610, {}), ("u3", "signup", 620, {"plan": "pro"}),
+    # entered before since
+    ("u4", "view", 540, {}), ("u4", "signup", 580, {"plan": "pro"}),
+    # the first attempt expires, the second completes
+    ("u5", "view", 600, {}), ("u5", "view", 670, {}), ("u5", "signup", 680, {"plan": "pro"}), ("u5", "buy", 710, {}),
+    # signup with the wrong plan
+    ("u6", "view", 600, {}), ("u6", "signup", 605, {"plan": "free"}), ("u6", "buy", 610, {}),
+    # enters just before until and converts after it, within the window
+    ("u7", "view", 770, {}), ("u7", "signup", 800, {"plan": "pro"}),
+    # never entered; anonymous events are ignored
+    ("u8", "signup", 600, {"plan": "pro"}), (None, "view", 600, {}),
+]
+
+
+@pytest.fixture(autouse=True)
+def local_cache(monkeypatch):
+    # Keep the after-commit version bumps off the global Redis client (bound to one loop)
+    monkeypatch.setattr(nimbus.cache, "redis", None)
+    metrics_cache.clear_local()
+
+
+def _records(pid: str):
+    return [
+        {"project_id": uuid.UUID(pid), "name": name, "ts": D + dt.timedelta(minutes=m), "user_id": user_id, "props": props}
+        for user_id, name, m, props in _EVENTS
+    ]
+
+
+@pytest.mark.asyncio
+async def test_funnel_counts_cached_for_closed_ranges():
+    pid, _ = await ensure_project()
+    async with get_sessionmaker()() as s:
+        await bulk_insert_events(s, _records(pid))
+        await s.commit()
+
+    body = {
+        "project_id": pid,
+        "steps": STEPS,
+        "window_s": 3600,
+        "since": SINCE.isoformat() + "Z",
+        "until": UNTIL.isoformat() + "Z",
+    }
+    headers = {"Authorization": f"Bearer {create_token('user@example.com', 60)}"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.post("/v1/funnels", json=body, headers=headers)
+        assert r.status_code == 200
+        assert r.json() == {
+            "project_id": pid,
+            "since": "2001-03-09T09:30:00Z",
+            "until": "2001-03-09T13:00:00Z",
+            "window_s": 3600,
+            "steps": [
+                {"name": "view", "count": 6, "conversion": 1.0, "step_conversion": 1.0},
+                {"name": "signup", "count": 4, "conversion": 4 / 6, "step_conversion": 4 / 6},
+                {"name": "buy", "count": 2, "conversion": 2 / 6, "step_conversion": 0.5},
+            ],
+        }
+
+        # Cached: a write that bypasses the version bump is not seen...
+        async with get_sessionmaker()() as s:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, user_id, props) "
+                "VALUES (gen_random_uuid(), :pid, 'buy', :ts, 'u3', '{}')"
+            ), {"pid": pid, "ts": D + dt.timedelta(minutes=640)})
+            await s.commit()
+        r = await ac.post("/v1/funnels", json=body, headers=headers)
+        assert r.json()["steps"][2]["count"] == 2
+
+        # ...and a late event ingested normally invalidates it
+        async with get_sessionmaker()() as s:
+            await bulk_insert_events(s, [{"project_id": uuid.UUID(pid), "name": "buy", "ts": D + dt.timedelta(minutes=820), "user_id": "u7", "props": {}}])
+            await s.commit()
+        await asyncio.sleep(0.05)
+        r = await ac.post("/v1/funnels", json=body, headers=headers)
+        assert [s["count"] for s in r.json()["steps"]] == [6, 4, 4]
+
+        bad = await ac.post("/v1/funnels", json={**body, "steps": STEPS[:1]}, headers=headers)
+        assert bad.status_code == 422
+        bad = await ac.post("/v1/funnels", json={**body, "since": "2000-01-01T00:00:00Z"}, headers=headers)
+        assert bad.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_funnel_sqlite_matches_postgres():
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    pid, _ = await ensure_project()
+    async with get_sessionmaker()() as s:
+        await bulk_insert_events(s, _records(pid))
+        await s.commit()
+        pg = await fetch_funnel(s, pid, STEPS, WINDOW, SINCE, UNTIL)
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE events (id CHAR(32) PRIMARY KEY, project_id CHAR(32) NOT NULL, name VARCHAR(200) NOT NULL, "
+            "ts DATETIME NOT NULL, user_id VARCHAR(200), props JSON NOT NULL)"
+        ))
+    async with async_sessionmaker(engine)() as s:
+        for r in _records(pid):
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, user_id, props) VALUES (:id, :pid, :name, :ts, :user_id, :props)"
+            ), {"id": uuid.uuid4().hex, "pid": uuid.UUID(pid).hex, "name": r["name"],
+                "ts": r["ts"].isoformat(sep=" ", timespec="microseconds"), "user_id": r["user_id"], "props": json.dumps(r["props"])})
+        await s.commit()
+        lite = await fetch_funnel(s, pid, STEPS, WINDOW, SINCE, UNTIL)
+    await engine.dispose()
+
+    assert pg == [6, 4, 2]
+    assert lite == pg
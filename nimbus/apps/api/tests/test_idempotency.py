@@ -0,0 +1,62 @@
+import json, os, time, datetime as dt
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from nimbus.main import app
+from nimbus.repositories import events as events_repo
+from nimbus.sketches import BloomFilter
+from tests.testutils import hmac_sig, ensure_project, count_events
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bf = BloomFilter(capacity=10_000, error_rate=0.01)
+    for i in range(10_000):
+        bf.add(f"k{i}")
+    assert all(f"k{i}" in bf for i in range(10_000))
+    false_positives = sum(f"other{i}" in bf for i in range(10_000))
+    assert false_positives < 300  # ~1% expected
+
+
+async def _ingest(pid: str, key_id: str, events: list):
+    body = json.dumps({"project_id": pid, "events": events})
+    ts = int(time.time())
+    secret = os.getenv("INGEST_API_KEY_SECRET", "local-super-secret")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        return await ac.post(
+            "/v1/events",
+            content=body,
+            headers={
+                "content-type": "application/json",
+                "X-Api-Key-Id": key_id,
+                "X-Api-Timestamp": str(ts),
+                "X-Api-Signature": hmac_sig(ts, "POST", "/v1/events", body, secret),
+            },
+        )
+
+
+@pytest.mark.asyncio
+async def test_retried_batch_is_not_double_counted(monkeypatch):
+    from nimbus.services import live
+
+    monkeypatch.setattr(live, "live_counters", live.LiveCounters(900))
+    pid, key_id = await ensure_project()
+    now = dt.datetime.now(dt.timezone.utc).isoformat()
+    events = [{"name": "purchase", "ts": now, "idempotency_key": f"order-{i}"} for i in range(5)]
+    events.append({"name": "purchase", "ts": now, "idempotency_key": "order-0"})  # repeat inside the batch
+    events.append({"name": "page_view", "ts": now})  # no key: always inserted
+
+    r = await _ingest(pid, key_id, events)
+    assert r.status_code == 200, r.text
+    assert (r.json()["accepted"], r.json()["rejected"]) == (6, 1)
+
+    r = await _ingest(pid, key_id, events)  # SDK retry
+    assert (r.json()["accepted"], r.json()["rejected"]) == (1, 6)
+
+    # key stored by "another process": the local filter has never seen it
+    events_repo._seen_keys.clear()
+    r = await _ingest(pid, key_id, events[:5] + [{"name": "purchase", "ts": now, "idempotency_key": "order-new"}])
+    assert (r.json()["accepted"], r.json()["rejected"]) == (1, 5)
+
+    assert await count_events(pid) == 8
+    # live counters only see the rows written
+    assert sum(live.live_counters.local(pid, 0, unflushed=False).values()) == 8
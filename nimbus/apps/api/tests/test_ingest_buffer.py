@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+
+from nimbus.services.ingest_buffer import IngestBuffer
+
+
+class _Sink:
+    def __init__(self, fail_times: int = 0):
+        self.batches = []
+        self.fail_times = fail_times
+
+    async def __call__(self, records):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("db down")
+        self.batches.append(list(records))
+        return len(records)
+
+
+@pytest.mark.asyncio
+async def test_buffer_flushes_on_size_threshold():
+    sink = _Sink()
+    buf = IngestBuffer(max_events=100, flush_events=10, flush_interval=60, flush_fn=sink)
+    buf.start()
+    for i in range(3):
+        assert buf.offer([{"i": i * 5 + j} for j in range(5)])
+    await asyncio.sleep(0.05)
+    # 15 queued -> one full batch of 10 flushed right away, 5 wait for the timer
+    assert [len(b) for b in sink.batches] == [10]
+    await buf.stop()
+    assert [len(b) for b in sink.batches] == [10, 5]
+    assert [r["i"] for b in sink.batches for r in b] == list(range(15))
+
+
+@pytest.mark.asyncio
+async def test_buffer_flushes_on_interval():
+    sink = _Sink()
+    buf = IngestBuffer(max_events=100, flush_events=1000, flush_interval=0.02, flush_fn=sink)
+    buf.start()
+    buf.offer([{"i": 1}, {"i": 2}])
+    await asyncio.sleep(0.1)
+    assert sum(len(b) for b in sink.batches) == 2
+    await buf.stop()
+
+
+@pytest.mark.asyncio
+async def test_buffer_rejects_when_full():
+    buf = IngestBuffer(max_events=3, flush_events=1000, flush_interval=60, flush_fn=_Sink())
+    assert buf.offer([{}, {}])
+    assert not buf.offer([{}, {}])
+    assert len(buf) == 2
+
+
+@pytest.mark.asyncio
+async def test_buffer_retries_failed_flush():
+    sink = _Sink(fail_times=1)
+    buf = IngestBuffer(max_events=100, flush_events=2, flush_interval=0.01, flush_fn=sink)
+    buf.start()
+    buf.offer([{"i": 1}, {"i": 2}])
+    await asyncio.sleep(0.1)
+    await buf.stop()
+    assert [r["i"] for b in sink.batches for r in b] == [1, 2]
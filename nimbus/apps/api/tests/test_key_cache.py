@@ -0,0 +1,50 @@
+import time
+import uuid
+import pytest
+
+from nimbus.db import get_sessionmaker
+from nimbus.repositories.projects import rotate_project_key, delete_project
+from nimbus.security.key_cache import ApiKeyCache, CachedKey, key_cache, lookup_api_key
+from tests.testutils import ensure_project
+
+
+def test_lru_ttl_and_negative_entries(monkeypatch):
+    cache = ApiKeyCache(max_entries=2, ttl=60, negative_ttl=1)
+    a = CachedKey(uuid.uuid4(), b"a")
+    cache.put("a", a)
+    cache.put("b", CachedKey(uuid.uuid4(), b"b"))
+    assert cache.get("a") == (True, a)  # "a" is now most recently used
+    cache.put("c", None)
+    assert cache.get("b") == (False, None)  # evicted
+    assert cache.get("c") == (True, None)  # negative entry
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 2)
+    assert cache.get("c") == (False, None)  # negative TTL elapsed
+    assert cache.get("a") == (True, a)
+
+
+@pytest.mark.asyncio
+async def test_rotate_and_delete_invalidate_after_commit():
+    pid, kid = await ensure_project()
+    Session = get_sessionmaker()
+
+    async with Session() as s:
+        assert (await lookup_api_key(s, kid)).project_id == uuid.UUID(pid)
+    assert key_cache.get(kid)[0]
+
+    async with Session() as s:
+        _, new_kid, _ = await rotate_project_key(s, pid)
+        # a concurrent request re-caching the old row before commit is dropped again on commit
+        key_cache.put(kid, CachedKey(uuid.UUID(pid), b"stale"))
+        await s.commit()
+    assert key_cache.get(kid) == (False, None)
+
+    async with Session() as s:
+        assert await lookup_api_key(s, kid) is None  # now negatively cached
+        assert (await lookup_api_key(s, new_kid)).project_id == uuid.UUID(pid)
+
+    async with Session() as s:
+        assert await delete_project(s, pid)
+        await s.commit()
+    assert key_cache.get(new_kid) == (False, None)
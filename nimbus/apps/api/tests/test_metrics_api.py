@@ -1,4 +1,4 @@
-import json, time, os, datetime as dt
+import json, time, os, uuid, datetime as dt
 import pytest
 from httpx import AsyncClient, ASGITransport
 from nimbus.main import app
@@ -45,3 +45,750 @@ async def test_metrics_flow_after_ingest():
     assert "series" in payload
     assert isinstance(payload["series"], list)
     assert all("ts" in p and "value" in p for p in payload["series"])
+
+
+def test_metrics_window_covers_requested_buckets():
+    from nimbus.repositories.metrics import bucket_window
+
+    start, end, since, until = bucket_window("1h", 24)
+    now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+    assert start.minute == 0 and start.second == 0 and since == start
+    assert dt.timedelta(hours=23) <= now - start < dt.timedelta(hours=24)
+    assert end - start == dt.timedelta(hours=24) and until == end
+    assert bucket_window("1d", 1)[0].hour == 0
+
+    # 15-minute buckets are aligned to the quarter hour, not truncated to the minute
+    start, end, since, until = bucket_window("15m", 4, until=dt.datetime(2024, 5, 1, 10, 20))
+    assert (start, end) == (dt.datetime(2024, 5, 1, 9, 30), dt.datetime(2024, 5, 1, 10, 30))
+    assert until == dt.datetime(2024, 5, 1, 10, 20)
+
+    # an explicit range wider than limit keeps the most recent buckets
+    start, _, since, _ = bucket_window(
+        "1h", 2, since=dt.datetime(2024, 5, 1, 0, 30, tzinfo=dt.timezone.utc), until=dt.datetime(2024, 5, 1, 12)
+    )
+    assert start == since == dt.datetime(2024, 5, 1, 10)
+    start, _, since, _ = bucket_window("1h", 24, since=dt.datetime(2024, 5, 1, 9, 30), until=dt.datetime(2024, 5, 1, 12))
+    assert (start, since) == (dt.datetime(2024, 5, 1, 9), dt.datetime(2024, 5, 1, 9, 30))
+
+
+@pytest.mark.asyncio
+async def test_metrics_reads_rollups_plus_raw_tail():
+    from sqlalchemy import text
+    from nimbus.db import get_sessionmaker
+    from nimbus.repositories.metrics import fetch_metrics
+
+    pid, _ = await ensure_project()
+    now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    earlier = hour - dt.timedelta(hours=1)
+    Session = get_sessionmaker()
+    async with Session() as s:
+        saved = (await s.execute(text("SELECT processed_until FROM rollup_watermarks WHERE name = 'events'"))).scalar()
+        watermark = dt.datetime.now() - dt.timedelta(minutes=10)
+        await s.execute(text(
+            "INSERT INTO rollup_watermarks (name, processed_until) VALUES ('events', :wm) "
+            "ON CONFLICT (name) DO UPDATE SET processed_until = EXCLUDED.processed_until"
+        ), {"wm": watermark})
+        # already folded: the rollup counts 7, its raw row must not be counted again
+        await s.execute(text(
+            "INSERT INTO event_rollups (project_id, granularity, bucket_start, name, count) "
+            "VALUES (:pid, 'hour', :b, 'pv', 7)"
+        ), {"pid": pid, "b": earlier})
+        await s.execute(text(
+            "INSERT INTO events (id, project_id, name, ts, props, created_at) "
+            "VALUES (gen_random_uuid(), :pid, 'pv', :ts, '{}', :created)"
+        ), {"pid": pid, "ts": earlier + dt.timedelta(minutes=5), "created": watermark - dt.timedelta(minutes=1)})
+        # inserted after the watermark: read from events
+        for _ in range(2):
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, props) VALUES (gen_random_uuid(), :pid, 'pv', :ts, '{}')"
+            ), {"pid": pid, "ts": now})
+        await s.commit()
+        try:
+            series = await fetch_metrics(s, pid, "1h", 3)
+        finally:
+            if saved is None:
+                await s.execute(text("DELETE FROM rollup_watermarks WHERE name = 'events'"))
+            else:
+                await s.execute(text("UPDATE rollup_watermarks SET processed_until = :wm WHERE name = 'events'"), {"wm": saved})
+            await s.commit()
+
+    assert series == [
+        {"ts": (earlier - dt.timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:00Z"), "value": 0},
+        {"ts": earlier.strftime("%Y-%m-%dT%H:%M:00Z"), "value": 7},
+        {"ts": hour.strftime("%Y-%m-%dT%H:%M:00Z"), "value": 2},
+    ]
+
+
+# Fixed, far-past timestamps so other tests' events never land in the window
+_SUB_HOUR_EVENTS = [
+    dt.datetime(2001, 3, 4, 9, 58),
+    dt.datetime(2001, 3, 4, 10, 0, 30),
+    dt.datetime(2001, 3, 4, 10, 14, 59),
+    dt.datetime(2001, 3, 4, 10, 15),
+    dt.datetime(2001, 3, 4, 10, 52),
+]
+_SUB_HOUR_EXPECTED = [
+    {"ts": "2001-03-04T10:00:00Z", "value": 2},
+    {"ts": "2001-03-04T10:15:00Z", "value": 1},
+    {"ts": "2001-03-04T10:30:00Z", "value": 0},
+    {"ts": "2001-03-04T10:45:00Z", "value": 1},
+]
+
+
+@pytest.mark.asyncio
+async def test_metrics_sub_hour_buckets_gap_filled_pg_and_sqlite_agree():
+    import uuid
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from nimbus.db import get_sessionmaker
+    from nimbus.repositories.metrics import fetch_metrics
+
+    # since=10:00:30 cuts the first bucket; until=10:55 ends inside the last one
+    window = dict(bucket="15m", limit=24, since=dt.datetime(2001, 3, 4, 10, 0, 30), until=dt.datetime(2001, 3, 4, 10, 55))
+
+    pid, _ = await ensure_project()
+    Session = get_sessionmaker()
+    async with Session() as s:
+        for ts in _SUB_HOUR_EVENTS:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, props) VALUES (gen_random_uuid(), :pid, 'pv', :ts, '{}')"
+            ), {"pid": pid, "ts": ts})
+        await s.commit()
+        pg_series = await fetch_metrics(s, pid, **window)
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE events (id CHAR(32) PRIMARY KEY, project_id CHAR(32) NOT NULL, name VARCHAR(200) NOT NULL, "
+            "ts DATETIME NOT NULL, props JSON NOT NULL, created_at DATETIME, updated_at DATETIME)"
+        ))
+    async with async_sessionmaker(engine)() as s:
+        for ts in _SUB_HOUR_EVENTS:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, props, created_at, updated_at) "
+                "VALUES (:id, :pid, 'pv', :ts, '{}', :ts, :ts)"
+            ), {"id": uuid.uuid4().hex, "pid": uuid.UUID(pid).hex, "ts": ts.isoformat(sep=" ", timespec="microseconds")})
+        await s.commit()
+        sqlite_series = await fetch_metrics(s, pid, **window)
+    await engine.dispose()
+
+    assert pg_series == _SUB_HOUR_EXPECTED
+    assert sqlite_series == pg_series
+
+
+_BREAKDOWN_EVENTS = [
+    # (name, ts, user_id, props)
+    ("signup", dt.datetime(2001, 3, 5, 9, 45), "u1", {"plan": "pro"}),
+    ("signup", dt.datetime(2001, 3, 5, 10, 5), "u2", {"plan": "free"}),
+    ("signup", dt.datetime(2001, 3, 5, 11, 59), "u1", {"plan": "pro"}),
+    ("login", dt.datetime(2001, 3, 5, 10, 30), "u1", {}),
+    ("login", dt.datetime(2001, 3, 5, 12, 10), None, {"plan": "pro"}),
+    ("logout", dt.datetime(2001, 3, 5, 10, 40), "u3", {"plan": "team"}),
+    ("purchase", dt.datetime(2001, 3, 5, 11, 0), "u2", {"plan": "pro"}),
+    ("purchase", dt.datetime(2001, 3, 5, 13, 0), "u2", {}),  # outside the window
+]
+
+
+@pytest.mark.asyncio
+async def test_breakdown_top_n_with_other_from_rollups_and_raw():
+    from sqlalchemy import text
+    from nimbus.db import get_sessionmaker
+    from nimbus.repositories.metrics import fetch_breakdown
+    from nimbus.security.auth import create_token
+
+    pid, _ = await ensure_project()
+    since, until = dt.datetime(2001, 3, 5, 9, 30), dt.datetime(2001, 3, 5, 12, 30)
+    Session = get_sessionmaker()
+    async with Session() as s:
+        saved = (await s.execute(text("SELECT processed_until FROM rollup_watermarks WHERE name = 'events'"))).scalar()
+        await s.execute(text(
+            "INSERT INTO rollup_watermarks (name, processed_until) VALUES ('events', now() - interval '10 minutes') "
+            "ON CONFLICT (name) DO UPDATE SET processed_until = EXCLUDED.processed_until"
+        ))
+        # folded before the watermark: only the rollup row may count these 4 logins
+        await s.execute(text(
+            "INSERT INTO event_rollups (project_id, granularity, bucket_start, name, count) "
+            "VALUES (:pid, 'hour', '2001-03-05 11:00', 'login', 4)"
+        ), {"pid": pid})
+        for name, ts, user_id, props in _BREAKDOWN_EVENTS:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, user_id, props) "
+                "VALUES (gen_random_uuid(), :pid, :name, :ts, :user_id, CAST(:props AS jsonb))"
+            ), {"pid": pid, "name": name, "ts": ts, "user_id": user_id, "props": json.dumps(props)})
+        await s.commit()
+        try:
+            by_name = await fetch_breakdown(s, pid, "name", 2, since, until)
+        finally:
+            if saved is None:
+                await s.execute(text("DELETE FROM rollup_watermarks WHERE name = 'events'"))
+            else:
+                await s.execute(text("UPDATE rollup_watermarks SET processed_until = :wm WHERE name = 'events'"), {"wm": saved})
+            await s.commit()
+
+    assert by_name == {
+        "groups": [{"key": "login", "value": 6}, {"key": "signup", "value": 3}],
+        "other": 2,
+        "total": 11,
+    }
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.get(
+            "/v1/metrics/breakdown",
+            params={"project_id": pid, "by": "props.plan", "top": 1, "since": "2001-03-05T09:30:00Z", "until": "2001-03-05T12:30:00Z"},
+            headers={"Authorization": f"Bearer {create_token('user@example.com', 60)}"},
+        )
+        assert r.status_code == 200
+        # events without the prop form their own null group; the rest fall into other
+        assert r.json() == {
+            "metric": "events.count",
+            "by": "props.plan",
+            "since": "2001-03-05T09:30:00Z",
+            "until": "2001-03-05T12:30:00Z",
+            "groups": [{"key": "pro", "value": 4}],
+            "other": 3,
+            "total": 7,
+        }
+        bad = await ac.get(
+            "/v1/metrics/breakdown",
+            params={"project_id": pid, "by": "props.a'b"},
+            headers={"Authorization": f"Bearer {create_token('user@example.com', 60)}"},
+        )
+        assert bad.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_default_breakdown_window_is_shared(monkeypatch):
+    import asyncio
+    from nimbus.services import metrics as svc
+
+    calls = []
+
+    async def fetch(session, project_id, by, top, since, until):
+        calls.append(until)
+        await asyncio.sleep(0.05)
+        return {"groups": [], "other": 0, "total": 0}
+
+    monkeypatch.setattr(svc, "fetch_breakdown", fetch)
+    pid = str(uuid.uuid4())
+    a, b = await asyncio.gather(svc.get_breakdown(None, pid, "name"), svc.get_breakdown(None, pid, "name"))
+    assert len(calls) == 1
+    assert a["until"] == b["until"] and a["until"].second == 0 and a["until"].microsecond == 0
+
+
+@pytest.mark.asyncio
+async def test_breakdown_sqlite_matches_postgres():
+    import uuid
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from nimbus.db import get_sessionmaker
+    from nimbus.repositories.metrics import fetch_breakdown
+
+    pid, _ = await ensure_project()
+    since, until = dt.datetime(2001, 3, 5, 9, 30), dt.datetime(2001, 3, 5, 12, 30)
+    async with get_sessionmaker()() as s:
+        for name, ts, user_id, props in _BREAKDOWN_EVENTS:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, user_id, props) "
+                "VALUES (gen_random_uuid(), :pid, :name, :ts, :user_id, CAST(:props AS jsonb))"
+            ), {"pid": pid, "name": name, "ts": ts, "user_id": user_id, "props": json.dumps(props)})
+        await s.commit()
+        pg = {by: await fetch_breakdown(s, pid, by, 2, since, until) for by in ("user_id", "props.plan")}
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE events (id CHAR(32) PRIMARY KEY, project_id CHAR(32) NOT NULL, name VARCHAR(200) NOT NULL, "
+            "ts DATETIME NOT NULL, user_id VARCHAR(200), props JSON NOT NULL)"
+        ))
+    async with async_sessionmaker(engine)() as s:
+        for name, ts, user_id, props in _BREAKDOWN_EVENTS:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, user_id, props) VALUES (:id, :pid, :name, :ts, :user_id, :props)"
+            ), {"id": uuid.uuid4().hex, "pid": uuid.UUID(pid).hex, "name": name,
+                "ts": ts.isoformat(sep=" ", timespec="microseconds"), "user_id": user_id, "props": json.dumps(props)})
+        await s.commit()
+        lite = {by: await fetch_breakdown(s, pid, by, 2, since, until) for by in ("user_id", "props.plan")}
+    await engine.dispose()
+
+    assert pg["user_id"] == {"groups": [{"key": "u1", "value": 3}, {"key": "u2", "value": 2}], "other": 2, "total": 7}
+    assert lite == pg
+
+
+def test_hyperloglog_estimate_and_merge():
+    import hashlib
+    from nimbus.sketches import HyperLogLog
+
+    def h(s: str) -> int:
+        return int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+
+    a, b = HyperLogLog(), HyperLogLog()
+    for i in range(60_000):
+        a.add_hash(h(f"user-{i}"))
+    for i in range(40_000, 100_000):
+        b.add_hash(h(f"user-{i}"))
+    both = HyperLogLog.union([a, b])
+    assert abs(both.estimate() - 100_000) < 3 * both.error * 100_000
+    assert abs(len(a) - 60_000) < 3 * a.error * 60_000
+    # Merging is a register-wise max: adding b's users to a gives the same sketch
+    for i in range(60_000, 100_000):
+        a.add_hash(h(f"user-{i}"))
+    assert a.to_bytes() == both.to_bytes()
+    assert HyperLogLog.from_bytes(both.to_bytes()).estimate() == both.estimate()
+    assert len(HyperLogLog()) == 0
+
+
+@pytest.mark.asyncio
+async def test_unique_users_from_sketches_raw_tail_and_rolling_window():
+    from sqlalchemy import text
+    from nimbus.db import get_sessionmaker
+    from nimbus.sketches import HyperLogLog
+    from nimbus.sketches.hll import relative_error
+
+    pid, _ = await ensure_project()
+    d1, d2, d3 = dt.datetime(2001, 3, 6), dt.datetime(2001, 3, 7), dt.datetime(2001, 3, 8)
+    Session = get_sessionmaker()
+    async with Session() as s:
+        saved = (await s.execute(text("SELECT processed_until FROM rollup_watermarks WHERE name = 'events'"))).scalar()
+        watermark = dt.datetime.now() - dt.timedelta(minutes=10)
+        await s.execute(text(
+            "INSERT INTO rollup_watermarks (name, processed_until) VALUES ('events', :wm) "
+            "ON CONFLICT (name) DO UPDATE SET processed_until = EXCLUDED.processed_until"
+        ), {"wm": watermark})
+        # d1 was folded: its sketch holds u0..u299 though only a few raw rows remain
+        hashes = (await s.execute(
+            text("SELECT hashtextextended(u, 0) FROM unnest(CAST(:users AS text[])) AS u"),
+            {"users": [f"u{i}" for i in range(300)]},
+        )).scalars().all()
+        sketch = HyperLogLog()
+        for value in hashes:
+            sketch.add_hash(value)
+        await s.execute(text(
+            "INSERT INTO user_sketches (project_id, granularity, bucket_start, registers) VALUES (:pid, 'day', :b, :r)"
+        ), {"pid": pid, "b": d1, "r": sketch.to_bytes()})
+        rows = [(f"u{i}", d1 + dt.timedelta(hours=1), watermark - dt.timedelta(minutes=1)) for i in range(5)]
+        # d2 after the watermark (raw tail); d3 cut by until=12:00
+        rows += [(f"u{i}", d2 + dt.timedelta(minutes=i), None) for i in range(200, 500)]
+        rows += [(f"u{i}", d3 + dt.timedelta(hours=1), None) for i in range(450, 460)]
+        rows += [("u999", d3 + dt.timedelta(hours=13), None)]
+        for user_id, ts, created in rows:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, props, user_id, created_at) "
+                "VALUES (gen_random_uuid(), :pid, 'pv', :ts, '{}', :uid, COALESCE(:created, now()))"
+            ), {"pid": pid, "ts": ts, "uid": user_id, "created": created})
+        await s.commit()
+        try:
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+                headers = {"Authorization": f"Bearer {create_token('user@example.com', 60)}"}
+                r = await ac.get("/v1/metrics", headers=headers, params={
+                    "project_id": pid, "metric": "users.unique", "bucket": "1d", "limit": 3, "rolling": 2,
+                    "since": "2001-03-06T00:00:00Z", "until": "2001-03-08T12:00:00Z",
+                })
+                bad = await ac.get("/v1/metrics", headers=headers, params={"project_id": pid, "metric": "users.unique", "bucket": "5m"})
+                too_wide = await ac.get("/v1/metrics", headers=headers, params={
+                    "project_id": pid, "metric": "users.unique", "limit": 1000, "rolling": 90,
+                })
+        finally:
+            if saved is None:
+                await s.execute(text("DELETE FROM rollup_watermarks WHERE name = 'events'"))
+            else:
+                await s.execute(text("UPDATE rollup_watermarks SET processed_until = :wm WHERE name = 'events'"), {"wm": saved})
+            await s.commit()
+
+    assert r.status_code == 200
+    body = r.json()
+    assert (body["metric"], body["rolling"], body["error"]) == ("users.unique", 2, relative_error())
+    assert [p["ts"] for p in body["series"]] == ["2001-03-06T00:00:00Z", "2001-03-07T00:00:00Z", "2001-03-08T00:00:00Z"]
+    # d1 alone (nothing the day before), d1+d2, d2+d3 (u999 is after until)
+    for point, exact in zip(body["series"], [300, 500, 300]):
+        assert abs(point["value"] - exact) <= 0.02 * exact
+    assert abs(body["total"] - 500) <= 10
+    assert bad.status_code == 400
+    assert too_wide.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_unique_users_closed_windows_are_cached(monkeypatch):
+    import nimbus.cache
+    from nimbus.services import metrics as svc
+
+    monkeypatch.setattr(nimbus.cache, "redis", None)
+    calls = []
+
+    async def fetch(session, project_id, bucket, limit, since, until, rolling):
+        calls.append(until)
+        return {"series": [], "total": len(calls), "error": 0.0}
+
+    monkeypatch.setattr(svc, "fetch_unique_users", fetch)
+    pid = str(uuid.uuid4())
+    closed = dict(bucket="1d", limit=3, until=dt.datetime(2001, 3, 8), rolling=7)
+    assert (await svc.get_unique_users(None, pid, **closed))["total"] == 1
+    assert (await svc.get_unique_users(None, pid, **closed))["total"] == 1
+    # the current bucket is still filling: never cached
+    await svc.get_unique_users(None, pid, limit=2)
+    await svc.get_unique_users(None, pid, limit=2)
+    assert len(calls) == 3
+    # a late write to a closed day invalidates
+    svc.metrics_cache.bump_local(pid, svc.version_fields(dt.datetime(2001, 3, 7), svc._utcnow()))
+    assert (await svc.get_unique_users(None, pid, **closed))["total"] == 4
+
+
+@pytest.mark.asyncio
+async def test_unique_users_sqlite_exact():
+    import uuid
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from nimbus.repositories.metrics import fetch_unique_users
+
+    pid = str(uuid.uuid4())
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE events (id CHAR(32) PRIMARY KEY, project_id CHAR(32) NOT NULL, name VARCHAR(200) NOT NULL, "
+            "ts DATETIME NOT NULL, user_id VARCHAR(200), props JSON NOT NULL)"
+        ))
+    async with async_sessionmaker(engine)() as s:
+        for user_id, ts in [("a", "2001-03-06 01:00"), ("b", "2001-03-06 02:00"), ("a", "2001-03-06 03:00"),
+                            ("c", "2001-03-06 03:30"), (None, "2001-03-06 03:40"), ("a", "2001-03-06 05:00")]:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, user_id, props) VALUES (:id, :pid, 'pv', :ts, :uid, '{}')"
+            ), {"id": uuid.uuid4().hex, "pid": uuid.UUID(pid).hex, "ts": ts + ":00.000000", "uid": user_id})
+        await s.commit()
+        result = await fetch_unique_users(
+            s, pid, "1h", 4, since=dt.datetime(2001, 3, 6, 2), until=dt.datetime(2001, 3, 6, 6), rolling=2
+        )
+    await engine.dispose()
+
+    assert result == {
+        "series": [
+            {"ts": "2001-03-06T02:00:00Z", "value": 2},  # 01:00 + 02:00
+            {"ts": "2001-03-06T03:00:00Z", "value": 3},
+            {"ts": "2001-03-06T04:00:00Z", "value": 2},
+            {"ts": "2001-03-06T05:00:00Z", "value": 1},
+        ],
+        "total": 3,
+        "error": 0.0,
+    }
+
+
+def test_ddsketch_quantiles_within_relative_accuracy():
+    import random
+    from nimbus.sketches import DDSketch
+
+    rng = random.Random(7)
+    values = [rng.lognormvariate(3, 1.5) for _ in range(20_000)] + [0.0] * 50 + [-rng.expovariate(0.1) for _ in range(500)]
+    a, b = DDSketch(), DDSketch()
+    for i, x in enumerate(values):
+        (a if i % 2 else b).add(x)
+    both = DDSketch.union([a, b])
+    assert both.count == len(values)
+    exact = sorted(values)
+    for q in (0.0, 0.01, 0.02, 0.025, 0.5, 0.9, 0.95, 0.99, 0.999, 1.0):
+        want = exact[int(q * (len(exact) - 1))]
+        got = both.quantile(q)
+        assert abs(got - want) <= both.alpha * abs(want), (q, got, want)
+    assert DDSketch().quantile(0.5) is None
+
+
+@pytest.mark.asyncio
+async def test_prop_quantiles_from_bins_and_raw_tail():
+    from sqlalchemy import text
+    from nimbus.db import get_sessionmaker
+    from nimbus.sketches import DDSketch
+
+    pid, _ = await ensure_project()
+    h1, h2 = dt.datetime(2001, 3, 10, 10), dt.datetime(2001, 3, 10, 11)
+    headers = {"Authorization": f"Bearer {create_token('user@example.com', 60)}"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.patch(f"/v1/projects/{pid}", json={"numeric_props": ["ms"]}, headers=headers)
+        assert r.status_code == 200 and r.json()["numeric_props"] == ["ms"]
+
+    sketch = DDSketch()
+    async with get_sessionmaker()() as s:
+        saved = (await s.execute(text("SELECT processed_until FROM rollup_watermarks WHERE name = 'events'"))).scalar()
+        await s.execute(text(
+            "INSERT INTO rollup_watermarks (name, processed_until) VALUES ('events', now() - interval '10 minutes') "
+            "ON CONFLICT (name) DO UPDATE SET processed_until = EXCLUDED.processed_until"
+        ))
+        # h1 was folded: 90 x 10ms and 10 x 1000ms
+        for x, n in ((10, 90), (1000, 10)):
+            sign, bin = sketch.key(x)
+            await s.execute(text(
+                "INSERT INTO prop_sketch_bins (project_id, prop, granularity, bucket_start, name, sign, bin, count) "
+                "VALUES (:pid, 'ms', 'hour', :b, 'req', :sign, :bin, :n)"
+            ), {"pid": pid, "b": h1, "sign": sign, "bin": bin, "n": n})
+        # h2 is only in raw events: 1..100ms, plus an event of another name and a non-number
+        rows = [("req", h2 + dt.timedelta(seconds=i), {"ms": i}) for i in range(1, 101)]
+        rows += [("other", h2, {"ms": 5000}), ("req", h2, {"ms": "fast"})]
+        for name, ts, props in rows:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, props) VALUES (gen_random_uuid(), :pid, :name, :ts, CAST(:props AS jsonb))"
+            ), {"pid": pid, "name": name, "ts": ts, "props": json.dumps(props)})
+        await s.commit()
+        try:
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+                params = {"project_id": pid, "bucket": "1h", "limit": 3, "since": "2001-03-10T10:00:00Z", "until": "2001-03-10T13:00:00Z", "name": "req"}
+                # the worker has not built the history of "ms" yet: its bins are not used
+                unfolded = await ac.get("/v1/metrics", params={**params, "metric": "props.ms.p50"}, headers=headers)
+                await s.execute(text("UPDATE projects SET numeric_props_folded = CAST('[\"ms\"]' AS json) WHERE id = :pid"), {"pid": pid})
+                await s.commit()
+                p50 = await ac.get("/v1/metrics", params={**params, "metric": "props.ms.p50"}, headers=headers)
+                p99 = await ac.get("/v1/metrics", params={**params, "metric": "props.ms.p99"}, headers=headers)
+                undeclared = await ac.get("/v1/metrics", params={**params, "metric": "props.latency.p50"}, headers=headers)
+                minutes = await ac.get("/v1/metrics", params={**params, "metric": "props.ms.p50", "bucket": "5m"}, headers=headers)
+        finally:
+            if saved is None:
+                await s.execute(text("DELETE FROM rollup_watermarks WHERE name = 'events'"))
+            else:
+                await s.execute(text("UPDATE rollup_watermarks SET processed_until = :wm WHERE name = 'events'"), {"wm": saved})
+            await s.commit()
+
+    def close(got, want):
+        return abs(got - want) <= 0.01 * want
+
+    values = [p["value"] for p in unfolded.json()["series"]]
+    assert values[0] is None and close(values[1], 50) and values[2] is None
+    assert p50.status_code == 200
+    body = p50.json()
+    assert body["error"] == 0.01
+    assert [p["ts"] for p in body["series"]] == ["2001-03-10T10:00:00Z", "2001-03-10T11:00:00Z", "2001-03-10T12:00:00Z"]
+    values = [p["value"] for p in body["series"]]
+    assert close(values[0], 10) and close(values[1], 50) and values[2] is None
+    assert close(body["total"], 10)  # 90 x 10ms, then 1..100: the 100th of 200 values is 10
+    values = [p["value"] for p in p99.json()["series"]]
+    assert close(values[0], 1000) and close(values[1], 99)
+    assert undeclared.status_code == 400
+    assert minutes.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_prop_quantiles_skip_numbers_beyond_float8():
+    from sqlalchemy import text
+    from nimbus.db import get_sessionmaker
+
+    pid, _ = await ensure_project()
+    headers = {"Authorization": f"Bearer {create_token('user@example.com', 60)}"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.patch(f"/v1/projects/{pid}", json={"numeric_props": ["amount"]}, headers=headers)
+        assert r.status_code == 200
+    hour = dt.datetime(2001, 4, 2, 10)
+    async with get_sessionmaker()() as s:
+        for amount in ["1" + "0" * 400, "1e-400", "7"]:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, props) VALUES (gen_random_uuid(), :pid, 'pay', :ts, CAST(:props AS jsonb))"
+            ), {"pid": pid, "ts": hour, "props": f'{{"amount": {amount}}}'})
+        await s.commit()
+    params = {"project_id": pid, "metric": "props.amount.p50", "bucket": "1h", "limit": 1,
+              "since": "2001-04-02T10:00:00Z", "until": "2001-04-02T11:00:00Z"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.get("/v1/metrics", params=params, headers=headers)
+    assert r.status_code == 200, r.text
+    assert abs(r.json()["series"][0]["value"] - 7) <= 0.07
+
+
+@pytest.mark.asyncio
+async def test_prop_quantiles_sqlite():
+    import uuid
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from nimbus.repositories.metrics import fetch_prop_quantiles
+
+    pid = str(uuid.uuid4())
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE events (id CHAR(32) PRIMARY KEY, project_id CHAR(32) NOT NULL, name VARCHAR(200) NOT NULL, "
+            "ts DATETIME NOT NULL, props JSON NOT NULL)"
+        ))
+    async with async_sessionmaker(engine)() as s:
+        rows = [("req", dt.datetime(2001, 3, 10, 11) + dt.timedelta(seconds=i), {"ms": i}) for i in range(1, 101)]
+        rows += [("req", dt.datetime(2001, 3, 10, 11), {"ms": "fast"}), ("other", dt.datetime(2001, 3, 10, 11), {"ms": 5000})]
+        for name, ts, props in rows:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, props) VALUES (:id, :pid, :name, :ts, :props)"
+            ), {"id": uuid.uuid4().hex, "pid": uuid.UUID(pid).hex, "name": name,
+                "ts": ts.isoformat(sep=" ", timespec="microseconds"), "props": json.dumps(props)})
+        await s.commit()
+        result = await fetch_prop_quantiles(
+            s, pid, "ms", 0.5, "1h", 2, since=dt.datetime(2001, 3, 10, 10), until=dt.datetime(2001, 3, 10, 12), name="req"
+        )
+    await engine.dispose()
+
+    assert result["series"][0] == {"ts": "2001-03-10T10:00:00Z", "value": None}
+    assert abs(result["series"][1]["value"] - 50) <= 0.5
+    assert result["total"] == result["series"][1]["value"]
+
+
+def test_topk_cover_uses_days_inside_and_hours_at_the_edges():
+    from nimbus.services.topk import cover, hour_range
+
+    lo, hi = hour_range(dt.datetime(2002, 3, 1, 22, 30), dt.datetime(2002, 3, 4, 1, 5))
+    assert (lo, hi) == (dt.datetime(2002, 3, 1, 22), dt.datetime(2002, 3, 4, 2))
+    assert cover(lo, hi) == [
+        ("hour", dt.datetime(2002, 3, 1, 22)), ("hour", dt.datetime(2002, 3, 1, 23)),
+        ("day", dt.datetime(2002, 3, 2)), ("day", dt.datetime(2002, 3, 3)),
+        ("hour", dt.datetime(2002, 3, 4, 0)), ("hour", dt.datetime(2002, 3, 4, 1)),
+    ]
+    assert cover(dt.datetime(2002, 3, 1, 5), dt.datetime(2002, 3, 1, 7)) == [
+        ("hour", dt.datetime(2002, 3, 1, 5)), ("hour", dt.datetime(2002, 3, 1, 6)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_topk_merged_summaries_bound_true_counts(redis_client, monkeypatch):
+    import random
+    import uuid
+    from collections import Counter
+    from nimbus.services import topk
+    from nimbus.settings import settings
+
+    client = redis_client
+    monkeypatch.setattr(settings, "topk_capacity", 10)
+    monkeypatch.setattr(settings, "topk_props", ["page"])
+    pid = uuid.uuid4()
+    rng = random.Random(11)
+    start = dt.datetime(2002, 3, 1, 20)
+    # Zipf-ish pages over 50 hours: a few heavy hitters in a long tail of 60 values
+    records = []
+    for i in range(6000):
+        page = f"/p{min(int(rng.paretovariate(1.2)) - 1, 59)}"
+        ts = start + dt.timedelta(seconds=rng.randrange(50 * 3600))
+        records.append({"project_id": pid, "name": "pv", "ts": ts, "props": {"page": page}})
+    try:
+        await topk.record(records)
+        lo, hi = dt.datetime(2002, 3, 1, 22), dt.datetime(2002, 3, 3, 21)
+        result = await topk.top_items(str(pid), "props.page", 5, lo, hi)
+    finally:
+        keys = [k async for k in client.scan_iter(f"{settings.topk_prefix}:{pid}:*")]
+        if keys:
+            await client.delete(*keys)
+
+    exact = Counter(r["props"]["page"] for r in records if lo <= r["ts"] < hi)
+    assert result["total"] == sum(exact.values())
+    assert 0 < result["error_bound"] <= result["total"] / 10
+    for item in result["items"]:
+        assert item["count"] - item["error"] <= exact[item["key"]] <= item["count"]
+        assert item["error"] <= result["error_bound"]
+    assert [i["key"] for i in result["items"][:3]] == [k for k, _ in exact.most_common(3)]
+
+
+@pytest.mark.asyncio
+async def test_topk_endpoint_after_ingest(redis_client, monkeypatch):
+    import asyncio
+    import uuid
+    import nimbus.cache
+    from nimbus.db import get_sessionmaker
+    from nimbus.services.events import ingest_events
+    from nimbus.settings import settings
+
+    client = redis_client
+    monkeypatch.setattr(settings, "topk_props", ["page"])
+    pid, _ = await ensure_project()
+    now = dt.datetime.now(dt.timezone.utc)
+    page = f"/landing-{uuid.uuid4().hex[:8]}"
+    events = [{"name": "pv", "ts": now.isoformat(), "props": {"page": page}} for _ in range(3)]
+    events.append({"name": "signup", "ts": now.isoformat(), "props": {"page": "/signup"}})
+    headers = {"Authorization": f"Bearer {create_token('user@example.com', 60)}"}
+    try:
+        async with get_sessionmaker()() as s:
+            await ingest_events(s, pid, events)
+        # the summaries are updated by a task scheduled after commit
+        meta = f"{settings.topk_prefix}:{pid}:name:hour:{now:%Y%m%d%H}:meta"
+        for _ in range(100):
+            if await client.exists(meta):
+                break
+            await asyncio.sleep(0.01)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            by_name = await ac.get("/v1/metrics/top", params={"project_id": pid, "k": 5}, headers=headers)
+            by_page = await ac.get("/v1/metrics/top", params={"project_id": pid, "dimension": "props.page"}, headers=headers)
+            undeclared = await ac.get("/v1/metrics/top", params={"project_id": pid, "dimension": "props.plan"}, headers=headers)
+            monkeypatch.setattr(nimbus.cache, "redis", None)
+            no_redis = await ac.get("/v1/metrics/top", params={"project_id": pid}, headers=headers)
+    finally:
+        keys = [k async for k in client.scan_iter(f"{settings.topk_prefix}:{pid}:*")]
+        if keys:
+            await client.delete(*keys)
+
+    assert by_name.status_code == 200
+    body = by_name.json()
+    assert body["items"] == [{"key": "pv", "count": 3, "error": 0}, {"key": "signup", "count": 1, "error": 0}]
+    assert (body["total"], body["error_bound"], body["k"]) == (4, 0, 5)
+    assert body["since"].endswith(":00:00Z") and body["until"].endswith(":00:00Z")
+    assert [i["key"] for i in by_page.json()["items"]] == [page, "/signup"]
+    assert undeclared.status_code == 400
+    assert no_redis.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_live_counters_merge_redis_with_unflushed_local(redis_client, monkeypatch):
+    import uuid
+    from nimbus.services import live
+    from nimbus.settings import settings
+
+    client = redis_client
+    monkeypatch.setattr(live, "live_counters", live.LiveCounters(120))
+    pid = str(uuid.uuid4())
+    now = 1_700_000_000  # 22:13:20 UTC
+    try:
+        live.record([{"project_id": pid}] * 3, now=now - 15)
+        assert await live.flush(now=now) == 1
+        assert await live.flush(now=now) == 0  # nothing new to send
+        live.record([{"project_id": pid}] * 2, now=now)
+        # another process's flush
+        await client.hincrby(f"{settings.live_prefix}:{pid}:{now - now % 60}", str(now - 1), 4)
+        result = await live.live_series(pid, 1, 10, now=now)
+        assert await live.flush(now=now) == 1
+        flushed = await live.live_series(pid, 1, 1, now=now)
+    finally:
+        keys = [k async for k in client.scan_iter(f"{settings.live_prefix}:{pid}:*")]
+        if keys:
+            await client.delete(*keys)
+
+    assert result["total"] == 9 and result["as_of"] == "2023-11-14T22:13:20Z"
+    assert len(result["series"]) == 6 and result["series"][-1] == {"ts": "2023-11-14T22:13:20Z", "value": 2}
+    assert [p["value"] for p in result["series"]][-3:] == [3, 4, 2]
+    # once sent, local counts are not added on top of Redis again
+    assert flushed["total"] == 9 and flushed["series"][-1]["value"] == 2
+
+
+def test_live_counters_take_only_dirty_slots():
+    from nimbus.services.live import LiveCounters
+
+    counters = LiveCounters(60)
+    now = 1_700_000_000
+    counters.add("a", 2, now - 70)
+    counters.add("a", 3, now - 10)  # same slot, a minute later
+    counters.add("b", 1, now)
+    assert sorted(counters.take_unflushed(now)) == [("a", now - 10, 3), ("b", now, 1)]
+    assert counters.take_unflushed(now) == []
+    counters.add("b", 4, now)
+    deltas = counters.take_unflushed(now)
+    assert deltas == [("b", now, 4)]
+    # a failed send is retried on the next flush
+    counters.restore(deltas)
+    assert counters.take_unflushed(now + 1) == [("b", now, 4)]
+    assert counters.local("b", 0, unflushed=False) == {now: 5}
+
+
+@pytest.mark.asyncio
+async def test_live_endpoint_counts_committed_ingest_without_redis(monkeypatch):
+    import nimbus.cache
+    from nimbus.db import get_sessionmaker
+    from nimbus.services import live
+    from nimbus.services.events import ingest_events
+
+    monkeypatch.setattr(nimbus.cache, "redis", None)
+    monkeypatch.setattr(live, "live_counters", live.LiveCounters(900))
+    pid, _ = await ensure_project()
+    backdated = (dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=3)).isoformat()
+    async with get_sessionmaker()() as s:
+        await ingest_events(s, pid, [{"name": "pv", "ts": backdated, "props": {}}] * 4)
+    headers = {"Authorization": f"Bearer {create_token('user@example.com', 60)}"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.get("/v1/metrics/live", params={"project_id": pid, "minutes": 1, "bucket": "1s"}, headers=headers)
+        too_long = await ac.get("/v1/metrics/live", params={"project_id": pid, "minutes": 60}, headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    # counted by arrival, so backdated events are live traffic
+    assert body["total"] == 4 and len(body["series"]) == 60
+    assert too_long.status_code == 400
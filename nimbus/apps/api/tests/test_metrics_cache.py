@@ -0,0 +1,110 @@
+import asyncio
+import datetime as dt
+import uuid
+
+import pytest
+
+import nimbus.cache
+from nimbus import background, stats
+from nimbus.db import get_sessionmaker
+from nimbus.repositories.events import bulk_insert_events
+from nimbus.services.metrics import get_event_count_series, metrics_cache, version_fields
+from tests.testutils import ensure_project
+
+
+def _hits(part: str) -> float:
+    return stats.counter("nimbus_metrics_cache_hits_total", labels={"part": part}).value
+
+
+async def _ingest(pid: str, *ts: dt.datetime) -> None:
+    async with get_sessionmaker()() as s:
+        await bulk_insert_events(s, [{"project_id": uuid.UUID(pid), "name": "pv", "ts": t, "props": {}} for t in ts])
+        await s.commit()
+    await background.drain()  # the Redis version bump runs as a task after commit
+
+
+@pytest.mark.asyncio
+async def test_after_commit_tasks_are_held_until_done():
+    import gc
+
+    done = asyncio.Event()
+
+    async def bump():
+        await done.wait()
+
+    background.spawn(bump())
+    gc.collect()
+    assert background.pending() == 1
+    done.set()
+    await background.drain()
+    assert background.pending() == 0
+
+
+def test_version_fields():
+    now = dt.datetime(2024, 5, 1, 10, 17, 30)
+    assert version_fields(dt.datetime(2024, 5, 1, 10, 17), now) == ["open"]
+    assert version_fields(dt.datetime(2024, 5, 1, 9, 59), now) == ["open", "closed:1m", "closed:5m", "closed:15m", "closed:1h"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["redis", "local"])
+async def test_series_cached_and_invalidated_by_ingest(backend, redis_client, monkeypatch):
+    if backend == "local":
+        monkeypatch.setattr(nimbus.cache, "redis", None)
+    errors = stats.counter("nimbus_query_cache_redis_errors_total", labels={"cache": "metrics"}).value
+    metrics_cache.clear_local()
+    pid, _ = await ensure_project()
+    now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    await _ingest(pid, now, hour - dt.timedelta(minutes=30))
+
+    Session = get_sessionmaker()
+    async with Session() as s:
+        first = await get_event_count_series(s, pid, "1h", 3)
+        closed_hits, open_hits = _hits("closed"), _hits("open")
+        assert await get_event_count_series(s, pid, "1h", 3) == first
+        assert (_hits("closed"), _hits("open")) == (closed_hits + 1, open_hits + 1)
+    assert [p["value"] for p in first] == [0, 1, 1]
+
+    # a write to the open bucket only invalidates the open part
+    await _ingest(pid, now)
+    async with Session() as s:
+        series = await get_event_count_series(s, pid, "1h", 3)
+    assert [p["value"] for p in series] == [0, 1, 2]
+    assert _hits("closed") == closed_hits + 2
+
+    # a late event invalidates the closed buckets too
+    await _ingest(pid, hour - dt.timedelta(minutes=90))
+    async with Session() as s:
+        series = await get_event_count_series(s, pid, "1h", 3)
+    assert [p["value"] for p in series] == [1, 1, 2]
+    assert stats.counter("nimbus_query_cache_redis_errors_total", labels={"cache": "metrics"}).value == errors
+
+
+async def test_writer_sees_its_ingest_before_the_redis_bump(redis_client, monkeypatch):
+    held, spawn = [], background.spawn
+
+    def hold_version_bumps(coro):
+        if coro.__qualname__ == "QueryCache.bump":
+            held.append(coro)
+        else:
+            spawn(coro)
+
+    monkeypatch.setattr(background, "spawn", hold_version_bumps)
+    metrics_cache.clear_local()
+    pid, _ = await ensure_project()
+    await metrics_cache.bump(pid, ["open"])  # Redis ahead of this process's counters
+    metrics_cache.clear_local()
+    now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+
+    Session = get_sessionmaker()
+    async with Session() as s:
+        assert [p["value"] for p in await get_event_count_series(s, pid, "1h", 3)] == [0, 0, 0]
+    async with Session() as s:
+        await bulk_insert_events(s, [{"project_id": uuid.UUID(pid), "name": "pv", "ts": now, "props": {}}])
+        await s.commit()
+    async with Session() as s:
+        assert [p["value"] for p in await get_event_count_series(s, pid, "1h", 3)] == [0, 0, 1]
+    assert len(held) == 1
+    await asyncio.gather(*held)
+    await background.drain()
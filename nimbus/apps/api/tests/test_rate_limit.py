@@ -0,0 +1,85 @@
+import json, os, time, uuid, datetime as dt
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from nimbus.main import app
+from nimbus.settings import settings
+from nimbus.security.rate_limit import RateLimiter
+from tests.testutils import hmac_sig, ensure_project
+
+
+@pytest.mark.asyncio
+async def test_local_bucket_when_redis_is_missing(monkeypatch):
+    import nimbus.cache
+    monkeypatch.setattr(nimbus.cache, "redis", None)
+    limiter = RateLimiter("test-local")
+    results = [await limiter.hit("k", 60) for _ in range(61)]
+    assert all(d.allowed for d in results[:60])
+    last = results[-1]
+    assert not last.allowed and last.retry_after_s >= 1 and last.remaining == 0
+
+    started = time.perf_counter()
+    for _ in range(2000):
+        await limiter.hit("hot", 10_000_000)
+    assert (time.perf_counter() - started) / 2000 < 0.001
+
+
+@pytest.mark.asyncio
+async def test_shared_redis_bucket_across_processes(redis_client):
+    # two limiters stand in for two API processes sharing one Redis bucket
+    key = f"shared-{uuid.uuid4()}"
+    a, b = RateLimiter("test-shared"), RateLimiter("test-shared")
+    allowed = 0
+    for i in range(300):
+        d = await (a if i % 2 else b).hit(key, 200)
+        allowed += d.allowed
+    # unused leased tokens may be dropped, but the shared limit is never exceeded
+    assert 150 <= allowed <= 200
+    calls = a._redis_calls.value + b._redis_calls.value
+    assert calls < allowed
+
+
+@pytest.mark.asyncio
+async def test_expired_leases_return_unused_tokens(redis_client, monkeypatch):
+    import asyncio
+    monkeypatch.setattr(settings, "rate_limit_lease_ms", 1)
+    # a low-rate client spread over ten processes: every lease expires before its next hit
+    key = f"quiet-{uuid.uuid4()}"
+    limiters = [RateLimiter("test-quiet") for _ in range(10)]
+    decisions = []
+    for i in range(300):
+        decisions.append(await limiters[i % 10].hit(key, 300))
+        await asyncio.sleep(0.002)
+    allowed = sum(d.allowed for d in decisions)
+    assert allowed >= 295
+    assert decisions[49].remaining >= 240
+
+
+@pytest.mark.asyncio
+async def test_ingest_per_project_override_and_headers(redis_client, monkeypatch):
+    # a Redis error mid-test would switch to the local bucket, which starts full
+    pid, key_id = await ensure_project()
+    monkeypatch.setitem(settings.rate_limit_overrides, pid, 2)
+    body = json.dumps({"project_id": pid, "events": [{"name": "x", "ts": dt.datetime.now(dt.timezone.utc).isoformat()}]})
+    secret = os.getenv("INGEST_API_KEY_SECRET", "local-super-secret")
+
+    statuses = []
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        for _ in range(3):
+            ts = int(time.time())
+            r = await ac.post(
+                "/v1/events",
+                content=body,
+                headers={
+                    "content-type": "application/json",
+                    "X-Api-Key-Id": key_id,
+                    "X-Api-Timestamp": str(ts),
+                    "X-Api-Signature": hmac_sig(ts, "POST", "/v1/events", body, secret),
+                },
+            )
+            statuses.append(r)
+
+    assert [r.status_code for r in statuses] == [200, 200, 429]
+    assert statuses[0].headers["RateLimit-Limit"] == "2"
+    assert statuses[1].headers["RateLimit-Remaining"] == "0"
+    assert int(statuses[2].headers["Retry-After"]) >= 1
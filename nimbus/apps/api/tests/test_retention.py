@@ -0,0 +1,118 @@
+import datetime as dt
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import text
+
+import nimbus.cache
+from nimbus.main import app
+from nimbus.db import get_sessionmaker
+from nimbus.repositories.retention import fetch_retention, period_index
+from nimbus.security.auth import create_token
+from nimbus.services.metrics import metrics_cache
+from tests.testutils import ensure_project
+
+# Weeks of 2001-01-01 (a Monday) .. 2001-01-22
+W0 = dt.date(2001, 1, 1)
+FOLDED = [
+    # (user_id, first_ts, {month: days bitmask}) as nimbus_worker would have written them
+    ("a", dt.datetime(2001, 1, 2, 9), {dt.date(2001, 1, 1): (1 << 1) | (1 << 9) | (1 << 23)}),
+    ("b", dt.datetime(2001, 1, 3, 9), {dt.date(2001, 1, 1): 1 << 2}),
+    ("c", dt.datetime(2000, 12, 20, 9), {dt.date(2000, 12, 1): 1 << 19, dt.date(2001, 1, 1): 1 << 8}),
+    ("e", dt.datetime(2001, 1, 8, 9), {dt.date(2001, 1, 1): 1 << 7}),
+]
+FOLDED_EVENTS = [
+    ("a", dt.datetime(2001, 1, 2, 9)), ("a", dt.datetime(2001, 1, 10, 9)), ("a", dt.datetime(2001, 1, 24, 9)),
+    ("b", dt.datetime(2001, 1, 3, 9)),
+    ("c", dt.datetime(2000, 12, 20, 9)), ("c", dt.datetime(2001, 1, 9, 9)),
+    ("e", dt.datetime(2001, 1, 8, 9)),
+]
+# Inserted after the watermark
+TAIL_EVENTS = [
+    ("b", dt.datetime(2001, 1, 16, 9)),
+    ("d", dt.datetime(2001, 1, 9, 9)), ("d", dt.datetime(2001, 1, 17, 9)),
+    # a late event makes e older than the grid
+    ("e", dt.datetime(2000, 12, 31, 9)),
+    ("f", dt.datetime(2001, 1, 23, 9)), ("f", dt.datetime(2001, 1, 29, 9)),
+]
+EXPECTED = [[2, 1, 1, 1], [1, 1, 0], [0, 0], [1]]
+
+
+@pytest.fixture(autouse=True)
+def local_cache(monkeypatch):
+    monkeypatch.setattr(nimbus.cache, "redis", None)
+    metrics_cache.clear_local()
+
+
+@pytest.mark.asyncio
+async def test_retention_from_folded_tables_and_raw_tail():
+    pid, _ = await ensure_project()
+    async with get_sessionmaker()() as s:
+        saved = (await s.execute(text("SELECT processed_until FROM rollup_watermarks WHERE name = 'events'"))).scalar()
+        watermark = dt.datetime.now() - dt.timedelta(minutes=10)
+        await s.execute(text(
+            "INSERT INTO rollup_watermarks (name, processed_until) VALUES ('events', :wm) "
+            "ON CONFLICT (name) DO UPDATE SET processed_until = EXCLUDED.processed_until"
+        ), {"wm": watermark})
+        for user_id, first_ts, months in FOLDED:
+            await s.execute(text(
+                "INSERT INTO user_first_seen (project_id, user_id, first_ts) VALUES (:pid, :uid, :first)"
+            ), {"pid": pid, "uid": user_id, "first": first_ts})
+            for month, days in months.items():
+                await s.execute(text(
+                    "INSERT INTO user_activity (project_id, user_id, month, days) VALUES (:pid, :uid, :month, :days)"
+                ), {"pid": pid, "uid": user_id, "month": month, "days": days})
+        for events, created in ((FOLDED_EVENTS, watermark - dt.timedelta(minutes=1)), (TAIL_EVENTS, None)):
+            for user_id, ts in events:
+                await s.execute(text(
+                    "INSERT INTO events (id, project_id, name, ts, props, user_id, created_at) "
+                    "VALUES (gen_random_uuid(), :pid, 'pv', :ts, '{}', :uid, COALESCE(:created, now()))"
+                ), {"pid": pid, "ts": ts, "uid": user_id, "created": created})
+        await s.commit()
+        try:
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+                r = await ac.get(
+                    "/v1/retention",
+                    params={"project_id": pid, "period": "week", "cohorts": 4, "until": "2001-01-28T12:00:00Z"},
+                    headers={"Authorization": f"Bearer {create_token('user@example.com', 60)}"},
+                )
+        finally:
+            if saved is None:
+                await s.execute(text("DELETE FROM rollup_watermarks WHERE name = 'events'"))
+            else:
+                await s.execute(text("UPDATE rollup_watermarks SET processed_until = :wm WHERE name = 'events'"), {"wm": saved})
+            await s.commit()
+
+    assert r.status_code == 200
+    body = r.json()
+    assert (body["since"], body["until"]) == ("2001-01-01T00:00:00Z", "2001-01-29T00:00:00Z")
+    assert [c["start"] for c in body["cohorts"]] == ["2001-01-01", "2001-01-08", "2001-01-15", "2001-01-22"]
+    assert [c["retained"] for c in body["cohorts"]] == EXPECTED
+    assert body["cohorts"][0]["rates"] == [1.0, 0.5, 0.5, 0.5]
+    assert [c["size"] for c in body["cohorts"]] == [2, 1, 0, 1]
+
+
+@pytest.mark.asyncio
+async def test_retention_sqlite_reads_raw_events():
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    pid = str(uuid.uuid4())
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE events (id CHAR(32) PRIMARY KEY, project_id CHAR(32) NOT NULL, name VARCHAR(200) NOT NULL, "
+            "ts DATETIME NOT NULL, user_id VARCHAR(200), props JSON NOT NULL)"
+        ))
+    async with async_sessionmaker(engine)() as s:
+        for user_id, ts in FOLDED_EVENTS + TAIL_EVENTS:
+            await s.execute(text(
+                "INSERT INTO events (id, project_id, name, ts, user_id, props) VALUES (:id, :pid, 'pv', :ts, :uid, '{}')"
+            ), {"id": uuid.uuid4().hex, "pid": uuid.UUID(pid).hex, "ts": ts.isoformat(sep=" ", timespec="microseconds"), "uid": user_id})
+        await s.commit()
+        grid = await fetch_retention(s, pid, "week", period_index(W0, "week"), 4)
+        days = await fetch_retention(s, pid, "day", period_index(dt.date(2001, 1, 2), "day"), 2)
+    await engine.dispose()
+
+    assert grid == EXPECTED
+    assert days == [[1, 0], [1]]  # a on the 2nd, b on the 3rd
@@ -0,0 +1,96 @@
+import asyncio
+import datetime as dt
+
+import pytest
+from sqlalchemy import event
+
+from nimbus import stats
+from nimbus.db import get_engine, get_sessionmaker
+from nimbus.services.metrics import get_event_count_series
+from nimbus.services.singleflight import SingleFlight, query_key
+from nimbus.settings import settings
+from tests.testutils import ensure_project
+
+
+def _counted(result="ok", delay=0.05, exc=None):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if exc is not None:
+            raise exc
+        return result
+
+    return fn, calls
+
+
+def test_query_key_normalises_dict_order():
+    assert query_key("q", {"a": 1, "b": 2}) == query_key("q", {"b": 2, "a": 1})
+    assert query_key("q", 1) != query_key("q", 2)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_run():
+    group = SingleFlight("test-local")
+    fn, calls = _counted(result=[{"v": 1}])
+    results = await asyncio.gather(*(group.do("k", fn) for _ in range(20)))
+    assert len(calls) == 1
+    assert all(r == [{"v": 1}] for r in results)
+    # once finished, the next caller runs again
+    await group.do("k", fn)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_cancelled_leader_is_replaced():
+    group = SingleFlight("test-errors")
+    fn, calls = _counted(exc=RuntimeError("db down"))
+    results = await asyncio.gather(*(group.do("k", fn) for _ in range(5)), return_exceptions=True)
+    assert len(calls) == 1 and all(isinstance(r, RuntimeError) for r in results)
+
+    fn, calls = _counted(result="fresh")
+    leader = asyncio.create_task(group.do("k", fn))
+    await asyncio.sleep(0.01)
+    follower = asyncio.create_task(group.do("k", fn))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert await follower == "fresh"
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_processes_share_through_redis(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "singleflight_redis", True)
+    # two groups stand in for two API processes
+    a, b = SingleFlight("test-redis"), SingleFlight("test-redis")
+    fn, calls = _counted(result={"items": [1, 2], "count": 2}, delay=0.1)
+    key = query_key("test", dt.datetime.now().isoformat())
+    first = asyncio.create_task(a.do(key, fn))
+    await asyncio.sleep(0.02)
+    assert await b.do(key, fn) == {"items": [1, 2], "count": 2}
+    assert await first == {"items": [1, 2], "count": 2}
+    assert len(calls) == 1
+    assert stats.counter("nimbus_singleflight_shared_total", labels={"group": "test-redis", "scope": "redis"}).value == 1
+
+
+@pytest.mark.asyncio
+async def test_thundering_metrics_reads_check_out_one_connection(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_cache_enabled", False)
+    pid, _ = await ensure_project()
+    Session = get_sessionmaker()
+    checkouts = []
+    listener = lambda *args: checkouts.append(1)  # noqa: E731
+    event.listen(get_engine().sync_engine.pool, "checkout", listener)
+    leaders = stats.counter("nimbus_singleflight_leaders_total", labels={"group": "reads"}).value
+    try:
+        async def one():
+            async with Session() as s:
+                return await get_event_count_series(s, pid, "1h", 24)
+
+        results = await asyncio.gather(*(one() for _ in range(30)))
+    finally:
+        event.remove(get_engine().sync_engine.pool, "checkout", listener)
+    assert all(r == results[0] for r in results) and len(results[0]) == 24
+    assert stats.counter("nimbus_singleflight_leaders_total", labels={"group": "reads"}).value == leaders + 1
+    assert len(checkouts) == 1
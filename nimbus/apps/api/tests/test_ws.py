@@ -0,0 +1,115 @@
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+import redis
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import nimbus.cache
+from nimbus.main import app
+from nimbus.routes import ws as ws_route
+from nimbus.security.auth import create_token
+from nimbus.services.ws_hub import PubSubHub
+from nimbus.settings import settings
+
+
+async def _numsub(client, channel: str) -> int:
+    return dict(await client.pubsub_numsub(channel)).get(channel, 0)
+
+
+async def _eventually(check, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not await check():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_hub_subscribes_once_for_thousands_of_clients(redis_client):
+    client = redis_client
+    hub = PubSubHub(queue_size=4)
+    busy, quiet = f"metrics:{uuid.uuid4()}", f"metrics:{uuid.uuid4()}"
+    try:
+        subs = [await hub.subscribe(busy) for _ in range(2000)]
+        other = await hub.subscribe(quiet)
+        assert (hub.channels(), hub.clients()) == (2, 2001)
+        assert await _numsub(client, busy) == 1 and await _numsub(client, quiet) == 1
+
+        for i in range(3):
+            await client.publish(busy, json.dumps({"n": i}))
+
+        async def all_delivered():
+            return all(s.pending() == 3 for s in subs)
+
+        await _eventually(all_delivered)
+        fast, slow = subs[:-1], subs[-1]
+        for s in fast:
+            assert [json.loads(await s.get())["n"] for _ in range(3)] == [0, 1, 2]
+        assert other.pending() == 0
+
+        # the slow client stops reading: it keeps the newest 4 while the others keep up
+        received = [[] for _ in fast]
+
+        async def consume(s, out):
+            while len(out) < 10:
+                out.append(json.loads(await s.get())["n"])
+
+        consumers = [asyncio.create_task(consume(s, out)) for s, out in zip(fast, received)]
+        for i in range(3, 13):
+            await client.publish(busy, json.dumps({"n": i}))
+            await asyncio.sleep(0.005)
+        await asyncio.wait_for(asyncio.gather(*consumers), timeout=10)
+        assert all(out == list(range(3, 13)) for out in received)
+        assert slow.dropped == 9
+        assert [json.loads(await slow.get())["n"] for _ in range(4)] == [9, 10, 11, 12]
+
+        for s in subs:
+            await hub.unsubscribe(s)
+
+        async def unsubscribed():
+            return await _numsub(client, busy) == 0
+
+        await _eventually(unsubscribed)
+        assert await _numsub(client, quiet) == 1
+    finally:
+        await hub.close()
+
+
+def test_ws_route_mounted_and_requires_token(monkeypatch):
+    monkeypatch.setattr(nimbus.cache, "redis", None)
+    pid = str(uuid.uuid4())
+    client = TestClient(app)
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect(f"/ws/projects/{pid}") as ws:
+            ws.receive_text()
+    assert exc.value.code == 1008
+    token = create_token("user@example.com", 60)
+    with client.websocket_connect(f"/ws/projects/{pid}?token={token}") as ws:
+        assert "requires Redis" in ws.receive_json()["error"]
+
+
+def test_ws_route_streams_published_updates(redis_client, monkeypatch):
+    monkeypatch.setattr(ws_route, "hub", PubSubHub())
+    publisher = redis.Redis.from_url(settings.redis_url, decode_responses=True)
+    pid = str(uuid.uuid4())
+    channel = f"metrics:{pid}"
+    token = create_token("user@example.com", 60)
+    try:
+        with TestClient(app).websocket_connect(f"/ws/projects/{pid}?token={token}") as ws:
+            deadline = time.monotonic() + 5
+            while dict(publisher.pubsub_numsub(channel)).get(channel, 0) == 0:
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+            publisher.publish(channel, json.dumps({"series": [{"ts": "2024-01-01T00:00:00", "value": 3}]}))
+            assert ws.receive_json()["series"][0]["value"] == 3
+            # leaving the block cancels the app right away; let it clean up first
+            ws.close()
+            deadline = time.monotonic() + 5
+            while dict(publisher.pubsub_numsub(channel)).get(channel, 0) != 0:
+                assert time.monotonic() < deadline, "subscription outlived the socket"
+                time.sleep(0.01)
+    finally:
+        publisher.close()
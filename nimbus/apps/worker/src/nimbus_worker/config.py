@@ -1,8 +1,45 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     database_url: str
     redis_url: str
+
+    # Ingest queue (must match the API's NIMBUS_INGEST_STREAM_* settings)
+    ingest_stream_prefix: str = "nimbus:ingest"
+    ingest_stream_shards: int = 4
+    ingest_consumer_group: str = "nimbus-writers"
+    ingest_consumers: int = 4            # consumer coroutines in this process; 0 disables
+    ingest_read_count: int = 500         # entries per XREADGROUP call (each entry is one API batch)
+    ingest_block_ms: int = 1000
+    ingest_claim_idle_ms: int = 60_000   # reclaim entries a dead consumer left pending this long
+    ingest_claim_interval_s: float = 15.0
+    ingest_max_deliveries: int = 5       # then the entry is moved to <prefix>:dead
+    metrics_cache_prefix: str = "nimbus:mcache"  # must match the API's NIMBUS_METRICS_CACHE_PREFIX
+
+    # Heavy-hitter summaries (see topk.py; all but the TTLs must match the API's NIMBUS_TOPK_*)
+    topk_enabled: bool = True
+    topk_prefix: str = "nimbus:topk"
+    topk_capacity: int = 200
+    topk_props: list[str] = []
+    topk_hour_ttl_s: int = 8 * 86400
+    topk_day_ttl_s: int = 90 * 86400
+
+    # events partition maintenance (interval must match the API's NIMBUS_EVENTS_PARTITION_INTERVAL)
+    events_partition_interval: Literal["day", "month"] = "month"
+    events_partition_premake: int = 3          # future partitions kept ready
+    events_retention_days: int = 0             # detach partitions entirely older than this; 0 keeps everything
+    events_drop_detached: bool = True          # drop detached partitions (False leaves them as plain tables)
+    partition_maintenance_interval_s: float = 3600.0  # 0 disables the job
+
+    # event_rollups (see rollups.py)
+    rollup_interval_s: float = 30.0   # 0 disables the job
+    rollup_lag_s: int = 300           # must exceed the longest ingest transaction
+    rollup_step_s: int = 300          # created_at span folded per transaction
+
+    prop_index_sync_interval_s: float = 300.0  # expression indexes for projects' hot_props; 0 disables
+
     # Read env from the API .env; ignore all unrelated keys (jwt, cors, etc.)
     model_config = SettingsConfigDict(env_file="../api/.env", extra="ignore")
 
@@ -0,0 +1,8 @@
+import redis.asyncio as aioredis
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from .config import settings
+
+engine = create_async_engine(settings.database_url, pool_pre_ping=True)
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+redis = aioredis.from_url(settings.redis_url, encoding="utf-8", decode_responses=True)
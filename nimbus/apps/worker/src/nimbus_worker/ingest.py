@@ -0,0 +1,264 @@
+"""
+Consumer-group writer for the API's Redis Streams ingest queue.
+
+Each consumer coroutine XREADGROUPs large chunks from every shard stream, writes
+all rows of a chunk in one transaction and only then XACKs, so a crash leaves the
+entries pending. A reclaim loop XAUTOCLAIMs entries that have been idle for
+`ingest_claim_idle_ms` (their consumer died), dead-letters entries that keep
+failing, and trims acknowledged history off the streams.
+"""
+import asyncio
+import datetime as dt
+import json
+import logging
+import os
+import socket
+import uuid
+
+from sqlalchemy import text
+
+from .config import settings
+from .db import SessionLocal, redis
+from .topk import record as record_topk
+
+log = logging.getLogger(__name__)
+
+# Redelivered entries and SDK retries carry the same idempotency_key (and ts): skip them
+INSERT_EVENT = text("""
+    INSERT INTO events (id, project_id, name, ts, props, user_id, seq, idempotency_key)
+    VALUES (:id, :project_id, :name, :ts, CAST(:props AS jsonb), :user_id, :seq, :idempotency_key)
+    ON CONFLICT (project_id, idempotency_key, ts) WHERE idempotency_key IS NOT NULL DO NOTHING
+""")
+
+# /v1/metrics bucket widths (nimbus.repositories.metrics.BUCKET_SECONDS), epoch-aligned
+METRICS_BUCKET_SECONDS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "1d": 86400}
+_EPOCH = dt.datetime(1970, 1, 1)
+
+
+def stream_keys() -> list[str]:
+    return [f"{settings.ingest_stream_prefix}:{i}" for i in range(settings.ingest_stream_shards)]
+
+
+def dead_letter_key() -> str:
+    return f"{settings.ingest_stream_prefix}:dead"
+
+
+def consumer_name(index: int) -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{index}"
+
+
+def _naive_utc(value: str) -> dt.datetime:
+    ts = dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(dt.UTC).replace(tzinfo=None)
+    return ts
+
+
+def decode_entry(fields: dict) -> list[dict]:
+    """Turn one stream entry (one API request) into INSERT parameters."""
+    project_id = uuid.UUID(fields["project_id"])
+    rows = []
+    for e in json.loads(fields["events"]):
+        rows.append({
+            "id": uuid.UUID(e["id"]),
+            "project_id": project_id,
+            "name": e["name"],
+            "ts": _naive_utc(e["ts"]),
+            "props": json.dumps(e.get("props") or {}, separators=(",", ":")),
+            "user_id": e.get("user_id"),
+            "seq": e.get("seq"),
+            "idempotency_key": e.get("idempotency_key"),
+        })
+    return rows
+
+
+async def ensure_groups() -> None:
+    for key in stream_keys():
+        try:
+            await redis.xgroup_create(key, settings.ingest_consumer_group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+
+async def dead_letter(stream: str, entry_id: str, fields: dict, reason: str) -> None:
+    await redis.xadd(dead_letter_key(), {**fields, "source": stream, "source_id": entry_id, "reason": reason})
+    await redis.xack(stream, settings.ingest_consumer_group, entry_id)
+
+
+async def _insert(rows: list[dict]) -> None:
+    async with SessionLocal() as s:
+        await s.execute(INSERT_EVENT, rows)
+        await s.commit()
+    await bump_metrics_versions(rows)
+    await record_topk(rows)
+
+
+def metrics_version_fields(min_ts: dt.datetime, now: dt.datetime) -> list[str]:
+    """
+    Cached /v1/metrics versions a write reaching back to `min_ts` invalidates (see
+    nimbus.services.metrics): `open` always, `closed:<bucket>` when an event landed
+    in a bucket of that width that has already ended.
+    """
+    fields = ["open"]
+    for bucket, step in METRICS_BUCKET_SECONDS.items():
+        if min_ts < _EPOCH + (now - _EPOCH) // dt.timedelta(seconds=step) * dt.timedelta(seconds=step):
+            fields.append(f"closed:{bucket}")
+    return fields
+
+
+async def bump_metrics_versions(rows: list[dict]) -> None:
+    """Invalidate the API's cached /v1/metrics series for the projects just written."""
+    now = dt.datetime.now(dt.UTC).replace(tzinfo=None)
+    oldest: dict[str, dt.datetime] = {}
+    for r in rows:
+        pid = str(r["project_id"])
+        if pid not in oldest or r["ts"] < oldest[pid]:
+            oldest[pid] = r["ts"]
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for pid, min_ts in oldest.items():
+                for field in metrics_version_fields(min_ts, now):
+                    pipe.hincrby(f"{settings.metrics_cache_prefix}:ver:{pid}", field, 1)
+            await pipe.execute()
+    except Exception as e:
+        # Rows are committed; cached series only stay stale until their TTL
+        log.warning("ingest: metrics cache invalidation failed: %s", e)
+
+
+async def write_entries(stream: str, entries: list) -> int:
+    """Insert every decodable entry in one transaction, then XACK them all."""
+    decoded: list[tuple[str, list[dict]]] = []
+    empty: list[str] = []
+    for entry_id, fields in entries:
+        if not fields:  # entry was trimmed/deleted while pending
+            empty.append(entry_id)
+            continue
+        try:
+            decoded.append((entry_id, decode_entry(fields)))
+        except Exception as e:
+            log.error("ingest: undecodable entry %s on %s: %s", entry_id, stream, e)
+            await dead_letter(stream, entry_id, fields, f"decode: {e}")
+    if empty:
+        await redis.xack(stream, settings.ingest_consumer_group, *empty)
+    if not decoded:
+        return 0
+
+    rows = [row for _, entry_rows in decoded for row in entry_rows]
+    try:
+        await _insert(rows)
+        await redis.xack(stream, settings.ingest_consumer_group, *(entry_id for entry_id, _ in decoded))
+        return len(rows)
+    except Exception as e:
+        if len(decoded) == 1:
+            raise
+        log.warning("ingest: batch of %d entries failed (%s); retrying entry by entry", len(decoded), e)
+
+    # Isolate the bad entry (e.g. its project was deleted); the rest still go through.
+    # Failing entries stay pending and are dead-lettered after ingest_max_deliveries.
+    written = 0
+    for entry_id, entry_rows in decoded:
+        try:
+            await _insert(entry_rows)
+        except Exception as e:
+            log.error("ingest: entry %s on %s failed: %s", entry_id, stream, e)
+            continue
+        await redis.xack(stream, settings.ingest_consumer_group, entry_id)
+        written += len(entry_rows)
+    return written
+
+
+async def consume(index: int, stop: asyncio.Event) -> None:
+    name = consumer_name(index)
+    streams = {key: ">" for key in stream_keys()}
+    while not stop.is_set():
+        try:
+            resp = await redis.xreadgroup(
+                settings.ingest_consumer_group,
+                name,
+                streams,
+                count=settings.ingest_read_count,
+                block=settings.ingest_block_ms,
+            )
+            for stream, entries in resp or []:
+                n = await write_entries(stream, entries)
+                log.debug("ingest: %s wrote %d events from %d entries", name, n, len(entries))
+        except Exception as e:
+            # entries stay pending; the reclaim loop retries them
+            log.error("ingest: consumer %s failed: %s", name, e, exc_info=True)
+            await asyncio.sleep(1)
+
+
+async def _dead_letter_poison(stream: str) -> None:
+    """Move entries delivered too many times out of the way."""
+    pending = await redis.xpending_range(
+        stream,
+        settings.ingest_consumer_group,
+        min="-",
+        max="+",
+        count=100,
+        idle=settings.ingest_claim_idle_ms,
+    )
+    for p in pending:
+        if p["times_delivered"] < settings.ingest_max_deliveries:
+            continue
+        entry_id = p["message_id"]
+        found = await redis.xrange(stream, min=entry_id, max=entry_id)
+        fields = found[0][1] if found else {}
+        log.error("ingest: dead-lettering %s on %s after %d deliveries", entry_id, stream, p["times_delivered"])
+        await dead_letter(stream, entry_id, fields, "max deliveries exceeded")
+
+
+async def _trim_acked(stream: str) -> None:
+    """Drop entries every consumer is done with: below the oldest pending id."""
+    summary = await redis.xpending(stream, settings.ingest_consumer_group)
+    if summary and summary.get("pending"):
+        min_id = summary["min"]
+    else:
+        groups = await redis.xinfo_groups(stream)
+        group = next((g for g in groups if g["name"] == settings.ingest_consumer_group), None)
+        if not group or group["last-delivered-id"] in ("0-0", None):
+            return
+        # MINID keeps ids >= min_id, so bump past the last delivered entry
+        ms, seq = group["last-delivered-id"].split("-")
+        min_id = f"{ms}-{int(seq) + 1}"
+    await redis.xtrim(stream, minid=min_id, approximate=True)
+
+
+async def reclaim(stop: asyncio.Event) -> None:
+    name = consumer_name(0)
+    while not stop.is_set():
+        for stream in stream_keys():
+            try:
+                await _dead_letter_poison(stream)
+                start = "0-0"
+                while True:
+                    start, entries, *_ = await redis.xautoclaim(
+                        stream,
+                        settings.ingest_consumer_group,
+                        name,
+                        min_idle_time=settings.ingest_claim_idle_ms,
+                        start_id=start,
+                        count=settings.ingest_read_count,
+                    )
+                    if entries:
+                        log.warning("ingest: reclaimed %d idle entries on %s", len(entries), stream)
+                        await write_entries(stream, entries)
+                    if start == "0-0":
+                        break
+                await _trim_acked(stream)
+            except Exception as e:
+                log.error("ingest: reclaim on %s failed: %s", stream, e, exc_info=True)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.ingest_claim_interval_s)
+        except TimeoutError:
+            pass
+
+
+async def run_consumers(stop: asyncio.Event | None = None) -> None:
+    stop = stop or asyncio.Event()
+    await ensure_groups()
+    await asyncio.gather(
+        reclaim(stop),
+        *(consume(i, stop) for i in range(settings.ingest_consumers)),
+    )
@@ -0,0 +1,157 @@
+"""
+Partition maintenance for the range-partitioned `events` table.
+
+`events` is partitioned on `ts` by day or month. Each run creates the current
+partition and the next `events_partition_premake` ones, so inserts never land in
+`events_default`, and detaches (then drops) partitions whose whole range is older
+than `events_retention_days`, which replaces DELETE-based cleanup.
+
+Rows that reached the default partition for a range (e.g. the worker was down) are
+moved into the new partition before it is attached. DDL runs with a short
+lock_timeout; a run that cannot get its lock is simply retried on the next tick.
+DETACH ... CONCURRENTLY is not available while a default partition exists.
+"""
+import asyncio
+import datetime as dt
+import logging
+import re
+
+from sqlalchemy import text
+
+from .config import settings
+from .db import SessionLocal
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PARTITION = "events_default"
+LOCK_TIMEOUT = "5s"
+
+_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def period_start(ts: dt.datetime, interval: str) -> dt.datetime:
+    if interval == "day":
+        return dt.datetime(ts.year, ts.month, ts.day)
+    return dt.datetime(ts.year, ts.month, 1)
+
+
+def next_period(start: dt.datetime, interval: str) -> dt.datetime:
+    if interval == "day":
+        return start + dt.timedelta(days=1)
+    return dt.datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start: dt.datetime, interval: str) -> str:
+    return f"events_p{start:%Y%m%d}" if interval == "day" else f"events_p{start:%Y%m}"
+
+
+def parse_bound(expr: str) -> tuple[dt.datetime, dt.datetime] | None:
+    """`FOR VALUES FROM ('…') TO ('…')` -> (lower, upper); None for DEFAULT."""
+    m = _BOUND.search(expr)
+    if m is None:
+        return None
+    return dt.datetime.fromisoformat(m.group(1)), dt.datetime.fromisoformat(m.group(2))
+
+
+def wanted_ranges(now: dt.datetime, interval: str, premake: int) -> list[tuple[dt.datetime, dt.datetime]]:
+    start = period_start(now, interval)
+    ranges = []
+    for _ in range(premake + 1):
+        end = next_period(start, interval)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+async def is_partitioned(s) -> bool:
+    kind = (await s.execute(text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass('events')"))).scalar()
+    return kind == "p"
+
+
+async def existing_partitions(s) -> dict[str, tuple[dt.datetime, dt.datetime] | None]:
+    rows = await s.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'events'::regclass
+    """))
+    return {r.relname: parse_bound(r.bound) for r in rows}
+
+
+async def create_partition(s, name: str, lower: dt.datetime, upper: dt.datetime) -> None:
+    """Create `name` for [lower, upper), moving matching rows out of the default partition."""
+    bounds = f"FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    params = {"lo": lower, "hi": upper}
+    await s.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+    stranded = (await s.execute(
+        text(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE ts >= :lo AND ts < :hi LIMIT 1"), params
+    )).first()
+    if stranded is None:
+        await s.execute(text(f"CREATE TABLE {name} PARTITION OF events FOR VALUES {bounds}"))
+        return
+    # Attaching would fail while the default partition holds rows of this range
+    await s.execute(text(f"CREATE TABLE {name} (LIKE events INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = await s.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE ts >= :lo AND ts < :hi RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """), params)
+    await s.execute(text(f"ALTER TABLE events ATTACH PARTITION {name} FOR VALUES {bounds}"))
+    log.warning("partitions: moved %d rows from %s into %s", moved.rowcount, DEFAULT_PARTITION, name)
+
+
+async def detach_partition(s, name: str) -> None:
+    await s.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+    await s.execute(text(f"ALTER TABLE events DETACH PARTITION {name}"))
+    if settings.events_drop_detached:
+        await s.execute(text(f"DROP TABLE {name}"))
+
+
+async def maintain_partitions(now: dt.datetime | None = None) -> dict[str, list[str]]:
+    """One maintenance pass; returns the partitions created and detached."""
+    now = now or dt.datetime.now(dt.UTC).replace(tzinfo=None)
+    interval = settings.events_partition_interval
+    done: dict[str, list[str]] = {"created": [], "detached": []}
+
+    async with SessionLocal() as s:
+        if not await is_partitioned(s):
+            log.warning("partitions: events is not partitioned; run the migrations first")
+            return done
+        existing = await existing_partitions(s)
+    covered = [b for b in existing.values() if b is not None]
+
+    for lower, upper in wanted_ranges(now, interval, settings.events_partition_premake):
+        if any(lo < upper and lower < hi for lo, hi in covered):
+            continue
+        name = partition_name(lower, interval)
+        async with SessionLocal() as s:
+            await create_partition(s, name, lower, upper)
+            await s.commit()
+        done["created"].append(name)
+
+    if settings.events_retention_days > 0:
+        cutoff = now - dt.timedelta(days=settings.events_retention_days)
+        for name, bound in sorted(existing.items()):
+            if bound is None or bound[1] > cutoff:
+                continue
+            async with SessionLocal() as s:
+                await detach_partition(s, name)
+                await s.commit()
+            done["detached"].append(name)
+
+    if done["created"] or done["detached"]:
+        log.info("partitions: created %s, detached %s", done["created"], done["detached"])
+    return done
+
+
+async def run_partition_maintenance(stop: asyncio.Event | None = None) -> None:
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            await maintain_partitions()
+        except Exception as e:
+            log.error("partitions: maintenance failed: %s", e, exc_info=True)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.partition_maintenance_interval_s)
+        except TimeoutError:
+            pass
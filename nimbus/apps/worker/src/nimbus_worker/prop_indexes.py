@@ -0,0 +1,115 @@
+"""
+Expression indexes for the props keys projects mark as hot (`projects.hot_props`).
+
+One index per key, shared by every project that lists it:
+
+    ix_events_hot_<hash> ON events (project_id, (props -> 'key'), ts DESC) WHERE props ? 'key'
+
+The API spells equality filters on hot keys exactly this way (key inlined, jsonb
+compared to jsonb so 5 and 5.0 are equal), so the planner can pick the index over the
+generic GIN one. The name hashes the whole definition: when the shape changes, the
+new index is built and the old one dropped like any unused key's. Indexes are built like the
+migrations do on the partitioned table: ON ONLY the parent, CONCURRENTLY on each
+partition, then attached; partitions created later inherit them. Keys no project
+lists any more have their index dropped.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+
+from sqlalchemy import text
+
+from .config import settings
+from .db import engine
+
+log = logging.getLogger(__name__)
+
+INDEX_PREFIX = "ix_events_hot_"
+LOCK_TIMEOUT = "5s"
+
+# Same alphabet the API accepts; anything else is never inlined into DDL
+_SAFE_KEY = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+
+
+def index_columns(key: str) -> str:
+    return f"(project_id, (props -> '{key}'), ts DESC) WHERE props ? '{key}'"
+
+
+def index_name(key: str) -> str:
+    return INDEX_PREFIX + hashlib.sha1(index_columns(key).encode()).hexdigest()[:12]
+
+
+async def _wanted_keys(conn) -> set[str]:
+    rows = await conn.execute(text("SELECT DISTINCT jsonb_array_elements_text(hot_props::jsonb) FROM projects"))
+    keys = set()
+    for (key,) in rows:
+        if _SAFE_KEY.match(key):
+            keys.add(key)
+        else:
+            log.warning("prop-indexes: ignoring unsafe hot prop key %r", key)
+    return keys
+
+
+async def _existing(conn) -> dict[str, bool]:
+    """Hot-prop indexes on events -> valid (False until every partition is attached)."""
+    rows = await conn.execute(text("""
+        SELECT c.relname, i.indisvalid
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'events'::regclass AND c.relname LIKE :prefix
+    """), {"prefix": INDEX_PREFIX.replace("_", r"\_") + "%"})
+    return {r.relname: r.indisvalid for r in rows}
+
+
+async def _build(conn, key: str) -> None:
+    name = index_name(key)
+    columns = index_columns(key)
+    await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY events {columns}"))
+    partitions = (await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'events'::regclass ORDER BY 1"
+    ))).scalars().all()
+    suffix = name.removeprefix("ix_events_")
+    for partition in partitions:
+        child = f"{partition}_{suffix}"
+        await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} {columns}"))
+        attached = (await conn.execute(text(
+            "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:child) AND inhparent = to_regclass(:parent)"
+        ), {"child": child, "parent": name})).first()
+        if attached is None:
+            await conn.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {child}"))
+
+
+async def sync_prop_indexes() -> dict[str, list[str]]:
+    """Create indexes for newly hot keys, finish interrupted builds, drop unused ones."""
+    done: dict[str, list[str]] = {"created": [], "dropped": []}
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"SET lock_timeout = '{LOCK_TIMEOUT}'"))
+        wanted = {index_name(k): k for k in await _wanted_keys(conn)}
+        existing = await _existing(conn)
+        for name, key in sorted(wanted.items()):
+            if existing.get(name):
+                continue
+            await _build(conn, key)
+            done["created"].append(key)
+        for name in sorted(set(existing) - set(wanted)):
+            await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            done["dropped"].append(name)
+    if done["created"] or done["dropped"]:
+        log.info("prop-indexes: created %s, dropped %s", done["created"], done["dropped"])
+    return done
+
+
+async def run_prop_index_sync(stop: asyncio.Event | None = None) -> None:
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            await sync_prop_indexes()
+        except Exception as e:
+            log.error("prop-indexes: sync failed: %s", e, exc_info=True)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.prop_index_sync_interval_s)
+        except TimeoutError:
+            pass
@@ -0,0 +1,396 @@
+"""
+Incremental per-minute/hour/day event counts in `event_rollups`.
+
+Events are folded in insertion order: a pass takes the events whose created_at lies
+in [watermark, hi), adds their counts to the minute, hour and day rows and moves
+the watermark to hi in the same transaction. Every event is counted exactly once
+and no event is read twice.
+
+hi trails the clock by `rollup_lag_s`. created_at is the start time of the
+inserting transaction, and its rows only become visible when it commits, so the
+lag has to exceed the longest ingest transaction (a slow NDJSON upload included).
+The watermark is a timestamptz taken from now(), and range bounds are compared as
+timestamptz, so neither the worker's nor the API's session time zone moves it.
+
+The same pass maintains `user_sketches`: HyperLogLog registers (nimbus.sketches.hll)
+of the user_ids seen per project and hour/day. Registers are derived in SQL from
+hashtextextended(user_id, 0); merging them into the stored sketches is a
+register-wise max, so folding an event twice would be harmless there too.
+`prop_sketch_bins` holds DDSketch bin counts (nimbus.sketches.ddsketch) of the
+numeric props each project declares in `projects.numeric_props`, per name and
+hour/day; those add up like event_rollups. A pass takes a snapshot of the declared
+keys first. Keys missing from `projects.numeric_props_folded` get their bins
+rebuilt from every event inserted before the pass and are then recorded there, so
+a key declared late still covers its history; the API reads raw events for a key
+until then.
+
+Likewise `user_first_seen` (earliest ts per user) and `user_activity` (a bitmask
+of the days each user was active per month) for /v1/retention: LEAST and bitwise
+OR are idempotent too.
+
+With no watermark yet, the first run backfills the whole table partition by
+partition; `python -m nimbus_worker.rollups backfill` rebuilds it on demand. While
+no watermark exists the API answers /v1/metrics from raw events only.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import json
+import logging
+import math
+
+from sqlalchemy import text
+
+from .config import settings
+from .db import SessionLocal, engine
+from .partitions import is_partitioned, existing_partitions
+
+log = logging.getLogger(__name__)
+
+WATERMARK = "events"
+LOCK_KEY = 0x6E696D62  # advisory lock shared by the incremental job and backfill
+
+_FOLD = """
+    WITH m AS (
+        SELECT project_id, name, date_trunc('minute', ts) AS bucket, count(*) AS n
+        FROM {source}
+        WHERE created_at >= CAST(:lo AS timestamptz) AND created_at < CAST(:hi AS timestamptz)
+        GROUP BY 1, 2, 3
+    )
+    INSERT INTO event_rollups AS r (project_id, granularity, bucket_start, name, count)
+    SELECT project_id, 'minute', bucket, name, n FROM m
+    UNION ALL
+    SELECT project_id, 'hour', date_trunc('hour', bucket), name, sum(n) FROM m GROUP BY 1, 3, 4
+    UNION ALL
+    SELECT project_id, 'day', date_trunc('day', bucket), name, sum(n) FROM m GROUP BY 1, 3, 4
+    ON CONFLICT (project_id, granularity, bucket_start, name)
+    DO UPDATE SET count = r.count + EXCLUDED.count
+"""
+
+# Must match nimbus.sketches.hll.DEFAULT_PRECISION
+HLL_PRECISION = 14
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+# Per (project, hour/day, register): the largest rho among the range's users. A
+# register is picked by the hash's top bits; rho is the position of the first 1-bit
+# after them (64 - p + 1 when there is none).
+_SKETCH_REGISTERS = """
+    WITH h AS (
+        SELECT project_id, date_trunc('hour', ts) AS bucket, hashtextextended(user_id, 0)::bit(64) AS bits
+        FROM {source}
+        WHERE created_at >= CAST(:lo AS timestamptz) AND created_at < CAST(:hi AS timestamptz) AND user_id IS NOT NULL {ts_filter}
+    ),
+    r AS (
+        SELECT project_id, bucket,
+               substring(bits from 1 for {p})::bit({p})::int AS idx,
+               max(COALESCE(NULLIF(position(B'1' in substring(bits from {p} + 1)), 0), {rho_max})) AS rho
+        FROM h
+        GROUP BY 1, 2, 3
+    )
+    SELECT project_id, 'hour' AS granularity, bucket, idx, rho FROM r
+    UNION ALL
+    SELECT project_id, 'day', date_trunc('day', bucket), idx, max(rho) FROM r GROUP BY 1, 3, 4
+"""
+
+_LOCK_SKETCHES = text("""
+    SELECT s.project_id, s.granularity, s.bucket_start, s.registers
+    FROM user_sketches s
+    JOIN unnest(CAST(:pids AS uuid[]), CAST(:grans AS text[]), CAST(:buckets AS timestamp[])) AS k(pid, gran, bucket)
+      ON s.project_id = k.pid AND s.granularity = k.gran AND s.bucket_start = k.bucket
+    FOR UPDATE OF s
+""")
+
+_UPSERT_SKETCH = text("""
+    INSERT INTO user_sketches (project_id, granularity, bucket_start, registers)
+    VALUES (:project_id, :granularity, :bucket_start, :registers)
+    ON CONFLICT (project_id, granularity, bucket_start) DO UPDATE SET registers = EXCLUDED.registers
+""")
+
+# Must match nimbus.sketches.ddsketch.DEFAULT_ALPHA (relative accuracy of quantiles)
+DDSKETCH_ALPHA = 0.01
+DDSKETCH_LOG_GAMMA = math.log((1 + DDSKETCH_ALPHA) / (1 - DDSKETCH_ALPHA))
+
+# Only JSON numbers count; a value x != 0 goes to bin ceil(ln|x| / ln gamma) of its sign.
+# The (project, prop) pairs to bin are passed in, from one snapshot per pass. Numbers
+# float8 cannot hold (ingest keeps a 400-digit int) are skipped: the cast would fail
+# the whole pass. jsonb compares them without casting, so the filter cannot raise.
+_FOLD_PROP_BINS = """
+    WITH v AS (
+        SELECT e.project_id, k.prop, date_trunc('hour', e.ts) AS bucket, e.name, (e.props ->> k.prop)::float8 AS x
+        FROM {source} e
+        JOIN unnest(CAST(:pids AS uuid[]), CAST(:props AS text[])) AS k(project_id, prop) ON k.project_id = e.project_id
+        WHERE e.created_at >= CAST(:lo AS timestamptz) AND e.created_at < CAST(:hi AS timestamptz)
+          AND jsonb_typeof(e.props -> k.prop) = 'number'
+          AND e.props -> k.prop BETWEEN '-1e308'::jsonb AND '1e308'::jsonb
+          AND (e.props -> k.prop = '0'::jsonb OR NOT e.props -> k.prop BETWEEN '-1e-307'::jsonb AND '1e-307'::jsonb)
+    ),
+    b AS (
+        SELECT project_id, prop, bucket, name, sign(x)::smallint AS sign,
+               CASE WHEN x = 0 THEN 0 ELSE ceil(ln(abs(x)) / :log_gamma)::int END AS bin, count(*) AS n
+        FROM v
+        GROUP BY 1, 2, 3, 4, 5, 6
+    )
+    INSERT INTO prop_sketch_bins AS r (project_id, prop, granularity, bucket_start, name, sign, bin, count)
+    SELECT project_id, prop, 'hour', bucket, name, sign, bin, n FROM b
+    UNION ALL
+    SELECT project_id, prop, 'day', date_trunc('day', bucket), name, sign, bin, sum(n) FROM b GROUP BY 1, 2, 4, 5, 6, 7
+    ON CONFLICT (project_id, prop, granularity, bucket_start, name, sign, bin)
+    DO UPDATE SET count = r.count + EXCLUDED.count
+"""
+
+_DECLARED_PROPS = text("""
+    SELECT id, numeric_props::text AS declared, numeric_props_folded::text AS folded
+    FROM projects
+    WHERE numeric_props::jsonb <> '[]'::jsonb OR numeric_props_folded::jsonb <> '[]'::jsonb
+""")
+
+_DELETE_PROP_BINS = text("""
+    DELETE FROM prop_sketch_bins b
+    USING unnest(CAST(:pids AS uuid[]), CAST(:props AS text[])) AS k(project_id, prop)
+    WHERE b.project_id = k.project_id AND b.prop = k.prop
+""")
+
+_SET_PROPS_FOLDED = text("UPDATE projects SET numeric_props_folded = CAST(:props AS json) WHERE id = :id")
+
+# Updates that change nothing are skipped, to spare the dead tuples
+_FOLD_FIRST_SEEN = """
+    INSERT INTO user_first_seen (project_id, user_id, first_ts)
+    SELECT project_id, user_id, min(ts)
+    FROM {source}
+    WHERE created_at >= CAST(:lo AS timestamptz) AND created_at < CAST(:hi AS timestamptz) AND user_id IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (project_id, user_id) DO UPDATE SET first_ts = EXCLUDED.first_ts
+    WHERE EXCLUDED.first_ts < user_first_seen.first_ts
+"""
+
+_FOLD_ACTIVITY = """
+    INSERT INTO user_activity (project_id, user_id, month, days)
+    SELECT project_id, user_id, date_trunc('month', ts)::date, bit_or(1 << (extract(day from ts)::int - 1))
+    FROM {source}
+    WHERE created_at >= CAST(:lo AS timestamptz) AND created_at < CAST(:hi AS timestamptz) AND user_id IS NOT NULL
+    GROUP BY 1, 2, 3
+    ON CONFLICT (project_id, user_id, month) DO UPDATE SET days = user_activity.days | EXCLUDED.days
+    WHERE user_activity.days | EXCLUDED.days <> user_activity.days
+"""
+
+_SET_WATERMARK = text("""
+    INSERT INTO rollup_watermarks (name, processed_until, updated_at)
+    VALUES (:name, :until, now())
+    ON CONFLICT (name) DO UPDATE SET processed_until = EXCLUDED.processed_until, updated_at = now()
+""")
+
+
+async def fold_range(
+    conn,
+    lo: dt.datetime,
+    hi: dt.datetime,
+    source: str = "events",
+    props: list[tuple] | None = None,
+) -> int:
+    """Add the events inserted in [lo, hi) to the rollups, sketches and user tables; returns rollup rows touched."""
+    res = await conn.execute(text(_FOLD.format(source=source)), {"lo": lo, "hi": hi})
+    await fold_prop_bins(conn, lo, hi, source, props)
+    await fold_user_sketches(conn, lo, hi, source)
+    await fold_user_activity(conn, lo, hi, source)
+    return res.rowcount
+
+
+async def declared_props(conn) -> dict:
+    """project_id -> (keys in numeric_props, keys in numeric_props_folded)."""
+    return {
+        r.id: (json.loads(r.declared), json.loads(r.folded))
+        for r in await conn.execute(_DECLARED_PROPS)
+    }
+
+
+def _pairs(declared: dict) -> list[tuple]:
+    return [(pid, prop) for pid, (props, _) in declared.items() for prop in props]
+
+
+async def fold_prop_bins(
+    conn,
+    lo: dt.datetime,
+    hi: dt.datetime,
+    source: str = "events",
+    props: list[tuple] | None = None,
+) -> int:
+    """
+    Add the numeric props of the events inserted in [lo, hi) to prop_sketch_bins,
+    for the given (project_id, prop) pairs or else every declared one.
+    """
+    if props is None:
+        props = _pairs(await declared_props(conn))
+    if not props:
+        return 0
+    res = await conn.execute(text(_FOLD_PROP_BINS.format(source=source)), {
+        "lo": lo, "hi": hi, "log_gamma": DDSKETCH_LOG_GAMMA,
+        "pids": [p[0] for p in props], "props": [p[1] for p in props],
+    })
+    return res.rowcount
+
+
+async def mark_props_folded(conn, declared: dict) -> None:
+    """Record each project's declared keys as folded (dropping undeclared ones)."""
+    for pid, (props, folded) in declared.items():
+        if props != folded:
+            await conn.execute(_SET_PROPS_FOLDED, {"id": pid, "props": json.dumps(props)})
+
+
+async def fold_new_props(conn, declared: dict, before: dt.datetime) -> int:
+    """
+    Rebuild the bins of the declared keys not yet folded from the events inserted
+    before `before`, then mark every project's keys folded. A key that was dropped
+    and declared again starts over, so nothing is counted twice.
+    """
+    new = [(pid, prop) for pid, (props, folded) in declared.items() for prop in props if prop not in folded]
+    n = 0
+    if new:
+        args = {"pids": [p[0] for p in new], "props": [p[1] for p in new]}
+        await conn.execute(_DELETE_PROP_BINS, args)
+        n = await fold_prop_bins(conn, dt.datetime.min, before, "events", new)
+        log.info("rollups: built prop bins for %d newly declared keys (%d rows)", len(new), n)
+    await mark_props_folded(conn, declared)
+    return n
+
+
+async def fold_user_activity(conn, lo: dt.datetime, hi: dt.datetime, source: str = "events") -> None:
+    """Fold the users of the events inserted in [lo, hi) into user_first_seen and user_activity."""
+    await conn.execute(text(_FOLD_FIRST_SEEN.format(source=source)), {"lo": lo, "hi": hi})
+    await conn.execute(text(_FOLD_ACTIVITY.format(source=source)), {"lo": lo, "hi": hi})
+
+
+async def fold_user_sketches(
+    conn,
+    lo: dt.datetime,
+    hi: dt.datetime,
+    source: str = "events",
+    ts_range: tuple[dt.datetime, dt.datetime] | None = None,
+) -> int:
+    """Merge the users of the events inserted in [lo, hi) into user_sketches; returns sketches written."""
+    params = {"lo": lo, "hi": hi}
+    ts_filter = ""
+    if ts_range is not None:
+        ts_filter = "AND ts >= :ts_lo AND ts < :ts_hi"
+        params.update(ts_lo=ts_range[0], ts_hi=ts_range[1])
+    sql = _SKETCH_REGISTERS.format(source=source, ts_filter=ts_filter, p=HLL_PRECISION, rho_max=64 - HLL_PRECISION + 1)
+    offers: dict[tuple, list[tuple[int, int]]] = {}
+    for r in await conn.execute(text(sql), params):
+        offers.setdefault((r.project_id, r.granularity, r.bucket), []).append((r.idx, r.rho))
+    if not offers:
+        return 0
+
+    keys = list(offers)
+    stored = {
+        (r.project_id, r.granularity, r.bucket_start): r.registers
+        for r in await conn.execute(_LOCK_SKETCHES, {
+            "pids": [k[0] for k in keys], "grans": [k[1] for k in keys], "buckets": [k[2] for k in keys],
+        })
+    }
+    rows = []
+    for key, registers in offers.items():
+        merged = bytearray(stored.get(key) or HLL_REGISTERS)
+        for idx, rho in registers:
+            if rho > merged[idx]:
+                merged[idx] = rho
+        rows.append({"project_id": key[0], "granularity": key[1], "bucket_start": key[2], "registers": bytes(merged)})
+    await conn.execute(_UPSERT_SKETCH, rows)
+    return len(rows)
+
+
+async def fold_once() -> bool | None:
+    """
+    Fold the next step of events after the watermark. Returns True if there may be
+    more to do, False when caught up (or another process holds the lock), and None
+    when no watermark exists yet (backfill first).
+    """
+    async with SessionLocal() as s:
+        if not (await s.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": LOCK_KEY})).scalar():
+            return False
+        lo = (await s.execute(
+            text("SELECT processed_until FROM rollup_watermarks WHERE name = :name FOR UPDATE"),
+            {"name": WATERMARK},
+        )).scalar()
+        if lo is None:
+            return None
+        limit = (await s.execute(
+            text("SELECT now() - make_interval(secs => :lag)"), {"lag": settings.rollup_lag_s}
+        )).scalar()
+        hi = min(lo + dt.timedelta(seconds=settings.rollup_step_s), limit)
+        if hi <= lo:
+            return False
+        declared = await declared_props(s)
+        await fold_new_props(s, declared, lo)
+        await fold_range(s, lo, hi, props=_pairs(declared))
+        await s.execute(_SET_WATERMARK, {"name": WATERMARK, "until": hi})
+        await s.commit()
+        return hi < limit
+
+
+async def backfill() -> dt.datetime:
+    """Rebuild event_rollups and the user tables from scratch; returns the new watermark."""
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": LOCK_KEY})
+        try:
+            cutoff = (await conn.execute(
+                text("SELECT now() - make_interval(secs => :lag)"), {"lag": settings.rollup_lag_s}
+            )).scalar()
+            # Dropping the watermark first sends /v1/metrics to raw events meanwhile
+            await conn.execute(text("DELETE FROM rollup_watermarks WHERE name = :name"), {"name": WATERMARK})
+            await conn.execute(text("TRUNCATE event_rollups, prop_sketch_bins, user_sketches, user_first_seen, user_activity"))
+            await conn.commit()
+            declared = await declared_props(conn)
+
+            sources = ["events"]
+            if await is_partitioned(conn):
+                sources = sorted(await existing_partitions(conn))
+            for source in sources:
+                res = await conn.execute(text(_FOLD.format(source=source)), {"lo": dt.datetime.min, "hi": cutoff})
+                await fold_prop_bins(conn, dt.datetime.min, cutoff, source, _pairs(declared))
+                await fold_user_activity(conn, dt.datetime.min, cutoff, source)
+                await conn.commit()
+                # Sketch registers a day of events at a time, to bound what is held in memory
+                span = (await conn.execute(text(f"SELECT min(ts), max(ts) FROM {source}"))).one()
+                sketches = 0
+                if span[0] is not None:
+                    day = span[0].replace(hour=0, minute=0, second=0, microsecond=0)
+                    while day <= span[1]:
+                        nxt = day + dt.timedelta(days=1)
+                        sketches += await fold_user_sketches(conn, dt.datetime.min, cutoff, source, (day, nxt))
+                        await conn.commit()
+                        day = nxt
+                log.info("rollups: backfilled %s (%d rollup rows, %d sketches)", source, res.rowcount, sketches)
+
+            await mark_props_folded(conn, declared)
+            await conn.execute(_SET_WATERMARK, {"name": WATERMARK, "until": cutoff})
+            await conn.commit()
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
+            await conn.commit()
+    log.info("rollups: backfill complete up to %s", cutoff)
+    return cutoff
+
+
+async def run_rollups(stop: asyncio.Event | None = None) -> None:
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            while not stop.is_set():
+                more = await fold_once()
+                if more is None:
+                    await backfill()
+                elif not more:
+                    break
+        except Exception as e:
+            log.error("rollups: fold failed: %s", e, exc_info=True)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.rollup_interval_s)
+        except TimeoutError:
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Event rollup maintenance")
+    parser.add_argument("command", choices=["backfill"], help="backfill: rebuild event_rollups from all events")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(backfill())
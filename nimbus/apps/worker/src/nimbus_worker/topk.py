@@ -0,0 +1,95 @@
+"""
+Heavy-hitter summaries for queued ingest, the worker half of the API's
+nimbus.services.topk (which documents the layout and the error bounds).
+
+After a chunk commits, its rows are counted per (project, dimension, hour/day
+bucket) and folded into the Redis Space-Saving summaries with the same script,
+keys and capacity the API uses, so both insert paths feed one summary.
+"""
+import datetime as dt
+import json
+import logging
+from collections import Counter
+
+from .config import settings
+from .db import redis
+
+log = logging.getLogger(__name__)
+
+# KEYS: counts zset, meta hash. ARGV: capacity, ttl_s, then item, count pairs.
+# Keep in step with nimbus.services.topk._SPACE_SAVING.
+SPACE_SAVING = """
+local cap = tonumber(ARGV[1])
+local total = 0
+for i = 3, #ARGV, 2 do
+  local item, n = ARGV[i], tonumber(ARGV[i + 1])
+  total = total + n
+  if redis.call('ZSCORE', KEYS[1], item) then
+    redis.call('ZINCRBY', KEYS[1], n, item)
+  elseif redis.call('ZCARD', KEYS[1]) < cap then
+    redis.call('ZADD', KEYS[1], n, item)
+  else
+    local min = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    local floor = tonumber(min[2])
+    redis.call('ZREM', KEYS[1], min[1])
+    redis.call('HDEL', KEYS[2], 'e:' .. min[1])
+    redis.call('ZADD', KEYS[1], floor + n, item)
+    redis.call('HSET', KEYS[2], 'e:' .. item, floor)
+  end
+end
+redis.call('HINCRBY', KEYS[2], 'n', total)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return total
+"""
+
+GRANULARITIES = {"hour": 3600, "day": 86400}
+MAX_ITEM_CHARS = 200
+_EPOCH = dt.datetime(1970, 1, 1)
+
+
+def summary_keys(project_id: str, dimension: str, granularity: str, bucket: dt.datetime) -> tuple[str, str]:
+    base = f"{settings.topk_prefix}:{project_id}:{dimension}:{granularity}:{bucket:%Y%m%d%H}"
+    return base, base + ":meta"
+
+
+def dimension_values(name: str, props: dict) -> list[tuple[str, str]]:
+    out = [("name", name)]
+    for key in settings.topk_props:
+        value = props.get(key)
+        if value is None or isinstance(value, (dict, list)):
+            continue
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        out.append((f"props.{key}", str(value)[:MAX_ITEM_CHARS]))
+    return out
+
+
+def aggregate(rows: list[dict]) -> dict[tuple, Counter]:
+    """Item counts per summary (project, dimension, granularity, bucket) for decoded rows."""
+    out: dict[tuple, Counter] = {}
+    for r in rows:
+        props = json.loads(r["props"]) if settings.topk_props else {}
+        pairs = dimension_values(r["name"], props)
+        for granularity, step in GRANULARITIES.items():
+            bucket = _EPOCH + (r["ts"] - _EPOCH) // dt.timedelta(seconds=step) * dt.timedelta(seconds=step)
+            for dimension, item in pairs:
+                out.setdefault((str(r["project_id"]), dimension, granularity, bucket), Counter())[item] += 1
+    return out
+
+
+async def record(rows: list[dict]) -> None:
+    """Fold committed rows into the summaries; failures only make them undercount."""
+    if not settings.topk_enabled or not rows:
+        return
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for (pid, dimension, granularity, bucket), items in aggregate(rows).items():
+                ttl = settings.topk_hour_ttl_s if granularity == "hour" else settings.topk_day_ttl_s
+                args: list = [settings.topk_capacity, ttl]
+                for item, n in items.items():
+                    args += [item, n]
+                pipe.eval(SPACE_SAVING, 2, *summary_keys(pid, dimension, granularity, bucket), *args)
+            await pipe.execute()
+    except Exception as e:
+        log.warning("ingest: top-k summary update failed: %s", e)
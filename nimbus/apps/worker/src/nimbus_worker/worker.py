@@ -1,12 +1,11 @@
-import asyncio, json
-import redis.asyncio as aioredis
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import asyncio, json, logging
 from sqlalchemy import text
 from .config import settings
-
-engine = create_async_engine(settings.database_url, pool_pre_ping=True)
-SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
-redis = aioredis.from_url(settings.redis_url, encoding="utf-8", decode_responses=True)
+from .db import SessionLocal, redis
+from .ingest import run_consumers
+from .partitions import run_partition_maintenance
+from .prop_indexes import run_prop_index_sync
+from .rollups import run_rollups
 
 async def rollup_last_minute():
     async with SessionLocal() as s:
@@ -24,5 +23,18 @@ async def scheduler():
         await rollup_last_minute()
         await asyncio.sleep(60)
 
+async def main():
+    tasks = [scheduler()]
+    if settings.ingest_consumers > 0:
+        tasks.append(run_consumers())
+    if settings.partition_maintenance_interval_s > 0:
+        tasks.append(run_partition_maintenance())
+    if settings.rollup_interval_s > 0:
+        tasks.append(run_rollups())
+    if settings.prop_index_sync_interval_s > 0:
+        tasks.append(run_prop_index_sync())
+    await asyncio.gather(*tasks)
+
 if __name__ == "__main__":
-    asyncio.run(scheduler())
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+import datetime as dt
+import json
+import uuid
+
+from nimbus_worker.ingest import decode_entry
+
+
+def test_decode_entry_shapes_rows():
+    pid, eid = uuid.uuid4(), uuid.uuid4()
+    fields = {
+        "project_id": str(pid),
+        "n": "1",
+        "events": json.dumps([
+            {"id": str(eid), "name": "signup", "ts": "2024-05-01T10:00:00+02:00", "props": {"plan": "pro"}, "user_id": "u1"}
+        ]),
+    }
+    [row] = decode_entry(fields)
+    assert row["id"] == eid and row["project_id"] == pid
+    # stored as naive UTC, like the API does
+    assert row["ts"] == dt.datetime(2024, 5, 1, 8, 0, 0)
+    assert json.loads(row["props"]) == {"plan": "pro"}
+    assert row["user_id"] == "u1" and row["seq"] is None
+    assert row["idempotency_key"] is None
+
+
+def test_metrics_version_fields_match_closed_bucket_widths():
+    from nimbus_worker.ingest import metrics_version_fields
+
+    now = dt.datetime(2024, 5, 1, 10, 17, 30)
+    assert metrics_version_fields(dt.datetime(2024, 5, 1, 10, 17, 5), now) == ["open"]
+    # before 10:17 and 10:15, still inside the open hour
+    assert metrics_version_fields(dt.datetime(2024, 5, 1, 10, 14), now) == ["open", "closed:1m", "closed:5m", "closed:15m"]
+    assert metrics_version_fields(dt.datetime(2024, 4, 30, 23, 0), now) == [
+        "open", "closed:1m", "closed:5m", "closed:15m", "closed:1h", "closed:1d",
+    ]
+
+
+def test_topk_aggregate_counts_names_and_declared_props(monkeypatch):
+    from nimbus_worker import topk
+
+    monkeypatch.setattr(topk.settings, "topk_props", ["page", "beta"])
+    pid = uuid.uuid4()
+    rows = [
+        {"project_id": pid, "name": "pv", "ts": dt.datetime(2024, 5, 1, 10, 5), "props": json.dumps({"page": "/a", "beta": True})},
+        {"project_id": pid, "name": "pv", "ts": dt.datetime(2024, 5, 1, 11, 5), "props": json.dumps({"page": {"nested": 1}})},
+    ]
+    counts = topk.aggregate(rows)
+    assert counts[(str(pid), "name", "day", dt.datetime(2024, 5, 1))] == {"pv": 2}
+    assert counts[(str(pid), "name", "hour", dt.datetime(2024, 5, 1, 11))] == {"pv": 1}
+    assert counts[(str(pid), "props.page", "day", dt.datetime(2024, 5, 1))] == {"/a": 1}
+    assert counts[(str(pid), "props.beta", "hour", dt.datetime(2024, 5, 1, 10))] == {"true": 1}
+    assert topk.summary_keys(str(pid), "name", "hour", dt.datetime(2024, 5, 1, 10))[0].endswith(f":{pid}:name:hour:2024050110")
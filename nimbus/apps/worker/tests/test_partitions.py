@@ -0,0 +1,26 @@
+import datetime as dt
+
+from nimbus_worker.partitions import next_period, parse_bound, partition_name, wanted_ranges
+
+
+def test_monthly_ranges_roll_over_the_year():
+    ranges = wanted_ranges(dt.datetime(2024, 11, 17, 13, 5), "month", premake=2)
+    assert ranges == [
+        (dt.datetime(2024, 11, 1), dt.datetime(2024, 12, 1)),
+        (dt.datetime(2024, 12, 1), dt.datetime(2025, 1, 1)),
+        (dt.datetime(2025, 1, 1), dt.datetime(2025, 2, 1)),
+    ]
+    assert [partition_name(lo, "month") for lo, _ in ranges] == ["events_p202411", "events_p202412", "events_p202501"]
+
+
+def test_daily_ranges():
+    [(lo, hi), _] = wanted_ranges(dt.datetime(2024, 2, 29, 23, 59), "day", premake=1)
+    assert (lo, hi) == (dt.datetime(2024, 2, 29), dt.datetime(2024, 3, 1))
+    assert partition_name(lo, "day") == "events_p20240229"
+    assert next_period(hi, "day") == dt.datetime(2024, 3, 2)
+
+
+def test_parse_bound():
+    expr = "FOR VALUES FROM ('2024-05-01 00:00:00') TO ('2024-06-01 00:00:00')"
+    assert parse_bound(expr) == (dt.datetime(2024, 5, 1), dt.datetime(2024, 6, 1))
+    assert parse_bound("DEFAULT") is None
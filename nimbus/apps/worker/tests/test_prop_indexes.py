@@ -0,0 +1,11 @@
+from nimbus_worker.prop_indexes import index_columns, index_name
+
+
+def test_index_name_is_stable_and_short():
+    assert index_name("plan") == index_name("plan") != index_name("country")
+    assert index_name("x" * 64).startswith("ix_events_hot_") and len(index_name("x" * 64)) <= 63
+
+
+def test_index_matches_the_api_predicate():
+    # the API filters with: props ? 'plan' AND (props -> 'plan') = CAST(:value AS jsonb)
+    assert index_columns("plan") == "(project_id, (props -> 'plan'), ts DESC) WHERE props ? 'plan'"
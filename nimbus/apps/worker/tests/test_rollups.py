@@ -0,0 +1,298 @@
+import datetime as dt
+import json
+import math
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from nimbus_worker.db import SessionLocal
+from nimbus_worker.rollups import DDSKETCH_LOG_GAMMA, declared_props, fold_new_props, fold_range
+
+# One loop for the module: SessionLocal's pooled connections are bound to it
+pytestmark = pytest.mark.asyncio(loop_scope="module")
+
+# created_at far in the past so the fold only sees this test's rows
+T0 = dt.datetime(2001, 1, 1)
+
+
+async def test_fold_range_adds_minute_hour_and_day_counts():
+    pid = uuid.uuid4()
+    async with SessionLocal() as s:
+        await s.execute(
+            text("INSERT INTO projects (id, name, api_key_id, api_key_hash) VALUES (:id, 'rollup-test', :kid, '\\x00')"),
+            {"id": pid, "kid": f"rollup-{pid.hex[:12]}"},
+        )
+        events = [
+            ("signup", dt.datetime(2024, 5, 1, 10, 0, 5)),
+            ("signup", dt.datetime(2024, 5, 1, 10, 0, 50)),
+            ("signup", dt.datetime(2024, 5, 1, 10, 7, 0)),
+            ("login", dt.datetime(2024, 5, 1, 11, 30, 0)),
+        ]
+        for i, (name, ts) in enumerate(events):
+            await s.execute(
+                text("INSERT INTO events (id, project_id, name, ts, props, created_at, updated_at) "
+                     "VALUES (:id, :pid, :name, :ts, '{}', :created, :created)"),
+                {"id": uuid.uuid4(), "pid": pid, "name": name, "ts": ts, "created": T0 + dt.timedelta(seconds=i)},
+            )
+        try:
+            # two passes over adjacent ranges add up instead of overwriting
+            await fold_range(s, T0, T0 + dt.timedelta(seconds=2))
+            await fold_range(s, T0 + dt.timedelta(seconds=2), T0 + dt.timedelta(minutes=1))
+            rows = (await s.execute(
+                text("SELECT granularity, bucket_start, name, count FROM event_rollups "
+                     "WHERE project_id = :pid ORDER BY 1, 2, 3"),
+                {"pid": pid},
+            )).all()
+        finally:
+            await s.rollback()
+
+    got = {(g, b, n): c for g, b, n, c in rows}
+    assert got == {
+        ("day", dt.datetime(2024, 5, 1), "login"): 1,
+        ("day", dt.datetime(2024, 5, 1), "signup"): 3,
+        ("hour", dt.datetime(2024, 5, 1, 10), "signup"): 3,
+        ("hour", dt.datetime(2024, 5, 1, 11), "login"): 1,
+        ("minute", dt.datetime(2024, 5, 1, 10, 0), "signup"): 2,
+        ("minute", dt.datetime(2024, 5, 1, 10, 7), "signup"): 1,
+        ("minute", dt.datetime(2024, 5, 1, 11, 30), "login"): 1,
+    }
+
+
+async def test_fold_range_merges_user_sketches():
+    pid = uuid.uuid4()
+    async with SessionLocal() as s:
+        await s.execute(
+            text("INSERT INTO projects (id, name, api_key_id, api_key_hash) VALUES (:id, 'sketch-test', :kid, '\\x00')"),
+            {"id": pid, "kid": f"sketch-{pid.hex[:12]}"},
+        )
+        # u0..u11 at 10:xx, u8..u19 at 11:xx; u3 twice; one anonymous event
+        users = [(f"u{i}", dt.datetime(2024, 5, 1, 10, i)) for i in range(12)]
+        users += [(f"u{i}", dt.datetime(2024, 5, 1, 11, i)) for i in range(8, 20)]
+        users += [("u3", dt.datetime(2024, 5, 1, 10, 30)), (None, dt.datetime(2024, 5, 1, 10, 31))]
+        for i, (user_id, ts) in enumerate(users):
+            await s.execute(
+                text("INSERT INTO events (id, project_id, name, ts, props, user_id, created_at, updated_at) "
+                     "VALUES (:id, :pid, 'view', :ts, '{}', :uid, :created, :created)"),
+                {"id": uuid.uuid4(), "pid": pid, "ts": ts, "uid": user_id, "created": T0 + dt.timedelta(seconds=i)},
+            )
+        try:
+            await fold_range(s, T0, T0 + dt.timedelta(seconds=15))
+            await fold_range(s, T0 + dt.timedelta(seconds=15), T0 + dt.timedelta(minutes=1))
+            rows = (await s.execute(
+                text("SELECT granularity, bucket_start, registers FROM user_sketches WHERE project_id = :pid"),
+                {"pid": pid},
+            )).all()
+        finally:
+            await s.rollback()
+
+    sketches = {(g, b): bytes(r) for g, b, r in rows}
+    assert set(sketches) == {
+        ("hour", dt.datetime(2024, 5, 1, 10)),
+        ("hour", dt.datetime(2024, 5, 1, 11)),
+        ("day", dt.datetime(2024, 5, 1)),
+    }
+    h10 = sketches["hour", dt.datetime(2024, 5, 1, 10)]
+    h11 = sketches["hour", dt.datetime(2024, 5, 1, 11)]
+    assert len(h10) == 1 << 14
+    # Few users in 16k registers: one nonzero register per distinct user
+    assert sum(1 for r in h10 if r) == 12
+    assert sum(1 for r in h11 if r) == 12
+    # The day sketch is the union of its hours
+    assert sketches["day", dt.datetime(2024, 5, 1)] == bytes(map(max, h10, h11))
+
+
+async def test_fold_range_tracks_first_seen_and_active_days():
+    pid = uuid.uuid4()
+    async with SessionLocal() as s:
+        await s.execute(
+            text("INSERT INTO projects (id, name, api_key_id, api_key_hash) VALUES (:id, 'activity-test', :kid, '\\x00')"),
+            {"id": pid, "kid": f"activity-{pid.hex[:12]}"},
+        )
+        events = [
+            ("a", dt.datetime(2024, 5, 3, 12)),
+            ("a", dt.datetime(2024, 5, 31, 23, 59)),
+            ("b", dt.datetime(2024, 6, 1, 8)),
+            # folded later but earlier in ts: moves a's first_seen back
+            ("a", dt.datetime(2024, 4, 30, 9)),
+            ("a", dt.datetime(2024, 5, 3, 18)),
+        ]
+        for i, (user_id, ts) in enumerate(events):
+            await s.execute(
+                text("INSERT INTO events (id, project_id, name, ts, props, user_id, created_at, updated_at) "
+                     "VALUES (:id, :pid, 'view', :ts, '{}', :uid, :created, :created)"),
+                {"id": uuid.uuid4(), "pid": pid, "ts": ts, "uid": user_id, "created": T0 + dt.timedelta(seconds=i)},
+            )
+        try:
+            await fold_range(s, T0, T0 + dt.timedelta(seconds=3))
+            await fold_range(s, T0 + dt.timedelta(seconds=3), T0 + dt.timedelta(minutes=1))
+            first = dict((await s.execute(
+                text("SELECT user_id, first_ts FROM user_first_seen WHERE project_id = :pid"), {"pid": pid}
+            )).all())
+            activity = {(u, m): d for u, m, d in await s.execute(
+                text("SELECT user_id, month, days FROM user_activity WHERE project_id = :pid"), {"pid": pid}
+            )}
+        finally:
+            await s.rollback()
+
+    assert first == {"a": dt.datetime(2024, 4, 30, 9), "b": dt.datetime(2024, 6, 1, 8)}
+    assert activity == {
+        ("a", dt.date(2024, 4, 1)): 1 << 29,
+        ("a", dt.date(2024, 5, 1)): (1 << 2) | (1 << 30),
+        ("b", dt.date(2024, 6, 1)): 1,
+    }
+
+
+async def test_fold_range_bins_declared_numeric_props():
+    pid = uuid.uuid4()
+    async with SessionLocal() as s:
+        await s.execute(
+            text("INSERT INTO projects (id, name, api_key_id, api_key_hash, numeric_props) "
+                 "VALUES (:id, 'bins-test', :kid, '\\x00', CAST('[\"ms\"]' AS json))"),
+            {"id": pid, "kid": f"bins-{pid.hex[:12]}"},
+        )
+        events = [
+            ("req", dt.datetime(2024, 5, 1, 10, 1), {"ms": 100}),
+            ("req", dt.datetime(2024, 5, 1, 10, 2), {"ms": 100.5}),  # same bin as 100
+            ("req", dt.datetime(2024, 5, 1, 11, 0), {"ms": 0}),
+            ("req", dt.datetime(2024, 5, 1, 11, 5), {"ms": -3}),
+            ("req", dt.datetime(2024, 5, 1, 11, 6), {"ms": "7"}),  # not a JSON number
+            ("req", dt.datetime(2024, 5, 1, 11, 7), {"other": 5}),
+        ]
+        for i, (name, ts, props) in enumerate(events):
+            await s.execute(
+                text("INSERT INTO events (id, project_id, name, ts, props, created_at, updated_at) "
+                     "VALUES (:id, :pid, :name, :ts, CAST(:props AS jsonb), :created, :created)"),
+                {"id": uuid.uuid4(), "pid": pid, "name": name, "ts": ts, "props": json.dumps(props),
+                 "created": T0 + dt.timedelta(seconds=i)},
+            )
+        try:
+            await fold_range(s, T0, T0 + dt.timedelta(seconds=1))
+            await fold_range(s, T0 + dt.timedelta(seconds=1), T0 + dt.timedelta(minutes=1))
+            rows = (await s.execute(
+                text("SELECT granularity, bucket_start, sign, bin, count FROM prop_sketch_bins "
+                     "WHERE project_id = :pid AND prop = 'ms' AND name = 'req'"),
+                {"pid": pid},
+            )).all()
+        finally:
+            await s.rollback()
+
+    b100 = math.ceil(math.log(100) / DDSKETCH_LOG_GAMMA)
+    b3 = math.ceil(math.log(3) / DDSKETCH_LOG_GAMMA)
+    assert {(g, b, sign, bin): n for g, b, sign, bin, n in rows} == {
+        ("hour", dt.datetime(2024, 5, 1, 10), 1, b100): 2,
+        ("hour", dt.datetime(2024, 5, 1, 11), 0, 0): 1,
+        ("hour", dt.datetime(2024, 5, 1, 11), -1, b3): 1,
+        ("day", dt.datetime(2024, 5, 1), 1, b100): 2,
+        ("day", dt.datetime(2024, 5, 1), 0, 0): 1,
+        ("day", dt.datetime(2024, 5, 1), -1, b3): 1,
+    }
+
+
+async def test_numbers_beyond_float8_do_not_stall_the_fold():
+    pid = uuid.uuid4()
+    async with SessionLocal() as s:
+        await s.execute(
+            text("INSERT INTO projects (id, name, api_key_id, api_key_hash, numeric_props) "
+                 "VALUES (:id, 'range-test', :kid, '\\x00', CAST('[\"amount\"]' AS json))"),
+            {"id": pid, "kid": f"range-{pid.hex[:12]}"},
+        )
+        # ingest keeps ints of any size; the text is stored as is
+        for i, amount in enumerate(["1" + "0" * 400, "-1e400", "1e-400", "5", "0"]):
+            await s.execute(
+                text("INSERT INTO events (id, project_id, name, ts, props, created_at, updated_at) "
+                     "VALUES (:id, :pid, 'pay', :ts, CAST(:props AS jsonb), :created, :created)"),
+                {"id": uuid.uuid4(), "pid": pid, "ts": dt.datetime(2024, 5, 1, 10, i), "props": f'{{"amount": {amount}}}',
+                 "created": T0 + dt.timedelta(seconds=i)},
+            )
+        try:
+            await fold_range(s, T0, T0 + dt.timedelta(minutes=1))
+            rows = (await s.execute(
+                text("SELECT sign, bin, count FROM prop_sketch_bins WHERE project_id = :pid AND granularity = 'hour'"),
+                {"pid": pid},
+            )).all()
+            events = (await s.execute(
+                text("SELECT count FROM event_rollups WHERE project_id = :pid AND granularity = 'day'"), {"pid": pid}
+            )).scalar()
+        finally:
+            await s.rollback()
+
+    assert sorted(rows) == [(0, 0, 1), (1, math.ceil(math.log(5) / DDSKETCH_LOG_GAMMA), 1)]
+    assert events == 5
+
+
+async def test_late_declared_prop_gets_its_history_binned():
+    pid = uuid.uuid4()
+    async with SessionLocal() as s:
+        await s.execute(
+            text("INSERT INTO projects (id, name, api_key_id, api_key_hash) VALUES (:id, 'late-bins', :kid, '\\x00')"),
+            {"id": pid, "kid": f"late-{pid.hex[:12]}"},
+        )
+        for i, ms in enumerate([10, 10, 250]):
+            await s.execute(
+                text("INSERT INTO events (id, project_id, name, ts, props, created_at, updated_at) "
+                     "VALUES (:id, :pid, 'req', :ts, CAST(:props AS jsonb), :created, :created)"),
+                {"id": uuid.uuid4(), "pid": pid, "ts": dt.datetime(2024, 5, 1, 10, i), "props": json.dumps({"ms": ms}),
+                 "created": T0 + dt.timedelta(seconds=i)},
+            )
+
+        async def bins():
+            rows = await s.execute(
+                text("SELECT bin, count FROM prop_sketch_bins WHERE project_id = :pid AND granularity = 'hour'"), {"pid": pid}
+            )
+            return dict(rows.all())
+
+        async def snapshot():
+            return {pid: (await declared_props(s))[pid]}
+
+        try:
+            # the first two events are folded before "ms" is declared, the third after
+            await fold_range(s, T0, T0 + dt.timedelta(seconds=2))
+            await s.execute(text("UPDATE projects SET numeric_props = CAST('[\"ms\"]' AS json) WHERE id = :id"), {"id": pid})
+            await fold_range(s, T0 + dt.timedelta(seconds=2), T0 + dt.timedelta(minutes=1))
+            partial = await bins()
+            declared = await snapshot()
+            assert declared == {pid: (["ms"], [])}
+            await fold_new_props(s, declared, T0 + dt.timedelta(minutes=1))
+            rebuilt = await bins()
+            # once folded, a later pass leaves the bins alone
+            declared = await snapshot()
+            await fold_new_props(s, declared, T0 + dt.timedelta(minutes=1))
+            again = await bins()
+        finally:
+            await s.rollback()
+
+    b10, b250 = (math.ceil(math.log(x) / DDSKETCH_LOG_GAMMA) for x in (10, 250))
+    assert partial == {b250: 1}
+    assert rebuilt == again == {b10: 2, b250: 1}
+    assert declared == {pid: (["ms"], ["ms"])}
+
+
+async def test_fold_range_bounds_are_absolute_times():
+    pid = uuid.uuid4()
+    async with SessionLocal() as s:
+        # created_at defaults to now() in the session's zone; bounds are timestamptz
+        await s.execute(text("SET LOCAL TIME ZONE 'Asia/Tokyo'"))
+        await s.execute(
+            text("INSERT INTO projects (id, name, api_key_id, api_key_hash) VALUES (:id, 'tz-test', :kid, '\\x00')"),
+            {"id": pid, "kid": f"tz-{pid.hex[:12]}"},
+        )
+        await s.execute(
+            text("INSERT INTO events (id, project_id, name, ts, props) VALUES (:id, :pid, 'tick', :ts, '{}')"),
+            {"id": uuid.uuid4(), "pid": pid, "ts": dt.datetime(2024, 5, 1, 10)},
+        )
+        now = (await s.execute(text("SELECT now()"))).scalar()
+        assert now.utcoffset() is not None
+        try:
+            await fold_range(s, now - dt.timedelta(hours=1), now - dt.timedelta(seconds=1))
+            before = (await s.execute(
+                text("SELECT count(*) FROM event_rollups WHERE project_id = :pid"), {"pid": pid}
+            )).scalar()
+            await fold_range(s, now - dt.timedelta(seconds=1), now + dt.timedelta(seconds=1))
+            after = (await s.execute(
+                text("SELECT count FROM event_rollups WHERE project_id = :pid AND granularity = 'day'"), {"pid": pid}
+            )).scalar()
+        finally:
+            await s.rollback()
+
+    assert before == 0 and after == 1